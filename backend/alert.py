@@ -1,31 +1,52 @@
 import os
 import pandas as pd
 import re
-from transformers import pipeline
+import numpy as np
+from asr_client import ASRClient
+from asr_inference import build_asr_pipeline
+from metrics import METRICS, timed
+from phase_io import read_table, table_columns, write_table
+from stress_trend import detect_stress_trends
+from speaker_roles import SPEAKER_ROLES_FILE, apply_speaker_roles, load_speaker_roles
 
 # --- Configuration ---
-FINAL_METADATA_FILE = "final_analytics_data.csv"
-FINAL_REPORT_FILE = "real_time_alert_report.csv"
+FINAL_METADATA_FILE = "final_analytics_data.parquet"
+FINAL_REPORT_FILE = "real_time_alert_report.parquet"  # real_time_alert_report.csv is written alongside
 
 # **IMPORTANT: Set this to the path of your best fine-tuned Whisper model**
 FINE_TUNED_MODEL_PATH = "whisper_finetuned_subset/final" 
+USE_ASR_SERVER = True  # prefer a warm asr_server.py over loading the model in-process
 
 # --- Alert Thresholds & Keyword Lists ---
 CRITICAL_KEYWORDS = r"\b(mayday|emergency|abort|fire|failure|engine out|bird strike)\b"
 SEVERE_STRESS_THRESHOLD = 85  # Stress score > 85
 ELEVATED_STRESS_THRESHOLD = 70  # Stress score > 70
 OFF_SCRIPT_PHRASES = ["say again", "what was that", "uhm", "err"] # Simple anomaly proxy
+SUSTAINED_STRESS_LEVEL = "Sustained Stress"  # raised from a speaker's stress trend (stress_trend.py)
+
+# Compiled once for the column-wise engine; phrases match as plain substrings, like `in`
+KEYWORD_MATCHER = re.compile(CRITICAL_KEYWORDS)
+OFF_SCRIPT_MATCHER = re.compile("|".join(re.escape(p) for p in OFF_SCRIPT_PHRASES))
+ROW_SEPARATOR = "\x00"  # joins transcripts for one matcher pass; never part of a pattern
 
 # --- 1. Load ASR Model for Real-Time Use ---
 def load_asr_pipeline(model_path):
-    """Loads the fine-tuned Whisper model into a Hugging Face ASR pipeline."""
+    """
+    Loads the fine-tuned Whisper model into a Hugging Face ASR pipeline, or
+    returns a client for asr_server.py when a warm server is running.
+    Without a GPU the pipeline runs batched on CPU with the int8-quantized model
+    (see asr_inference.ASR_QUANTIZE_INT8).
+    """
+    if USE_ASR_SERVER:
+        client = ASRClient()
+        if client.serves(model_path):
+            print(f"Using ASR server at {client.url} (model: {model_path})")
+            return client
+        if client.is_ready():
+            print(f"ASR server at {client.url} serves {client.status()['model']}, not {model_path}; loading locally.")
     try:
         print(f"Loading ASR pipeline from: {model_path}...")
-        asr_pipeline = pipeline(
-            "automatic-speech-recognition",
-            model=model_path,
-            device=0 if torch.cuda.is_available() else -1
-        )
+        asr_pipeline = build_asr_pipeline(model_path)
         return asr_pipeline
     except Exception as e:
         print(f"ERROR: Could not load ASR model. Ensure the path is correct and dependencies are installed. {e}")
@@ -68,29 +89,132 @@ def analyze_transcript_and_alert(row):
 
     return alert_level, "; ".join(alert_reason)
 
+# --- 3. Column-Wise Rule Engine ---
+def match_rows(matcher, texts, separator=ROW_SEPARATOR):
+    """
+    Boolean mask of texts (a sequence of str) containing a match. All
+    texts are joined and scanned in one pass; match positions are mapped back
+    to rows by their offsets.
+    """
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)) + len(separator)
+    row_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    positions = np.fromiter((m.start() for m in matcher.finditer(separator.join(texts))), dtype=np.int64)
+    mask = np.zeros(len(texts), dtype=bool)
+    mask[np.searchsorted(row_starts, positions, side='right') - 1] = True
+    return mask
+
+def append_reason(reasons, mask, text):
+    """Adds `text` (a string or one string per selected row) to the selected reasons."""
+    current = reasons[mask]
+    reasons[mask] = np.where(current == "", text, current + "; " + text)
+
+def evaluate_rules(keyword_hit, phrase_hit, is_atc, stress):
+    """Rules A-D over boolean/score arrays; returns (alert_level, alert_reason) arrays."""
+    severe = stress >= SEVERE_STRESS_THRESHOLD
+    elevated = ~severe & (stress >= ELEVATED_STRESS_THRESHOLD)
+    stress_text = np.full(len(stress), "", dtype=object)
+    stressed = severe | elevated
+    stress_text[stressed] = stress[stressed].astype(np.int64).astype(str)
+
+    levels = np.full(len(stress), "Routine", dtype=object)
+    reasons = np.full(len(stress), "", dtype=object)
+
+    # A. Keyword Detection
+    levels[keyword_hit] = "EMERGENCY"
+    append_reason(reasons, keyword_hit, "Critical Keyword Detected")
+
+    # B. Stress thresholds (elevated stress overrides a keyword EMERGENCY, as in the row-wise rules)
+    levels[severe] = "EMERGENCY"
+    append_reason(reasons, severe, "Severe Stress Spike (Score: " + stress_text[severe] + ")")
+    levels[elevated] = "Elevated Risk"
+    append_reason(reasons, elevated, "High Stress (Score: " + stress_text[elevated] + ")")
+
+    # C. Communication Anomaly/Hesitation
+    hesitation = phrase_hit & ~is_atc
+    levels[hesitation & (levels == "Routine")] = "Minor Anomaly"
+    append_reason(reasons, hesitation, "Potential Communication Hesitation/Anomaly")
+
+    # D. Role-Specific Check
+    atc_stress = is_atc & (stress >= ELEVATED_STRESS_THRESHOLD)
+    levels[atc_stress & (levels == "Routine")] = "Elevated Risk"
+    append_reason(reasons, atc_stress, "ATC Stress (May indicate external issue or high workload)")
+
+    return levels, reasons
+
+def apply_stress_trend(levels, reasons, sustained, trend_mean, trend_slope):
+    """
+    Rule E, on top of the per-segment rules: a speaker whose recent stress is
+    high on average or climbing raises Sustained Stress. Only Routine and
+    Minor Anomaly segments are upgraded; the reason is added either way.
+    """
+    upgrade = sustained & np.isin(levels, ["Routine", "Minor Anomaly"])
+    levels[upgrade] = SUSTAINED_STRESS_LEVEL
+    texts = np.array([f"Sustained Stress (Trend Mean: {m:.0f}, Slope: {s:+.1f}/segment)"
+                      for m, s in zip(trend_mean[sustained], trend_slope[sustained])], dtype=object)
+    append_reason(reasons, sustained, texts)
+    return levels, reasons
+
+def analyze_alerts(df):
+    """
+    Column-wise analyze_transcript_and_alert: returns (alert_level, alert_reason)
+    arrays with the same values. Keyword/phrase matching runs once per unique
+    transcript, and the rules run once per distinct combination of rule inputs
+    (match flags, role, and the integer score shown in the reason).
+    """
+    codes, unique_transcripts = pd.factorize(df['transcript'], use_na_sentinel=False)
+    unique_transcripts = [str(t).lower() for t in unique_transcripts.to_numpy(dtype=object)]
+    keyword_hit = match_rows(KEYWORD_MATCHER, unique_transcripts)[codes]
+    phrase_hit = match_rows(OFF_SCRIPT_MATCHER, unique_transcripts)[codes]
+    is_atc = (df['speaker_role'] == "ATC").to_numpy()
+    stress = df['stress_score'].to_numpy(dtype=np.float64)
+
+    # One integer per combination; below the elevated threshold the score never reaches the output
+    score_class = np.where(stress >= ELEVATED_STRESS_THRESHOLD, np.floor(stress) + 1, 0).astype(np.int64)
+    combos = score_class * 8 + keyword_hit + 2 * phrase_hit + 4 * is_atc
+    _, first, inverse = np.unique(combos, return_index=True, return_inverse=True)
+    levels, reasons = evaluate_rules(keyword_hit[first], phrase_hit[first], is_atc[first], stress[first])
+    return levels[inverse], reasons[inverse]
+
 # --- Main Execution ---
 if __name__ == '__main__':
     
-    # 1. Load Pre-Analyzed Data (from Phase 3)
+    # 1. Load Pre-Analyzed Data (from Phase 3): only the columns the rules and the report use
+    report_cols = ['segment_index', 'duration', 'file_path', 'speaker_role', 'stress_score', 'transcript']
     try:
-        df = pd.read_csv(FINAL_METADATA_FILE)
+        # Recording (also the key of the speaker roles) and start time order the stress trend per
+        # speaker, when the metadata has them
+        trend_cols = [c for c in ('source', 'start_sec') if c in table_columns(FINAL_METADATA_FILE)]
+        df = read_table(FINAL_METADATA_FILE, columns=report_cols + trend_cols)
     except FileNotFoundError:
         print(f"Error: {FINAL_METADATA_FILE} not found. Run Phase 3 scripts first.")
         exit()
 
+    # Diarized speaker ids (SPEAKER_NN) -> CAP/FO/ATC where a reviewer has mapped them; the
+    # role rules (no hesitation check for ATC, ATC Stress) only see mapped speakers as ATC
+    df['speaker_role'] = apply_speaker_roles(df, load_speaker_roles(SPEAKER_ROLES_FILE))
+    unmapped = df['speaker_role'].astype(str).str.startswith("SPEAKER_")
+    if unmapped.any():
+        print(f"{unmapped.sum()} segments are from speakers without a role in {SPEAKER_ROLES_FILE}; "
+              f"they are treated as unknown speakers by the role rules.")
+
     # NOTE: In a *true* real-time system, the ASR step would happen here 
     # using load_asr_pipeline() and transcribing the raw audio,
     # then running Phase 3 on the fly. 
     # For this report, we use the pre-transcribed/analyzed data for Phase 4.
+    # stream_alert.py runs that live path (ASR, stress and these rules) on streamed audio.
 
     print(f"Applying NLP rules and generating alerts for {len(df)} records...")
     
     # 2. Apply Analysis and Alerting
-    df[['alert_level', 'alert_reason']] = df.apply(
-        lambda row: analyze_transcript_and_alert(row), 
-        axis=1, 
-        result_type='expand'
-    )
+    with timed("rule_evaluation"):
+        levels, reasons = analyze_alerts(df)
+        df = df.join(detect_stress_trends(df))
+        df['alert_level'], df['alert_reason'] = apply_stress_trend(
+            levels, reasons, df['sustained_stress'].to_numpy(),
+            df['stress_trend_mean'].to_numpy(), df['stress_trend_slope'].to_numpy())
+    METRICS.inc("segments_evaluated", len(df))
+    for level, level_count in df['alert_level'].value_counts().items():
+        METRICS.inc(f"alerts_{level.lower().replace(' ', '_')}", int(level_count))
     
     # 3. Generate Final Report (Keep only relevant columns)
     final_cols = [
@@ -99,6 +223,8 @@ if __name__ == '__main__':
         'file_path',
         'speaker_role', 
         'stress_score', 
+        'stress_trend_mean',
+        'stress_trend_slope',
         'transcript', 
         'alert_level', 
         'alert_reason'
@@ -106,14 +232,15 @@ if __name__ == '__main__':
     df_report = df[final_cols]
     
     # 4. Save and Report Metrics
-    df_report.to_csv(FINAL_REPORT_FILE, index=False)
+    write_table(df_report, FINAL_REPORT_FILE)
 
     print("\n--- PHASE 4: Alert Generation Complete ---")
     print(f"Analysis saved to: {FINAL_REPORT_FILE}")
     print("\nSUMMARY OF CRITICAL ALERTS:")
     
-    critical_alerts = df_report[df_report['alert_level'].isin(["EMERGENCY", "Elevated Risk"])]
+    critical_alerts = df_report[df_report['alert_level'].isin(["EMERGENCY", "Elevated Risk", SUSTAINED_STRESS_LEVEL])]
     if not critical_alerts.empty:
         print(critical_alerts[['segment_index', 'speaker_role', 'stress_score', 'alert_level', 'alert_reason', 'transcript']].head(10))
     else:
-        print("No critical or elevated risk alerts were triggered in this sample.")
\ No newline at end of file
+        print("No critical or elevated risk alerts were triggered in this sample.")
+    METRICS.export("alert")
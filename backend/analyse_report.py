@@ -1,7 +1,8 @@
-import pandas as pd
+from phase_io import read_table
 
 # --- Configuration ---
-FINAL_REPORT_FILE = "real_time_alert_report.csv"
+FINAL_REPORT_FILE = "real_time_alert_report.parquet"
+REPORT_COLUMNS = ['alert_level', 'alert_reason']  # only these are read from the report
 
 # --- Metrics Calculation ---
 def calculate_metrics(df):
@@ -48,7 +49,7 @@ def calculate_metrics(df):
 # --- Script Execution ---
 if __name__ == '__main__':
     try:
-        df_report = pd.read_csv(FINAL_REPORT_FILE)
+        df_report = read_table(FINAL_REPORT_FILE, columns=REPORT_COLUMNS)
         calculate_metrics(df_report)
     except FileNotFoundError:
         print(f"ERROR: {FINAL_REPORT_FILE} not found. Ensure alert_system.py ran successfully.")
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import numpy as np
+from io import BytesIO
+from urllib import request, error
+
+# --- Configuration ---
+ASR_SERVER_URL = "http://127.0.0.1:8766"
+TARGET_SR = 16000
+REQUEST_TIMEOUT_SEC = 600  # a large batch on CPU can take minutes
+# transcribe() splits its arrays into requests of at most this many segments / body bytes,
+# so a large run stays under the server's MAX_REQUEST_BYTES and doesn't hold its model lock throughout
+REQUEST_BATCH_SIZE = 16
+REQUEST_MAX_BYTES = 64 * 1024 * 1024
+
+# --- Thin Client ---
+class ASRClient:
+    """
+    Client for asr_server.py. transcribe() sends a batch of float arrays and
+    returns their texts; calling the client like the Hugging Face pipeline
+    ({"raw": y, "sampling_rate": sr} -> {"text": ...}) lets scripts swap it in.
+    """
+
+    def __init__(self, url=ASR_SERVER_URL, timeout=REQUEST_TIMEOUT_SEC):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def status(self, endpoint="ready"):
+        """Body of /health or /ready as a dict, or None if the server is unreachable."""
+        try:
+            with request.urlopen(f"{self.url}/{endpoint}", timeout=5) as response:
+                return json.loads(response.read())
+        except error.HTTPError as e:
+            # /ready answers 503 with a JSON body while the model is loading
+            return json.loads(e.read() or b"{}")
+        except (error.URLError, OSError, ValueError):
+            return None
+
+    def is_ready(self):
+        status = self.status("ready")
+        return bool(status and status.get("ready"))
+
+    def serves(self, model_path):
+        """True if the server is ready with model_path loaded (paths compared normalized)."""
+        status = self.status("ready")
+        if not (status and status.get("ready")):
+            return False
+        return os.path.normcase(os.path.normpath(str(status.get("model")))) == \
+            os.path.normcase(os.path.normpath(model_path))
+
+    def wait_until_ready(self, timeout_sec=300, poll_sec=1.0):
+        deadline = time.monotonic() + timeout_sec
+        while time.monotonic() < deadline:
+            if self.is_ready():
+                return True
+            time.sleep(poll_sec)
+        return False
+
+    def transcribe(self, arrays, sr=TARGET_SR, batch_size=REQUEST_BATCH_SIZE, max_bytes=REQUEST_MAX_BYTES):
+        """
+        Transcribes mono float arrays at TARGET_SR; texts come back in order.
+        Arrays are sent in requests of up to batch_size segments and max_bytes
+        of audio (a single longer segment still goes on its own).
+        """
+        if sr != TARGET_SR:
+            raise ValueError(f"ASR server expects {TARGET_SR} Hz audio, got {sr} Hz")
+        arrays = [np.asarray(y, dtype=np.float32) for y in arrays]
+        texts, batch, batch_bytes = [], [], 0
+        for y in arrays:
+            if batch and (len(batch) >= batch_size or batch_bytes + y.nbytes > max_bytes):
+                texts.extend(self._transcribe_request(batch, sr))
+                batch, batch_bytes = [], 0
+            batch.append(y)
+            batch_bytes += y.nbytes
+        if batch:
+            texts.extend(self._transcribe_request(batch, sr))
+        return texts
+
+    def _transcribe_request(self, arrays, sr):
+        buf = BytesIO()
+        np.savez(buf, *arrays)
+        req = request.Request(
+            f"{self.url}/transcribe",
+            data=buf.getvalue(),
+            headers={"Content-Type": "application/octet-stream", "X-Sample-Rate": str(sr)},
+            method="POST",
+        )
+        try:
+            with request.urlopen(req, timeout=self.timeout) as response:
+                return json.loads(response.read())["texts"]
+        except error.HTTPError as e:
+            raise RuntimeError(f"ASR server error {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+
+    def __call__(self, inputs):
+        if isinstance(inputs, list):
+            texts = self.transcribe([x["raw"] for x in inputs], inputs[0]["sampling_rate"] if inputs else TARGET_SR)
+            return [{"text": text} for text in texts]
+        return {"text": self.transcribe([inputs["raw"]], inputs["sampling_rate"])[0]}
@@ -0,0 +1,108 @@
+import os
+import time
+import numpy as np
+import torch
+import jiwer
+from transformers import WhisperProcessor, WhisperForConditionalGeneration, pipeline
+from metrics import METRICS, timed
+
+# --- Configuration ---
+TARGET_SR = 16000
+ASR_BATCH_SIZE = 8  # segments per generate() call on CPU
+ASR_QUANTIZE_INT8 = True  # int8 dynamic quantization of Linear layers when running on CPU
+ASR_NUM_THREADS = os.cpu_count() or 1
+ASR_LANGUAGE = "en"
+
+# --- Model Loading ---
+def quantize_int8(model):
+    """
+    Dynamic int8 quantization: Linear weights are stored as int8 and activations
+    are quantized on the fly. CPU only; the model keeps its class and generate().
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_whisper(model_path, quantize=ASR_QUANTIZE_INT8):
+    """Loads the fine-tuned checkpoint for CPU inference, optionally int8-quantized."""
+    torch.set_num_threads(ASR_NUM_THREADS)
+    processor = WhisperProcessor.from_pretrained(model_path)
+    model = WhisperForConditionalGeneration.from_pretrained(model_path).eval()
+    if quantize:
+        model = quantize_int8(model)
+    return model, processor
+
+def build_asr_pipeline(model_path, quantize=ASR_QUANTIZE_INT8, batch_size=ASR_BATCH_SIZE):
+    """
+    Hugging Face ASR pipeline: on GPU as before, on CPU with the (optionally
+    quantized) model and batched calls.
+    """
+    if torch.cuda.is_available():
+        return pipeline("automatic-speech-recognition", model=model_path, device=0)
+    model, processor = load_whisper(model_path, quantize=quantize)
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        batch_size=batch_size,
+        device=-1,
+    )
+
+# --- Batched Transcription ---
+def length_sorted_batches(lengths, batch_size):
+    """
+    Index batches ordered by length, longest first. Whisper pads every input to
+    30s, so similar lengths mostly save decoder steps: segments in a batch tend to
+    produce transcripts of similar length and generate() stops together.
+    """
+    order = np.argsort(lengths)[::-1]
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def transcribe_arrays(model, processor, arrays, sr=TARGET_SR, batch_size=ASR_BATCH_SIZE):
+    """Transcribes float arrays in length-sorted batches; results come back in input order."""
+    texts = [""] * len(arrays)
+    for batch in length_sorted_batches([len(y) for y in arrays], batch_size):
+        with timed("asr_features"):
+            inputs = processor([arrays[i] for i in batch], sampling_rate=sr, return_tensors="pt")
+        with timed("asr"), torch.inference_mode():
+            token_ids = model.generate(inputs.input_features, language=ASR_LANGUAGE, task="transcribe")
+        METRICS.inc("asr_segments", len(batch))
+        for i, text in zip(batch, processor.batch_decode(token_ids, skip_special_tokens=True)):
+            texts[i] = text.strip()
+    return texts
+
+def benchmark_transcription(transcribe, arrays, sr=TARGET_SR):
+    """
+    Runs transcribe(arrays) (a local model or an ASRClient) and returns (texts, stats):
+    wall time, real-time factor (processing time / audio time; below 1 is faster
+    than real time) and segments/sec.
+    """
+    audio_sec = sum(len(y) for y in arrays) / sr
+    start = time.perf_counter()
+    texts = transcribe(arrays)
+    wall_sec = time.perf_counter() - start
+    stats = {
+        "segments": len(arrays),
+        "audio_sec": audio_sec,
+        "wall_sec": wall_sec,
+        "rtf": wall_sec / audio_sec if audio_sec else 0.0,
+        "segments_per_sec": len(arrays) / wall_sec if wall_sec else 0.0,
+    }
+    return texts, stats
+
+def print_benchmark(label, stats):
+    print(f"{label:>10}: {stats['segments']} segments, {stats['audio_sec']:.1f}s audio in {stats['wall_sec']:.1f}s "
+          f"| RTF {stats['rtf']:.3f} | {stats['segments_per_sec']:.2f} segments/sec")
+
+def quantization_accuracy_impact(reference_texts, quantized_texts, ground_truth=None):
+    """
+    WER of the int8 transcripts against the full-precision ones (how much
+    quantization changes the output), plus WER of each against ground truth if given.
+    """
+    def normalize(texts):
+        return [t.lower().strip() or "<empty>" for t in texts]
+
+    impact = {"wer_int8_vs_fp32": jiwer.wer(normalize(reference_texts), normalize(quantized_texts))}
+    if ground_truth:
+        impact["wer_fp32"] = jiwer.wer(normalize(ground_truth), normalize(reference_texts))
+        impact["wer_int8"] = jiwer.wer(normalize(ground_truth), normalize(quantized_texts))
+    return impact
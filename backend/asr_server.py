@@ -0,0 +1,146 @@
+import json
+import time
+import threading
+import numpy as np
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from asr_inference import ASR_QUANTIZE_INT8, TARGET_SR, load_whisper, transcribe_arrays
+from metrics import METRICS
+
+# --- Configuration ---
+ASR_MODEL_PATH = "whisper_finetuned_subset/final"
+ASR_SERVER_HOST = "127.0.0.1"  # local only; there is no authentication
+ASR_SERVER_PORT = 8766
+MAX_REQUEST_BYTES = 256 * 1024 * 1024
+
+# --- Model Holder ---
+class WarmModel:
+    """
+    Loads the model once in the background and serializes transcription on it.
+    It counts as ready only after a warm-up transcription, so the first real
+    request doesn't pay the one-off initialization cost.
+    """
+
+    def __init__(self, model_path, quantize=ASR_QUANTIZE_INT8):
+        self.model_path = model_path
+        self.quantize = quantize
+        self.model = None
+        self.processor = None
+        self.error = None
+        self.loaded_at = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "segments": 0, "audio_sec": 0.0, "busy_sec": 0.0}
+
+    def load(self):
+        try:
+            start = time.perf_counter()
+            self.model, self.processor = load_whisper(self.model_path, quantize=self.quantize)
+            transcribe_arrays(self.model, self.processor, [np.zeros(TARGET_SR, dtype=np.float32)])
+            self.loaded_at = time.time()
+            self.ready.set()
+            print(f"Model {self.model_path} warm after {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            self.error = str(e)
+            print(f"ERROR: Could not load ASR model {self.model_path}: {e}")
+
+    def transcribe(self, arrays, sr):
+        with self.lock:
+            start = time.perf_counter()
+            texts = transcribe_arrays(self.model, self.processor, arrays, sr)
+            self.stats["requests"] += 1
+            self.stats["segments"] += len(arrays)
+            self.stats["audio_sec"] += sum(len(y) for y in arrays) / sr
+            self.stats["busy_sec"] += time.perf_counter() - start
+        return texts
+
+    def status(self):
+        return {
+            "ready": self.ready.is_set(),
+            "model": self.model_path,
+            "quantized": self.quantize,
+            "error": self.error,
+            "loaded_at": self.loaded_at,
+            **self.stats,
+        }
+
+# --- HTTP Handler ---
+class ASRRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health: the process is up. GET /ready: 200 once the model is warm,
+    503 while loading (or if loading failed). GET /metrics: stage latency
+    histograms in Prometheus text format. POST /transcribe: an .npz body of
+    float32 arrays (X-Sample-Rate header) -> {"texts": [...]}.
+    """
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        warm_model = self.server.warm_model
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/ready":
+            self._send_json(200 if warm_model.ready.is_set() else 503, warm_model.status())
+        elif self.path == "/metrics":
+            body = METRICS.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        warm_model = self.server.warm_model
+        if self.path != "/transcribe":
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        if not warm_model.ready.is_set():
+            self._send_json(503, {"error": "model is not ready"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > MAX_REQUEST_BYTES:
+            self._send_json(400, {"error": f"request body must be 1..{MAX_REQUEST_BYTES} bytes"})
+            return
+        sr = int(self.headers.get("X-Sample-Rate", TARGET_SR))
+        if sr != TARGET_SR:
+            self._send_json(400, {"error": f"audio must be {TARGET_SR} Hz, got {sr} Hz"})
+            return
+        try:
+            with np.load(BytesIO(self.rfile.read(length)), allow_pickle=False) as data:
+                arrays = [data[f"arr_{i}"].astype(np.float32) for i in range(len(data.files))]
+        except Exception as e:
+            self._send_json(400, {"error": f"could not decode audio batch: {e}"})
+            return
+        try:
+            self._send_json(200, {"texts": warm_model.transcribe(arrays, sr)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        # Health/readiness probes are frequent; only transcription requests are logged
+        if self.path == "/transcribe":
+            super().log_message(format, *args)
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    warm_model = WarmModel(ASR_MODEL_PATH)
+    server = ThreadingHTTPServer((ASR_SERVER_HOST, ASR_SERVER_PORT), ASRRequestHandler)
+    server.warm_model = warm_model
+    # Serve /health immediately; /ready flips once the model is loaded and warmed up
+    threading.Thread(target=warm_model.load, daemon=True).start()
+    print(f"ASR server listening on http://{ASR_SERVER_HOST}:{ASR_SERVER_PORT} (model: {ASR_MODEL_PATH})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nASR server stopped.")
+    finally:
+        server.server_close()
+        METRICS.export("asr_server")
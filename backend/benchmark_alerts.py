@@ -0,0 +1,59 @@
+import time
+import numpy as np
+import pandas as pd
+
+import alert
+
+# --- Configuration ---
+NUM_ROWS = 1_000_000
+ROWWISE_SAMPLE_ROWS = 20_000  # df.apply is timed on a sample and extrapolated
+
+TRANSCRIPT_POOL = [
+    "cleared for takeoff runway two seven",
+    "say again altitude",
+    "mayday mayday engine out",
+    "roger descend and maintain flight level one two zero",
+    "uhm standby",
+    "bird strike on departure returning to field",
+    "contact departure one two four decimal five",
+    "what was that tower",
+    "terrain alert pull up",
+    "traffic in sight",
+]
+
+# --- Synthetic Report ---
+def make_report(num_rows=NUM_ROWS):
+    """Random mix of transcripts, roles and stress scores shaped like final_analytics_data.csv."""
+    rng = np.random.default_rng(seed=0)
+    transcripts = np.array(TRANSCRIPT_POOL, dtype=object)[rng.integers(0, len(TRANSCRIPT_POOL), num_rows)]
+    # Some unique transcripts too, so the matcher isn't only scanning a handful of strings
+    unique = rng.random(num_rows) < 0.2
+    transcripts[unique] = [f"{t} callsign {i}" for i, t in zip(np.flatnonzero(unique), transcripts[unique])]
+    return pd.DataFrame({
+        'segment_index': np.arange(num_rows),
+        'transcript': transcripts,
+        'speaker_role': rng.choice(["Pilot", "ATC", "Unknown"], num_rows),
+        'stress_score': rng.uniform(0, 100, num_rows),
+    })
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    df = make_report()
+    sample = df.head(ROWWISE_SAMPLE_ROWS)
+
+    start = time.perf_counter()
+    expected = sample.apply(lambda row: alert.analyze_transcript_and_alert(row), axis=1, result_type='expand')
+    rowwise_per_row = (time.perf_counter() - start) / len(sample)
+
+    levels, reasons = alert.analyze_alerts(sample)
+    matches = (expected[0].to_numpy() == levels).all() and (expected[1].to_numpy() == reasons).all()
+    print(f"Column-wise output matches df.apply on {len(sample)} rows: {matches}")
+
+    start = time.perf_counter()
+    alert.analyze_alerts(df)
+    vectorized = time.perf_counter() - start
+
+    rowwise = rowwise_per_row * len(df)
+    print(f"df.apply (extrapolated): {rowwise:.1f}s for {len(df)} rows ({len(df) / rowwise:,.0f} rows/sec)")
+    print(f"Column-wise engine:      {vectorized:.2f}s for {len(df)} rows ({len(df) / vectorized:,.0f} rows/sec)")
+    print(f"Speedup: {rowwise / vectorized:.0f}x")
@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+import jiwer
+
+from asr_inference import ASR_BATCH_SIZE, ASR_LANGUAGE, load_whisper
+from preprocess_dataset import load_cached_dataset
+from train_whisper import OUTPUT_DIR, TRAIN_SUBSET_SIZE, data_collator
+
+# --- Configuration ---
+# Two caches of the same CSV written by preprocess_dataset.py: one with FEATURE_STORAGE = "arrow"
+# (float32 features with their padding, as cached before the mel store) and one with the
+# default float16 trimmed mel store
+ARROW_CACHE_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_cached_arrow"
+STORE_CACHE_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_cached"
+# The "after" model defaults to the same checkpoint, which measures the feature difference
+# alone; point it at a checkpoint trained from the mel store to include the training side
+BEFORE_MODEL_PATH = OUTPUT_DIR
+AFTER_MODEL_PATH = OUTPUT_DIR
+HELD_OUT_START = TRAIN_SUBSET_SIZE  # train_whisper.py trains on the rows before this
+HELD_OUT_SIZE = 200
+
+# --- Decoding ---
+def normalize(texts):
+    return [t.lower().strip() or "<empty>" for t in texts]
+
+def transcribe_cached(model, processor, dataset, indices, batch_size=ASR_BATCH_SIZE):
+    """
+    Greedy transcripts and reference texts of cached rows. Features go through
+    train_whisper's data_collator, so the model sees exactly what training does.
+    """
+    hypotheses, references = [], []
+    for start in range(0, len(indices), batch_size):
+        items = [dataset[int(i)] for i in indices[start:start + batch_size]]
+        batch = data_collator(items)
+        with torch.inference_mode():
+            token_ids = model.generate(batch["input_features"], language=ASR_LANGUAGE, task="transcribe")
+        hypotheses.extend(processor.batch_decode(token_ids, skip_special_tokens=True))
+        label_ids = [np.asarray(item["labels"]).tolist() for item in items]
+        references.extend(processor.tokenizer.batch_decode(label_ids, skip_special_tokens=True))
+    return normalize(hypotheses), normalize(references)
+
+def storage_wer(model_path, dataset, indices):
+    model, processor = load_whisper(model_path, quantize=False)
+    hypotheses, references = transcribe_cached(model, processor, dataset, indices)
+    return jiwer.wer(references, hypotheses), hypotheses, references
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    arrow = load_cached_dataset(ARROW_CACHE_DIR).with_format("numpy")
+    store = load_cached_dataset(STORE_CACHE_DIR)
+    if len(arrow) != len(store):
+        print(f"❌ The caches hold {len(arrow)} and {len(store)} rows; build both from the same CSV.")
+        exit()
+    indices = np.arange(HELD_OUT_START, min(HELD_OUT_START + HELD_OUT_SIZE, len(store)))
+    if not len(indices):
+        print(f"❌ No held-out rows: the caches have {len(store)} rows and training uses the first {HELD_OUT_START}.")
+        exit()
+
+    print(f"Decoding {len(indices)} held-out rows ({indices[0]}-{indices[-1]})...")
+    before, before_texts, references = storage_wer(BEFORE_MODEL_PATH, arrow, indices)
+    after, after_texts, store_references = storage_wer(AFTER_MODEL_PATH, store, indices)
+    if store_references != references:
+        print("⚠️ The caches' label ids differ; they were not built from the same CSV and tokenizer.")
+
+    changed = sum(b != a for b, a in zip(before_texts, after_texts))
+    print(f"WER float32 Arrow cache:  {before:.4f} ({BEFORE_MODEL_PATH})")
+    print(f"WER float16 mel store:    {after:.4f} ({AFTER_MODEL_PATH})")
+    print(f"Change: {after - before:+.4f} | {changed} of {len(indices)} transcripts differ")
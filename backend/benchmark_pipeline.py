@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import queue
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+import pandas as pd
+import soundfile as sf
+from io import BytesIO
+from phase_io import read_table, write_table
+
+# --- Configuration ---
+BENCH_HOURS = 0.5  # hours of synthetic audio per run
+BENCH_SEED = 7  # fixed so runs on different commits see identical input
+BENCH_DIR = "./bench_run"
+BENCH_RESULTS_FILE = "benchmark_results.jsonl"  # one JSON record per run, appended
+REGRESSION_TOLERANCE = 0.15  # flag stages more than 15% slower than the previous comparable run
+
+TARGET_SR = 16000
+CLIP_LENGTH_SEC = 60  # one Parquet row per clip, like the source shards
+SNR_LEVELS_DB = [20, 10, 5, 0]  # cycled over clips; recorded in the ground-truth file
+SPEAKER_F0_HZ = {"CAP": 110, "FO": 140, "ATC": 200}  # fundamental per synthetic voice
+
+PHRASES = [
+    "cleared for takeoff runway two seven",
+    "climb and maintain flight level one two zero",
+    "say again altitude",
+    "hold short runway three one",
+    "roger copy that",
+    "contact departure one two four decimal five",
+    "uhm standby",
+    "mayday mayday engine out",
+    "fire warning left engine",
+    "traffic in sight",
+]
+
+STAGES = ["segmentation", "noise_reduction", "metadata", "diarization", "emotion_detection", "alerting"]
+
+# --- Synthetic Cockpit Audio ---
+def synth_voice(rng, num_samples, f0, sr=TARGET_SR):
+    """Harmonic 'speech': a wandering pitch contour under ~4 Hz syllable bursts."""
+    t = np.arange(num_samples) / sr
+    contour = f0 * (1 + 0.06 * np.sin(2 * np.pi * rng.uniform(0.3, 0.8) * t)
+                    + 0.01 * rng.standard_normal(num_samples).cumsum() / np.sqrt(sr))
+    phase = 2 * np.pi * np.cumsum(contour) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 9))
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t + rng.uniform(0, np.pi)), 0, None) ** 2
+    return (voice * syllables).astype(np.float32)
+
+def synth_cockpit_noise(rng, num_samples, sr=TARGET_SR):
+    """Engine hum harmonics, low-frequency rumble and broadband hiss."""
+    t = np.arange(num_samples) / sr
+    hum = sum(np.sin(2 * np.pi * 96 * k * t + rng.uniform(0, 2 * np.pi)) / k for k in range(1, 6))
+    rumble = np.cumsum(rng.standard_normal(num_samples))
+    rumble -= np.convolve(rumble, np.ones(801) / 801, mode='same')  # keep it zero-mean
+    rumble /= np.abs(rumble).max() + 1e-9
+    hiss = 0.3 * rng.standard_normal(num_samples)
+    return (0.5 * hum + rumble + hiss).astype(np.float32)
+
+def make_cockpit_clip(rng, clip_sec, snr_db, sr=TARGET_SR, speakers=None):
+    """
+    Alternating speaker turns with pauses, mixed with cockpit noise at snr_db
+    (noise RMS relative to the speech RMS, the same rule as the augmentation stage).
+    `speakers` picks the voices (keys of SPEAKER_F0_HZ); all of them by default.
+    Returns (float32 audio, [(speaker, start_sec, end_sec), ...]).
+    """
+    num_samples = clip_sec * sr
+    speech = np.zeros(num_samples, dtype=np.float32)
+    turns, position = [], int(rng.uniform(0.2, 1.0) * sr)
+    speakers = list(speakers or SPEAKER_F0_HZ)
+    while position < num_samples:
+        speaker = speakers[len(turns) % len(speakers)] if rng.random() < 0.8 else rng.choice(speakers)
+        length = min(int(rng.uniform(2, 6) * sr), num_samples - position)
+        speech[position:position + length] = synth_voice(rng, length, SPEAKER_F0_HZ[speaker], sr)
+        turns.append((speaker, position / sr, (position + length) / sr))
+        position += length + int(rng.uniform(0.3, 1.5) * sr)
+
+    noise = synth_cockpit_noise(rng, num_samples, sr)
+    speech_rms = np.sqrt(np.mean(np.square(speech, dtype=np.float64)))
+    noise_rms = np.sqrt(np.mean(np.square(noise, dtype=np.float64)))
+    mix = speech + noise * (speech_rms / noise_rms) / (10 ** (snr_db / 20))
+    return (0.5 * mix / np.abs(mix).max()).astype(np.float32), turns
+
+def generate_dataset(bench_dir, hours=BENCH_HOURS, seed=BENCH_SEED):
+    """
+    Writes the synthetic shard (audio.parquet), a transcript file in the
+    [Entry N]: format create_metadata expects, and ground_truth.csv with each
+    clip's SNR and speaker turns. Returns the number of clips.
+    """
+    rng = np.random.default_rng(seed)
+    num_clips = max(1, int(round(hours * 3600 / CLIP_LENGTH_SEC)))
+    rows, truth = [], []
+    for clip in range(num_clips):
+        snr_db = SNR_LEVELS_DB[clip % len(SNR_LEVELS_DB)]
+        y, turns = make_cockpit_clip(rng, CLIP_LENGTH_SEC, snr_db)
+        buf = BytesIO()
+        sf.write(buf, y, TARGET_SR, format='WAV', subtype='PCM_16')
+        rows.append({'audio': {'bytes': buf.getvalue(), 'path': f"clip_{clip}.wav"}})
+        truth.extend({'clip': clip, 'snr_db': snr_db, 'speaker': s, 'start_sec': a, 'end_sec': b}
+                     for s, a, b in turns)
+    pd.DataFrame(rows).to_parquet(os.path.join(bench_dir, "audio.parquet"))
+    pd.DataFrame(truth).to_csv(os.path.join(bench_dir, "ground_truth.csv"), index=False)
+
+    segments_per_clip = int(np.ceil(CLIP_LENGTH_SEC / 10))
+    with open(os.path.join(bench_dir, "transcripts.txt"), 'w', encoding='utf-8') as f:
+        for i in range(num_clips * segments_per_clip):
+            f.write(f"[Entry {i + 1}]: {PHRASES[rng.integers(len(PHRASES))]}\n")
+    return num_clips
+
+# --- Stages (each runs in its own process) ---
+def run_segmentation():
+    import preprocessing
+    preprocessing.DATA_PATH = "audio.parquet"
+    preprocessing.PROCESSED_PATH, preprocessing.PROCESSED_STORE = "processed_audio", "processed_store"
+    # Segmentation creates these directories too; the defaults are Windows-style relative paths
+    preprocessing.NR_PATH, preprocessing.AUGMENTED_PATH = "nr_audio", "augmented_audio"
+    preprocessing.SEGMENT_SPANS_FILE = "segment_spans.csv"
+    return len(preprocessing.segment_and_normalize_from_parquet(cache=None))
+
+def run_noise_reduction():
+    import preprocessing
+    preprocessing.NR_PATH = "nr_audio"
+    if preprocessing.SEGMENT_FORMAT == "store":
+        return len(preprocessing.reduce_noise_store("processed_store", "nr_store"))
+    return len(preprocessing.apply_classical_noise_reduction("processed_audio", "nr_audio", resume=False))
+
+def run_metadata():
+    import create_metadata
+    create_metadata.NR_PATH, create_metadata.SEGMENT_STORE_PATH = "processed_audio", "processed_store"
+    create_metadata.RAW_ENTRIES_FILE = "transcripts.txt"
+    create_metadata.SEGMENT_SPANS_FILE = "segment_spans.csv"
+    create_metadata.TARGET_METADATA_FILE = "asr_data.parquet"
+    create_metadata.create_asr_metadata()
+    return len(read_table("asr_data.parquet", columns=["segment_index"]))
+
+def run_diarization():
+    # Transcripts from the generator stand in for ASR output (ASR is benchmarked by run_inference.py)
+    import speaker_diarization
+    df = read_table("asr_data.parquet")
+    speaker_diarization.SEGMENT_STORE_PATH = "processed_store"
+    df = df.join(speaker_diarization.diarize_segments(df))
+    write_table(df, "diarized_asr_data.parquet")
+    return len(df)
+
+def run_emotion_detection():
+    import emotion_detection
+    from stress_normalizer import OnlineStressNormalizer
+    df = read_table("diarized_asr_data.parquet")
+    store_path = "processed_store" if os.path.exists("processed_store") else None
+    sources = df['segment_index'].tolist() if store_path else df['file_path'].tolist()
+    df['features'] = emotion_detection.extract_features_for_rows(sources, store_path=store_path)
+    df['stress_score'] = emotion_detection.predict_stress_online(df, OnlineStressNormalizer())
+    write_table(df.drop(columns=['features']), "final_analytics_data.parquet")
+    return len(df)
+
+def run_alerting():
+    import alert
+    df = read_table("final_analytics_data.parquet")
+    df['alert_level'], df['alert_reason'] = alert.analyze_alerts(df)
+    write_table(df, "real_time_alert_report.parquet")
+    return len(df)
+
+STAGE_FUNCTIONS = {
+    "segmentation": run_segmentation,
+    "noise_reduction": run_noise_reduction,
+    "metadata": run_metadata,
+    "diarization": run_diarization,
+    "emotion_detection": run_emotion_detection,
+    "alerting": run_alerting,
+}
+
+# --- Measurement ---
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children (pool workers), in MB."""
+    try:
+        import resource
+        scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024  # bytes on macOS, KB on Linux
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+    except ImportError:
+        try:
+            import psutil  # Windows: peak working set
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except Exception:
+            return None
+
+def _stage_process(stage, bench_dir, backend_dir, results):
+    sys.path.insert(0, backend_dir)
+    os.chdir(bench_dir)
+    start = time.perf_counter()
+    try:
+        segments = STAGE_FUNCTIONS[stage]()
+        error = None
+    except Exception as e:
+        segments, error = 0, f"{type(e).__name__}: {e}"
+    wall_sec = time.perf_counter() - start
+    from metrics import METRICS
+    results.put({
+        "stage": stage,
+        "wall_sec": wall_sec,
+        "segments": segments,
+        "segments_per_sec": segments / wall_sec if wall_sec and segments else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "error": error,
+        "stage_metrics": METRICS.summary(),
+    })
+
+def run_stage(stage, bench_dir):
+    """Runs one stage in a fresh process, so its peak RSS and imports are its own."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_stage_process,
+                              args=(stage, os.path.abspath(bench_dir),
+                                    os.path.dirname(os.path.abspath(__file__)), results))
+    process.start()
+    while True:
+        try:
+            record = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                record = {"stage": stage, "wall_sec": 0.0, "segments": 0, "segments_per_sec": 0.0,
+                          "peak_rss_mb": None, "error": f"process exited with code {process.exitcode}",
+                          "stage_metrics": None}
+                break
+    process.join()
+    return record
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def previous_run(results_file, config):
+    """Last recorded run with the same input config, or None."""
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("config") == config:
+                previous = record
+    return previous
+
+def compare_runs(current, previous):
+    """Prints throughput change per stage; returns the stages that regressed."""
+    regressions = []
+    baseline = {s["stage"]: s for s in previous["stages"]}
+    print(f"\nCompared with {previous['commit']} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(previous['timestamp']))}):")
+    for stage in current["stages"]:
+        before = baseline.get(stage["stage"])
+        if not before or not before["segments_per_sec"] or not stage["segments_per_sec"]:
+            continue
+        change = stage["segments_per_sec"] / before["segments_per_sec"] - 1
+        flag = ""
+        if change < -REGRESSION_TOLERANCE:
+            flag = "  <-- REGRESSION"
+            regressions.append(stage["stage"])
+        print(f"{stage['stage']:>18}: {before['segments_per_sec']:9.1f} -> {stage['segments_per_sec']:9.1f} "
+              f"segments/sec ({change:+.0%}){flag}")
+    return regressions
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    config = {"hours": BENCH_HOURS, "seed": BENCH_SEED, "clip_sec": CLIP_LENGTH_SEC, "snr_db": SNR_LEVELS_DB}
+
+    print(f"Generating {BENCH_HOURS}h of synthetic cockpit audio in {BENCH_DIR}...")
+    num_clips = generate_dataset(BENCH_DIR)
+    print(f"{num_clips} clips x {CLIP_LENGTH_SEC}s, SNR levels {SNR_LEVELS_DB} dB.")
+
+    run = {"commit": git_commit(), "timestamp": time.time(), "config": config,
+           "host": {"platform": platform.platform(), "cpus": os.cpu_count()}, "stages": []}
+    for stage in STAGES:
+        print(f"\n--- Stage: {stage} ---")
+        record = run_stage(stage, BENCH_DIR)
+        run["stages"].append(record)
+        if record["error"]:
+            print(f"Stage {stage} failed: {record['error']}. Stopping.")
+            break
+
+    print("\n--- Benchmark Results ---")
+    for s in run["stages"]:
+        rss = f"{s['peak_rss_mb']:.0f} MB" if s['peak_rss_mb'] is not None else "n/a"
+        print(f"{s['stage']:>18}: {s['wall_sec']:8.2f}s  {s['segments']:>6} segments  "
+              f"{s['segments_per_sec']:9.1f} segments/sec  peak RSS {rss}")
+
+    previous = previous_run(BENCH_RESULTS_FILE, config)
+    with open(BENCH_RESULTS_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"\nResults appended to {BENCH_RESULTS_FILE}")
+    if previous is not None:
+        regressions = compare_runs(run, previous)
+        if regressions:
+            print(f"Throughput regressions: {', '.join(regressions)}")
@@ -0,0 +1,68 @@
+import os
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+from io import BytesIO
+
+import preprocessing
+
+# --- Configuration ---
+NUM_CLIPS = 20
+CLIP_LENGTH_SEC = 60  # 6 segments per clip at SEGMENT_LENGTH_SEC = 10
+SOURCE_SR = 16000
+
+# --- Synthetic Input ---
+def make_audio_dicts(kind, num_clips=NUM_CLIPS, clip_length_sec=CLIP_LENGTH_SEC):
+    """
+    Builds Parquet-style audio dicts: kind="bytes" holds 16-bit WAV clips,
+    kind="array" holds decoded float arrays.
+    """
+    rng = np.random.default_rng(seed=0)
+    audio_dicts = []
+    for _ in range(num_clips):
+        y = np.clip(0.3 * rng.standard_normal(SOURCE_SR * clip_length_sec), -1, 1).astype(np.float32)
+        if kind == "array":
+            audio_dicts.append({'array': y, 'sample_rate': SOURCE_SR})
+        else:
+            buf = BytesIO()
+            sf.write(buf, y, SOURCE_SR, format='WAV', subtype='PCM_16')
+            audio_dicts.append({'bytes': buf.getvalue()})
+    return audio_dicts
+
+# --- Engines Under Test ---
+def run_pydub(audio_dicts):
+    count = 0
+    segment_length_ms = preprocessing.SEGMENT_LENGTH_SEC * 1000
+    for idx, audio_dict in enumerate(audio_dicts):
+        audio = preprocessing.dict_to_audioment(audio_dict).normalize()
+        for i, start_ms in enumerate(range(0, len(audio), segment_length_ms)):
+            segment = audio[start_ms:start_ms + segment_length_ms]
+            segment.export(os.path.join(preprocessing.PROCESSED_PATH, f"audio_{idx}_seg_{i}.wav"), format="wav")
+            count += 1
+    return count
+
+def run_numpy(audio_dicts):
+    count = 0
+    for idx, audio_dict in enumerate(audio_dicts):
+        y, sr = preprocessing.dict_to_array(audio_dict)
+        count += len(preprocessing.export_array_segments(f"audio_{idx}", y, sr))
+    return count
+
+def time_engine(name, fn, audio_dicts):
+    start = time.perf_counter()
+    count = fn(audio_dicts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>6}: {count} segments in {elapsed:.2f}s ({count / elapsed:.1f} segments/sec)")
+    return count / elapsed
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    for kind in ["bytes", "array"]:
+        audio_dicts = make_audio_dicts(kind)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            preprocessing.PROCESSED_PATH = tmp_dir
+            print(f"\nSegmenting {NUM_CLIPS} x {CLIP_LENGTH_SEC}s clips ({kind} input)...")
+            before = time_engine("pydub", run_pydub, audio_dicts)
+            after = time_engine("numpy", run_numpy, audio_dicts)
+        print(f"Speedup: {after / before:.1f}x")
@@ -1,17 +1,29 @@
+import os
+import json
+import time
+import hashlib
+from io import BytesIO
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # snapshots are written to PNG; no display needed on servers
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.metrics import (
-    confusion_matrix, 
-    precision_score, 
-    recall_score, 
-    f1_score, 
-    classification_report
-)
+from manual_review_tool import LABELS_LOG_FILE
 
 # --- Configuration ---
-GROUND_TRUTH_FILE = r"C:\Users\tssmi\OneDrive\Desktop\nlp\manual_review_ground_truth_labeled.csv"
+# Labels come from manual_review_tool.py's append-only log, so a sync parses only the lines
+# added since the last one. A labeled CSV edited in place (e.g. manual_review_ground_truth_labeled.csv)
+# can be used too, but each save rewrites it and it is then re-diffed in full.
+GROUND_TRUTH_FILE = LABELS_LOG_FILE
+EVAL_STATE_FILE = "./evaluation_state.json"  # confusion matrix and the rows already counted
+EVAL_SNAPSHOT_DIR = "./evaluation"  # confusion_matrix.png and metrics.json
+ROW_KEY_COLUMN = "file_path"  # identifies a labeled row across re-reads of the CSV
+WATCH_LABELS_FILE = False  # keep running and pick up new labels as reviewers save the CSV
+WATCH_POLL_SEC = 30
+MIN_LABELED_SAMPLES = 10
+ALERTED_LEVELS = ['EMERGENCY', 'Elevated Risk']
+TAIL_CHECK_BYTES = 65536  # bytes before the last read position that must be unchanged for an append
 
 # Map text labels to numeric
 label_mapping = {
@@ -20,84 +32,294 @@ label_mapping = {
     "Elevated": 2,
     "Critical": 3
 }
+NUM_CLASSES = len(label_mapping)
 
-# --- Metric Calculation ---
-def calculate_validation_metrics(df_review):
+# --- Label Preparation ---
+def labeled_rows(df_review):
     """
-    Calculates Precision, Recall, F1, and displays confusion matrix for the alerting system.
+    (keys, y_true, y_pred) for the rows that have a valid manual label.
+    y_true is the mapped Manual_Risk_Label, y_pred is 1 if the segment was alerted.
     """
-
-    # --- 1. Normalize the Manual_Risk_Label column ---
     if "Manual_Risk_Label" not in df_review.columns:
         raise KeyError("Manual_Risk_Label column not found in the CSV.")
+    if "alert_level" not in df_review.columns:
+        raise KeyError("alert_level column not found in the CSV.")
 
-    # Clean up possible extra spaces or lowercase issues
-    df_review["Manual_Risk_Label"] = df_review["Manual_Risk_Label"].astype(str).str.strip().str.capitalize()
+    # Clean up possible extra spaces or lowercase issues, then map to numbers
+    y_true = df_review["Manual_Risk_Label"].astype(str).str.strip().str.capitalize().map(label_mapping)
+    y_pred = df_review["alert_level"].astype(str).str.strip().isin(ALERTED_LEVELS).astype(int)
+    keys = df_review[ROW_KEY_COLUMN].astype(str) if ROW_KEY_COLUMN in df_review.columns \
+        else df_review.index.astype(str).to_series(index=df_review.index)
 
-    # Map text labels (Low, Moderate, Elevated, Critical) to numbers
-    df_review["Manual_Risk_Label"] = df_review["Manual_Risk_Label"].map(label_mapping)
+    valid = y_true.notna()
+    return keys[valid].to_numpy(), y_true[valid].astype(int).to_numpy(), y_pred[valid].to_numpy()
 
-    if df_review["Manual_Risk_Label"].isna().all():
-        raise ValueError("All Manual_Risk_Label values are invalid — check your CSV values.")
+# --- Incremental Accumulator ---
+class EvaluationAccumulator:
+    """
+    Persistent confusion matrix over (manual label, alerted) pairs. Rows are
+    keyed by ROW_KEY_COLUMN; apply() moves only rows that are new or whose
+    label changed since they were counted, and precision/recall/F1 come from
+    the matrix, not from the labeled rows.
 
-    y_true = df_review["Manual_Risk_Label"]
+    sync_file() remembers how far into the labels file it has read. When the
+    file only grew (rows appended), just the new bytes are parsed, so an update
+    costs time in proportion to the new labels; a rewritten file (edited or
+    deleted rows) is re-diffed in full, vectorized.
+    """
 
-    # --- 2. Create binary alert variable ---
-    if "alert_level" not in df_review.columns:
-        raise KeyError("alert_level column not found in the CSV.")
+    def __init__(self, state_path=EVAL_STATE_FILE):
+        self.state_path = state_path
+        self.confusion = np.zeros((NUM_CLASSES, NUM_CLASSES), dtype=np.int64)
+        # Row key -> (true, pred) as currently counted
+        self.counted = pd.DataFrame({"true": pd.Series(dtype=np.int64), "pred": pd.Series(dtype=np.int64)})
+        self.source_stamp = None  # (mtime, size) of the labels file last synced
+        self.source_offset = 0  # bytes of the labels file consumed (complete lines only)
+        self.source_rows = 0  # data rows in those bytes; row keys when ROW_KEY_COLUMN is absent
+        self.source_header = ""  # header line, to tell an append from a different file
+        self.source_tail = ""  # hash of the bytes just before source_offset
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.confusion = np.array(state["confusion"], dtype=np.int64)
+                counted = state["counted"]
+                self.counted = pd.DataFrame(list(counted.values()), index=list(counted.keys()),
+                                            columns=["true", "pred"], dtype=np.int64)
+                self.source_stamp = state.get("source_stamp")
+                self.source_offset = state.get("source_offset", 0)
+                self.source_rows = state.get("source_rows", 0)
+                self.source_header = state.get("source_header", "")
+                self.source_tail = state.get("source_tail", "")
+            except Exception as e:
+                print(f"Could not read evaluation state {state_path}, starting fresh: {e}")
 
-    df_review["is_alerted"] = df_review["alert_level"].apply(
-        lambda x: 1 if str(x).strip() in ['EMERGENCY', 'Elevated Risk'] else 0
-    )
+    def apply(self, keys, y_true, y_pred):
+        """Counts new rows and moves relabeled ones; returns the number of rows that changed."""
+        rows = pd.DataFrame({"true": np.asarray(y_true, dtype=np.int64), "pred": np.asarray(y_pred, dtype=np.int64)},
+                            index=pd.Index(keys))
+        rows = rows[~rows.index.duplicated(keep='last')]  # a key listed twice counts as its last label
+        previous = self.counted.reindex(rows.index)
+        known = previous["true"].notna().to_numpy()
+        changed = ~known | (previous["true"].to_numpy() != rows["true"].to_numpy()) \
+            | (previous["pred"].to_numpy() != rows["pred"].to_numpy())
+        moved = changed & known
+        np.subtract.at(self.confusion, (previous["true"].to_numpy()[moved].astype(np.int64),
+                                        previous["pred"].to_numpy()[moved].astype(np.int64)), 1)
+        np.add.at(self.confusion, (rows["true"].to_numpy()[changed], rows["pred"].to_numpy()[changed]), 1)
+        if moved.any():
+            self.counted.loc[rows.index[moved]] = rows[moved]
+        if (changed & ~known).any():
+            self.counted = pd.concat([self.counted, rows[changed & ~known]])
+        return int(changed.sum())
 
-    y_pred = df_review["is_alerted"]
+    def remove(self, keys):
+        """Uncounts rows whose label was cleared or that were deleted; returns how many."""
+        gone = self.counted.index.isin(keys)
+        dropped = self.counted[gone]
+        np.subtract.at(self.confusion, (dropped["true"].to_numpy(), dropped["pred"].to_numpy()), 1)
+        self.counted = self.counted[~gone]
+        return int(gone.sum())
 
-    # --- 3. Filter valid samples ---
-    valid_indices = y_true.notna() & y_pred.notna()
-    y_true = y_true[valid_indices].astype(int)
-    y_pred = y_pred[valid_indices].astype(int)
+    def add_labels(self, df_rows):
+        """
+        Applies newly labeled rows already in memory (e.g. appended to the review
+        tool's labels log); returns rows changed. A row whose label is empty
+        uncounts its key: in the log that is how a label is cleared.
+        """
+        if ROW_KEY_COLUMN not in df_rows.columns:
+            return self.apply(*labeled_rows(df_rows))
+        # The last line of a key holds its current label
+        df_rows = df_rows.drop_duplicates(ROW_KEY_COLUMN, keep='last')
+        changed = self.apply(*labeled_rows(df_rows))
+        return changed + self.remove(df_rows.loc[df_rows["Manual_Risk_Label"].isna(), ROW_KEY_COLUMN].astype(str))
 
-    if len(y_true) < 10:
-        print("Not enough labeled samples (min 10) to calculate reliable metrics. Please label more data.")
-        return
+    @staticmethod
+    def _parse(header, data, columns, first_row):
+        frame = pd.read_csv(BytesIO(header + data), usecols=columns)
+        if ROW_KEY_COLUMN not in columns:
+            frame.index = pd.RangeIndex(first_row, first_row + len(frame))
+        return frame
 
-    # --- 4. Calculate metrics ---
-    precision = precision_score(y_true, y_pred, average='weighted', zero_division=0)
-    recall = recall_score(y_true, y_pred, average='weighted', zero_division=0)
-    f1 = f1_score(y_true, y_pred, average='weighted', zero_division=0)
-    cm = confusion_matrix(y_true, y_pred)
+    def _is_append(self, f, size):
+        """True if the file still starts with the header and the bytes read so far end as before."""
+        if not self.source_header or not (0 < self.source_offset <= size):
+            return False
+        header = self.source_header.encode('utf-8')
+        if f.read(len(header)) != header:
+            return False
+        tail_start = max(0, self.source_offset - TAIL_CHECK_BYTES)
+        f.seek(tail_start)
+        return hashlib.sha1(f.read(self.source_offset - tail_start)).hexdigest() == self.source_tail
 
-    # --- 5. Print results ---
-    print("\n--- FINAL ALERT SYSTEM PERFORMANCE ---")
-    print(f"Total Labeled Samples Used: {len(y_true)}")
-    print("-" * 40)
-    print(f"**Precision (Weighted)**: {precision:.3f}")
-    print(f"**Recall (Weighted)**: {recall:.3f}")
-    print(f"**F1 Score (Weighted)**: {f1:.3f}")
-    print("-" * 40)
-    print("\nDetailed Classification Report:\n")
-    print(classification_report(y_true, y_pred, zero_division=0))
+    def sync_file(self, path):
+        """
+        Applies the labels file if it changed since the last sync and returns
+        the number of rows that changed. Only the three columns used are parsed.
+        Appended rows are read from the remembered offset; otherwise the whole
+        file is re-diffed and rows no longer labeled are uncounted.
+        """
+        stat = os.stat(path)
+        stamp = [stat.st_mtime, stat.st_size]
+        if stamp == self.source_stamp:
+            return 0
+        with open(path, 'rb') as f:
+            appended = self._is_append(f, stat.st_size)
+            f.seek(self.source_offset if appended else 0)
+            data = f.read()
+        # Only complete lines are consumed; a row still being written is picked up next time
+        end = data.rfind(b"\n") + 1
+        data = data[:end]
+        if appended:
+            header = self.source_header.encode('utf-8')
+        else:
+            header, data = data[:data.find(b"\n") + 1], data[data.find(b"\n") + 1:]
+        header_columns = pd.read_csv(BytesIO(header), nrows=0).columns
+        columns = [c for c in ("Manual_Risk_Label", "alert_level", ROW_KEY_COLUMN) if c in header_columns]
+
+        if appended:
+            new_rows = self._parse(header, data, columns, self.source_rows)
+            changed = self.add_labels(new_rows)
+            self.source_rows += len(new_rows)
+        else:
+            all_rows = self._parse(header, data, columns, 0)
+            if ROW_KEY_COLUMN in all_rows.columns:
+                all_rows = all_rows.drop_duplicates(ROW_KEY_COLUMN, keep='last')
+            keys, y_true, y_pred = labeled_rows(all_rows)
+            changed = self.apply(keys, y_true, y_pred)
+            changed += self.remove(self.counted.index.difference(pd.Index(keys)))
+            self.source_rows = len(all_rows)
+            self.source_offset = len(header)
+        self.source_offset += len(data)
+        self.source_header = header.decode('utf-8')
+        with open(path, 'rb') as f:
+            tail_start = max(0, self.source_offset - TAIL_CHECK_BYTES)
+            f.seek(tail_start)
+            self.source_tail = hashlib.sha1(f.read(self.source_offset - tail_start)).hexdigest()
+        self.source_stamp = stamp
+        return changed
 
-    # --- 6. Plot confusion matrix ---
-    plt.figure(figsize=(6, 5))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
+    def metrics(self):
+        """Weighted precision/recall/F1 (zero_division=0) and per-class figures, as sklearn computes them."""
+        tp = np.diagonal(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(tp), where=(precision + recall) > 0)
+        total = support.sum()
+        weights = support / total if total else np.zeros_like(tp)
+        names = list(label_mapping)
+        return {
+            "samples": int(total),
+            "precision_weighted": float(precision @ weights),
+            "recall_weighted": float(recall @ weights),
+            "f1_weighted": float(f1 @ weights),
+            "per_class": {
+                names[i]: {"precision": float(precision[i]), "recall": float(recall[i]),
+                           "f1": float(f1[i]), "support": int(support[i])}
+                for i in range(NUM_CLASSES)
+            },
+            "confusion_matrix": self.confusion.tolist(),
+        }
+
+    def save(self):
+        if not self.state_path:
+            return
+        state = {
+            "confusion": self.confusion.tolist(),
+            "counted": {key: [int(t), int(p)] for key, t, p in
+                        zip(self.counted.index, self.counted["true"], self.counted["pred"])},
+            "source_stamp": self.source_stamp,
+            "source_offset": self.source_offset,
+            "source_rows": self.source_rows,
+            "source_header": self.source_header,
+            "source_tail": self.source_tail,
+        }
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+# --- Snapshot ---
+def write_snapshot(metrics, output_dir=None):
+    """Writes metrics.json and confusion_matrix.png to output_dir; returns their paths."""
+    output_dir = output_dir or EVAL_SNAPSHOT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, "metrics.json")
+    png_path = os.path.join(output_dir, "confusion_matrix.png")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({"written_at": time.time(), **metrics}, f, indent=2)
+
+    # Predictions are binary (alerted or not), so only the first two columns can fill
+    fig = plt.figure(figsize=(6, 5))
+    sns.heatmap(np.array(metrics["confusion_matrix"]), annot=True, fmt='d', cmap='Blues',
+                yticklabels=list(label_mapping))
     plt.title("Confusion Matrix — Alert System Validation")
     plt.xlabel("Predicted Label")
     plt.ylabel("True Label")
     plt.tight_layout()
-    plt.show()
+    fig.savefig(png_path, dpi=120)
+    plt.close(fig)
+    return json_path, png_path
+
+# --- Metric Calculation ---
+def print_metrics(metrics):
+    print("\n--- FINAL ALERT SYSTEM PERFORMANCE ---")
+    print(f"Total Labeled Samples Used: {metrics['samples']}")
+    print("-" * 40)
+    print(f"**Precision (Weighted)**: {metrics['precision_weighted']:.3f}")
+    print(f"**Recall (Weighted)**: {metrics['recall_weighted']:.3f}")
+    print(f"**F1 Score (Weighted)**: {metrics['f1_weighted']:.3f}")
+    print("-" * 40)
+    print("\nPer-Class Metrics:\n")
+    print(f"{'':>10} {'precision':>10} {'recall':>10} {'f1-score':>10} {'support':>10}")
+    for name, m in metrics["per_class"].items():
+        print(f"{name:>10} {m['precision']:10.4f} {m['recall']:10.4f} {m['f1']:10.4f} {m['support']:10d}")
 
+def report(accumulator):
+    metrics = accumulator.metrics()
+    if metrics["samples"] < MIN_LABELED_SAMPLES:
+        print(f"Not enough labeled samples (min {MIN_LABELED_SAMPLES}) to calculate reliable metrics. Please label more data.")
+        return
+    print_metrics(metrics)
+    json_path, png_path = write_snapshot(metrics)
+    print(f"\nSnapshot written to {json_path} and {png_path}")
     print("\n✅ These validated metrics are the final technical conclusion of your project.")
 
+def calculate_validation_metrics(df_review, accumulator=None):
+    """
+    Adds the labeled rows of df_review to the accumulator (a fresh, unsaved
+    one if none is given), prints Precision, Recall and F1, and writes the
+    PNG/JSON snapshot.
+    """
+    accumulator = accumulator or EvaluationAccumulator(state_path=None)
+    accumulator.apply(*labeled_rows(df_review))
+    report(accumulator)
+
 
 # --- Main Execution ---
 if __name__ == '__main__':
     try:
-        df_review = pd.read_csv(GROUND_TRUTH_FILE)
-        calculate_validation_metrics(df_review)
+        accumulator = EvaluationAccumulator()
+        while True:
+            changed = accumulator.sync_file(GROUND_TRUTH_FILE)
+            if changed:
+                print(f"\n{changed} new or changed labels applied.")
+                accumulator.save()
+                report(accumulator)
+            elif not WATCH_LABELS_FILE:
+                print("No new labels since the last run.")
+                report(accumulator)
+            if not WATCH_LABELS_FILE:
+                break
+            time.sleep(WATCH_POLL_SEC)
     except FileNotFoundError:
-        print(f"Error: {GROUND_TRUTH_FILE} not found. Please ensure the CSV is in the root directory.")
+        print(f"Error: {GROUND_TRUTH_FILE} not found. Label segments with manual_review_tool.py (label/import) first.")
     except KeyError as e:
         print(f"Error: Missing expected column - {e}. Ensure 'Manual_Risk_Label' and 'alert_level' exist.")
+    except KeyboardInterrupt:
+        print("\nStopped watching labels.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
@@ -1,9 +1,13 @@
 import os
 import glob
 import pandas as pd
-import librosa
+import soundfile as sf
 import re
-from typing import List
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from segment_store import open_segment_store
+from phase_io import write_table
 
 # --- Configuration ---
 # --- Configuration ---
@@ -11,18 +15,23 @@ from typing import List
 NR_PATH = "./processed_audio"
 TRANSCRIPT_PATH = r"C:\Users\tssmi\Downloads\extracted_texts\train-00000-of-00002_text.txt"
 RAW_ENTRIES_FILE = TRANSCRIPT_PATH  # ✅ directly use the file, not as a folder
-TARGET_METADATA_FILE = "asr_data.csv"
+TARGET_METADATA_FILE = "asr_data.parquet"  # typed hand-off; asr_data.csv is written alongside
 TARGET_SR = 16000
+# Packed segment store written by preprocessing.py; used instead of NR_PATH when present
+SEGMENT_STORE_PATH = "./processed_store"
+# Written by preprocessing.py: where each segment sits in its source recording
+SEGMENT_SPANS_FILE = "./segment_spans.csv"
+# Durations come from WAV headers only; reads are spread over a thread pool
+METADATA_WORKERS = 16
 
 
 
 # --- Function to Parse the Provided Transcript Format ---
-def parse_raw_entries(file_path: str) -> List[str]:
+def iter_raw_entries(file_path: str) -> Iterator[str]:
     """
-    Parses the provided transcript file into a list of text entries.
+    Streams text entries from the provided transcript file one line at a time.
     Looks for lines like: [Entry X]: TEXT
     """
-    entries = []
     entry_pattern = re.compile(r'\[Entry \d+\]: (.*)')
 
     try:
@@ -32,27 +41,36 @@ def parse_raw_entries(file_path: str) -> List[str]:
                 if match:
                     text = match.group(1).strip()
                     if text:
-                        entries.append(text)
+                        yield text
     except Exception as e:
         print(f"Error reading or parsing transcript file {file_path}: {e}")
 
-    return entries
+def parse_raw_entries(file_path: str) -> List[str]:
+    """Parses the provided transcript file into a list of text entries."""
+    return list(iter_raw_entries(file_path))
+
+# --- Header-Only Duration ---
+def read_duration(file_path: str) -> Optional[float]:
+    """Duration from the file header (frame count / sample rate), without decoding audio."""
+    try:
+        info = sf.info(file_path)
+        return info.frames / info.samplerate
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
 
 
 # --- Main Metadata Generation ---
 def create_asr_metadata():
     """Generates the metadata CSV by mapping audio segments to transcripts."""
     
-    # 1. Load all transcript entries
-    all_transcripts = parse_raw_entries(RAW_ENTRIES_FILE)
-    if not all_transcripts:
-        print(f"FATAL: Failed to load transcripts from {RAW_ENTRIES_FILE}. Check file path and format.")
-        return
-
-    print(f"Loaded {len(all_transcripts)} transcript entries.")
-
-    # 2. Get all segmented audio files
-    audio_files = sorted(glob.glob(os.path.join(NR_PATH, '*_seg_*.wav')))
+    # 1. Get all segmented audio files (store positions follow the same sorted order)
+    store = open_segment_store(SEGMENT_STORE_PATH)
+    if store is not None:
+        print(f"Reading segments from store: {SEGMENT_STORE_PATH}")
+        audio_files = [os.path.join(NR_PATH, f"{name}.wav") for name in store.names]
+    else:
+        audio_files = sorted(glob.glob(os.path.join(NR_PATH, '*_seg_*.wav')))
 
     if not audio_files:
         print(f"WARNING: No segmented files found in {NR_PATH}. Run preprocessing.py first!")
@@ -60,38 +78,55 @@ def create_asr_metadata():
 
     print(f"Found {len(audio_files)} segmented audio files.")
 
-    # 3. Match counts
+    # 2. Stream transcript entries: only as many as there are segments (+1 to detect extras)
     num_audio = len(audio_files)
+    all_transcripts = list(islice(iter_raw_entries(RAW_ENTRIES_FILE), num_audio + 1))
+    if not all_transcripts:
+        print(f"FATAL: Failed to load transcripts from {RAW_ENTRIES_FILE}. Check file path and format.")
+        return
+
+    print(f"Loaded {min(len(all_transcripts), num_audio)} transcript entries.")
+
+    # 3. Match counts
     num_transcripts = len(all_transcripts)
 
     if num_audio > num_transcripts:
         print(f"WARNING: More audio segments ({num_audio}) than transcripts ({num_transcripts}). Truncating audio list.")
         audio_files = audio_files[:num_transcripts]
     elif num_transcripts > num_audio:
-        print(f"WARNING: More transcripts ({num_transcripts}) than audio segments ({num_audio}). Truncating transcript list.")
+        print(f"WARNING: More transcripts than audio segments ({num_audio}). Truncating transcript list.")
         all_transcripts = all_transcripts[:num_audio]
 
     print(f"Mapping {len(audio_files)} segments to {len(all_transcripts)} transcripts.")
 
-    # 4. Create metadata list
+    # 4. Durations: from the store index, or from WAV headers across a thread pool
+    if store is not None:
+        durations = [store.duration(i) for i in range(len(audio_files))]
+    else:
+        with ThreadPoolExecutor(max_workers=METADATA_WORKERS) as executor:
+            durations = list(executor.map(read_duration, audio_files))
+
     data_list = []
-    for i, file_path in enumerate(audio_files):
-        transcript = all_transcripts[i]
-        try:
-            y, sr = librosa.load(file_path, sr=None)
-            duration = librosa.get_duration(y=y, sr=sr)
-            data_list.append({
-                'file_path': os.path.abspath(file_path),
-                'transcript': transcript,
-                'duration': duration,
-                'segment_index': i
-            })
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-
-    # 5. Save metadata
+    for i, (file_path, duration) in enumerate(zip(audio_files, durations)):
+        if duration is None:
+            continue
+        data_list.append({
+            'file_path': os.path.abspath(file_path),
+            'transcript': all_transcripts[i],
+            'duration': duration,
+            'segment_index': i
+        })
+
+    # 5. Save metadata (with original-recording timestamps when available)
     df = pd.DataFrame(data_list)
-    df.to_csv(TARGET_METADATA_FILE, index=False)
+    if os.path.exists(SEGMENT_SPANS_FILE) and not df.empty:
+        spans = pd.read_csv(SEGMENT_SPANS_FILE)
+        segment_names = df['file_path'].map(lambda p: os.path.splitext(os.path.basename(p))[0])
+        spans = spans.set_index('segment_name')
+        df['source'] = segment_names.map(spans['source'])
+        df['start_sec'] = segment_names.map(spans['start_sec'])
+        df['end_sec'] = segment_names.map(spans['end_sec'])
+    write_table(df, TARGET_METADATA_FILE)
     print(f"\n✅ Metadata created successfully: {TARGET_METADATA_FILE} with {len(df)} entries.")
 
 
@@ -6,12 +6,46 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+from segment_store import SegmentStore, open_segment_store
+from stage_cache import hash_bytes, hash_file, stage_key
+from feature_store import FeatureStore
+from stress_normalizer import OnlineStressNormalizer
+from metrics import METRICS, timed, timed_task
+from phase_io import read_table, write_table
 
 # --- Configuration ---
-DIARIZED_METADATA_FILE = "diarized_asr_data.csv"
-FINAL_METADATA_FILE = "final_analytics_data.csv"
+DIARIZED_METADATA_FILE = "diarized_asr_data.parquet"
+FINAL_METADATA_FILE = "final_analytics_data.parquet"
 TARGET_SR = 16000
+# Packed segment store written by preprocessing.py; rows are read by segment_index when present
+SEGMENT_STORE_PATH = "./processed_store"
+
+# Batched extraction: rows are processed FEATURE_BATCH_SIZE at a time, equal-length
+# segments stacked into one 2-D array, spread over FEATURE_WORKERS processes.
+FEATURE_BATCH_SIZE = 32
+FEATURE_WORKERS = os.cpu_count() or 1
+FRAME_LENGTH = 2048  # librosa defaults for yin / rms / zero_crossing_rate
+HOP_LENGTH = 512
+PITCH_FMIN = librosa.note_to_hz('C2')
+PITCH_FMAX = librosa.note_to_hz('C7')
+
+# Feature store: features are reused for segments whose audio hash and extractor
+# version are unchanged. Bump FEATURE_EXTRACTOR_VERSION when the extraction changes.
+USE_FEATURE_STORE = True
+FEATURE_STORE_PATH = "./feature_store"
+FEATURE_EXTRACTOR_VERSION = "prosody-v1"
+FEATURE_COLUMNS = ("pitch_mean", "energy_mean", "rate_proxy")
+
+# Stress scoring: "online" scores each segment against running baselines built from the
+# earlier segments of this run, "batch" refits a StandardScaler over the whole CSV (the
+# original placeholder model). Both give the same scores every time the same data is run.
+STRESS_SCORING = "online"
+# Baselines persisted across runs; only stream_alert.py reads and updates them
+STRESS_STATE_FILE = "./stress_baselines.json"
+STRESS_BASELINE = "speaker"  # "global", "flight" (per source recording) or "speaker" (per role within a flight)
 
 # --- Feature Extraction ---
 def extract_features(file_path: str) -> Tuple[float, float, float]:
@@ -20,7 +54,17 @@ def extract_features(file_path: str) -> Tuple[float, float, float]:
     """
     try:
         y, sr = librosa.load(file_path, sr=TARGET_SR)
-        
+        return extract_features_from_array(y, sr)
+    except Exception as e:
+        print(f"Feature extraction failed for {os.path.basename(file_path)}. Error: {e}")
+        return 0.0, 0.0, 0.0
+
+def extract_features_from_array(y: np.ndarray, sr: int = TARGET_SR) -> Tuple[float, float, float]:
+    """
+    Same features as extract_features, for audio already in memory
+    (e.g. a segment read from the segment store).
+    """
+    try:
         # 1. Pitch (Fundamental Frequency - F0 Mean)
         # Use pyin to estimate F0, often a strong indicator of stress
         f0 = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
@@ -38,9 +82,137 @@ def extract_features(file_path: str) -> Tuple[float, float, float]:
         return pitch_mean, energy_mean, rate_proxy
     
     except Exception as e:
-        print(f"Feature extraction failed for {os.path.basename(file_path)}. Error: {e}")
+        print(f"Feature extraction failed. Error: {e}")
         return 0.0, 0.0, 0.0
 
+# --- Batched Feature Extraction ---
+def extract_features_batch(signals: np.ndarray, sr: int = TARGET_SR) -> np.ndarray:
+    """
+    Vectorized extract_features for a (batch, samples) stack of equal-length
+    segments. Pads once and frames once; RMS, ZCR and YIN all read the same
+    centered frames, giving the same values as the per-file librosa calls.
+    Returns a (batch, 3) array of (pitch_mean, energy_mean, rate_proxy).
+    """
+    pad = FRAME_LENGTH // 2
+    padded = np.pad(signals, ((0, 0), (pad, pad)))
+    frames = librosa.util.frame(padded, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)
+
+    # 1. Pitch: YIN over the already-padded signal
+    f0 = librosa.yin(padded, fmin=PITCH_FMIN, fmax=PITCH_FMAX, sr=sr,
+                     frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, center=False)
+    voiced = f0 > 0
+    voiced_count = voiced.sum(axis=1)
+    pitch_mean = np.where(voiced_count > 0,
+                          np.where(voiced, f0, 0).sum(axis=1) / np.maximum(voiced_count, 1), 0.0)
+
+    # 2. Energy: frame RMS
+    energy_mean = np.sqrt(np.mean(np.square(frames), axis=1)).mean(axis=1)
+
+    # 3. Rate proxy: ZCR. librosa edge-pads here, so the padded signs repeat the end samples
+    signs = np.signbit(np.where(np.abs(padded) <= 1e-10, 0, padded))
+    signs[:, :pad] = signs[:, pad:pad + 1]
+    signs[:, -pad:] = signs[:, -pad - 1:-pad]
+    sign_frames = librosa.util.frame(signs, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)
+    crossings = sign_frames[:, 1:, :] != sign_frames[:, :-1, :]
+    rate_proxy = (crossings.sum(axis=1) / FRAME_LENGTH).mean(axis=1)
+
+    return np.stack([pitch_mean, energy_mean, rate_proxy], axis=1)
+
+_FEATURE_STORE = None
+
+def _init_feature_worker(store_path: Optional[str]):
+    global _FEATURE_STORE
+    _FEATURE_STORE = SegmentStore(store_path) if store_path else None
+
+def _load_segment(source) -> np.ndarray:
+    if _FEATURE_STORE is not None:
+        return _FEATURE_STORE.read_float(int(source))
+    y, _ = librosa.load(source, sr=TARGET_SR)
+    return y
+
+def extract_features_chunk(sources: list) -> List[Tuple[float, float, float]]:
+    """
+    Worker task: loads a chunk of segments (store indices or file paths),
+    groups them by length and runs extract_features_batch once per group.
+    Rows that fail to load get (0.0, 0.0, 0.0), like extract_features.
+    """
+    results = [(0.0, 0.0, 0.0)] * len(sources)
+    by_length = {}
+    for pos, source in enumerate(sources):
+        try:
+            y = _load_segment(source)
+        except Exception as e:
+            print(f"Feature extraction failed for {source}. Error: {e}")
+            continue
+        by_length.setdefault(len(y), []).append((pos, y))
+
+    for length, group in by_length.items():
+        positions = [pos for pos, _ in group]
+        try:
+            features = extract_features_batch(np.stack([y for _, y in group]), TARGET_SR)
+            for pos, row in zip(positions, features):
+                results[pos] = tuple(float(v) for v in row)
+        except Exception:
+            # Fall back to one segment at a time so one bad row doesn't sink the group
+            for pos, y in group:
+                results[pos] = extract_features_from_array(y, TARGET_SR)
+    return results
+
+def extract_features_for_rows(sources: list, store_path: Optional[str] = None,
+                              workers: int = FEATURE_WORKERS,
+                              batch_size: int = FEATURE_BATCH_SIZE) -> List[Tuple[float, float, float]]:
+    """
+    One (pitch_mean, energy_mean, rate_proxy) tuple per source, in order.
+    Sources are segment indices into store_path, or file paths without a store.
+    """
+    chunks = [list(sources[i:i + batch_size]) for i in range(0, len(sources), batch_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_feature_worker,
+                                 initargs=(store_path,)) as executor:
+            chunk_results = list(executor.map(partial(timed_task, extract_features_chunk), chunks))
+    else:
+        _init_feature_worker(store_path)
+        chunk_results = [timed_task(extract_features_chunk, chunk) for chunk in chunks]
+    # Latency is per chunk of up to batch_size segments
+    for chunk, seconds in chunk_results:
+        METRICS.observe("feature_extraction", seconds)
+        METRICS.inc("segments_featurized", len(chunk))
+    return [features for chunk, _ in chunk_results for features in chunk]
+
+def feature_key(audio_hash: str) -> str:
+    return stage_key(audio_hash, FEATURE_EXTRACTOR_VERSION, TARGET_SR, FRAME_LENGTH, HOP_LENGTH)
+
+def extract_features_cached(sources: list, feature_store: FeatureStore,
+                            store_path: Optional[str] = None) -> List[Tuple[float, float, float]]:
+    """
+    extract_features_for_rows, but only for segments missing from the feature
+    store. Store segments are keyed by their samples, files by their bytes.
+    """
+    segment_store = SegmentStore(store_path) if store_path else None
+    keys = []
+    for source in sources:
+        try:
+            if segment_store is not None:
+                keys.append(feature_key(hash_bytes(segment_store[int(source)].tobytes())))
+            else:
+                keys.append(feature_key(hash_file(source)))
+        except Exception as e:
+            print(f"Could not hash {source}, extracting without cache. Error: {e}")
+            keys.append(None)
+
+    missing = [i for i, key in enumerate(keys) if key is None or key not in feature_store]
+    print(f"Feature store: {len(sources) - len(missing)} cached, {len(missing)} to extract.")
+    extracted = extract_features_for_rows([sources[i] for i in missing], store_path=store_path)
+
+    results = [feature_store.get(key) for key in keys]
+    for i, features in zip(missing, extracted):
+        results[i] = features
+        # Failed rows come back as zeros; don't cache them so they are retried next run
+        if keys[i] is not None and any(features):
+            feature_store.put(keys[i], features)
+    feature_store.save()
+    return results
+
 # --- Stress Prediction Placeholder Model ---
 def train_and_predict_stress(df: pd.DataFrame) -> np.ndarray:
     """
@@ -69,26 +241,62 @@ def train_and_predict_stress(df: pd.DataFrame) -> np.ndarray:
     print("Note: Stress detection is based on generated mock scores (Pitch/Energy) for prototyping.")
     return stress_scores
 
+def baseline_keys(row, level=STRESS_BASELINE):
+    """Baseline keys for a row, broadest first; flights come from the 'source' column."""
+    if level == "global":
+        return ()
+    flight = str(row.get('source', 'unknown'))
+    if level == "flight":
+        return (flight,)
+    return (flight, f"{flight}/{row.get('speaker_role', 'UNKNOWN')}")
+
+def predict_stress_online(df: pd.DataFrame, normalizer: OnlineStressNormalizer) -> np.ndarray:
+    """Scores rows in order, each against the baselines built from earlier segments."""
+    return np.array([
+        normalizer.score(features, baseline_keys(row))
+        for features, row in zip(df['features'], df.to_dict('records'))
+    ])
+
+def extract_segment_features(df: pd.DataFrame) -> List[Tuple[float, float, float]]:
+    """Prosodic features for every row, read from the segment store when it exists."""
+    print("Extracting prosodic features for stress analysis...")
+    if open_segment_store(SEGMENT_STORE_PATH) is not None:
+        # Zero-copy reads from the memory-mapped store instead of one file open per row
+        sources, store_path = df['segment_index'].tolist(), SEGMENT_STORE_PATH
+    else:
+        sources, store_path = df['file_path'].tolist(), None
+    if USE_FEATURE_STORE:
+        feature_store = FeatureStore(FEATURE_STORE_PATH, FEATURE_COLUMNS)
+        return extract_features_cached(sources, feature_store, store_path=store_path)
+    return extract_features_for_rows(sources, store_path=store_path)
+
+def score_stress(df: pd.DataFrame) -> np.ndarray:
+    """Stress score per row from df['features'] (and speaker_role/source for the baselines)."""
+    with timed("stress_scoring"):
+        if STRESS_SCORING == "online":
+            # A fresh normalizer per run: rerunning on the same segments must not count them twice
+            return predict_stress_online(df, OnlineStressNormalizer())
+        return train_and_predict_stress(df)
 
 # --- Script Execution ---
 if __name__ == "__main__":
     
     try:
-        df = pd.read_csv(DIARIZED_METADATA_FILE)
+        df = read_table(DIARIZED_METADATA_FILE)
     except FileNotFoundError:
-        print("Error: diarized_asr_data.csv not found. Run speaker_diarization.py first.")
+        print(f"Error: {DIARIZED_METADATA_FILE} not found. Run speaker_diarization.py first.")
         exit()
 
     # 1. Extract Features
-    print("Extracting prosodic features for stress analysis...")
-    df['features'] = df['file_path'].apply(extract_features)
+    df['features'] = extract_segment_features(df)
 
     # 2. Predict Stress Score
-    df['stress_score'] = train_and_predict_stress(df)
+    df['stress_score'] = score_stress(df)
     
     # Clean up intermediate column before saving
     df.drop(columns=['features'], inplace=True)
     
     # Save the updated DataFrame
-    df.to_csv(FINAL_METADATA_FILE, index=False)
-    print(f"\nPhase 3: Stress Detection Complete. Final data saved to {FINAL_METADATA_FILE}")
\ No newline at end of file
+    write_table(df, FINAL_METADATA_FILE)
+    print(f"\nPhase 3: Stress Detection Complete. Final data saved to {FINAL_METADATA_FILE}")
+    METRICS.export("emotion_detection")
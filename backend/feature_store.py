@@ -0,0 +1,75 @@
+import os
+import glob
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Configuration ---
+SHARD_PATTERN = "features-*.parquet"
+MAX_SHARDS = 32  # compact into a single shard once a run would leave more than this
+
+# --- Feature Store ---
+class FeatureStore:
+    """
+    Columnar cache of per-segment feature vectors in Parquet shards. Rows are
+    keyed by a hash of the segment audio combined with the extractor version,
+    so unchanged segments are never re-extracted and a new extractor version
+    simply misses. Each run adds at most one new shard.
+    """
+
+    def __init__(self, store_path: str, columns):
+        self.store_path = store_path
+        self.columns = list(columns)
+        self.features = {}  # key -> tuple of floats
+        self._new = {}
+        for shard_path in self._shards():
+            try:
+                table = pq.read_table(shard_path, columns=["key"] + self.columns)
+            except Exception as e:
+                print(f"Skipping unreadable feature shard {shard_path}: {e}")
+                continue
+            values = np.column_stack([table.column(c).to_numpy() for c in self.columns])
+            self.features.update(zip(table.column("key").to_pylist(), map(tuple, values.tolist())))
+
+    def _shards(self):
+        return sorted(glob.glob(os.path.join(self.store_path, SHARD_PATTERN)))
+
+    def __len__(self):
+        return len(self.features)
+
+    def __contains__(self, key):
+        return key in self.features
+
+    def get(self, key):
+        return self.features.get(key)
+
+    def put(self, key, values):
+        values = tuple(float(v) for v in values)
+        self.features[key] = values
+        self._new[key] = values
+
+    def _write_shard(self, path, items):
+        keys = [k for k, _ in items]
+        values = np.asarray([v for _, v in items], dtype=np.float64).reshape(len(items), len(self.columns))
+        table = pa.table({"key": keys, **{c: values[:, i] for i, c in enumerate(self.columns)}})
+        tmp_path = path + ".tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        """Writes new rows as one shard; rewrites everything as one shard when shards pile up."""
+        if not self._new:
+            return
+        os.makedirs(self.store_path, exist_ok=True)
+        shards = self._shards()
+        next_id = int(os.path.basename(shards[-1])[len("features-"):-len(".parquet")]) + 1 if shards else 0
+        shard_path = os.path.join(self.store_path, f"features-{next_id:05d}.parquet")
+        if len(shards) + 1 > MAX_SHARDS:
+            self._write_shard(shard_path, list(self.features.items()))
+            for old_path in shards:
+                os.remove(old_path)
+            print(f"Feature store compacted: {len(self.features)} rows in {shard_path}")
+        else:
+            self._write_shard(shard_path, list(self._new.items()))
+            print(f"Feature store: {len(self._new)} new rows written to {shard_path}")
+        self._new = {}
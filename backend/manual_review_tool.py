@@ -1,14 +1,58 @@
+import os
+import sys
+import time
 import pandas as pd
 import numpy as np
+from phase_io import read_table
 
 # --- Configuration ---
-FINAL_REPORT_FILE = "real_time_alert_report.csv"
+FINAL_REPORT_FILE = "real_time_alert_report.parquet"
 SAMPLE_SIZE = 100 # Adjust this based on how much time you have for manual review
+REVIEW_FILE = "manual_review_ground_truth.csv"
+# Every label given is appended here, so calcute_final_metrics.py only reads labels it
+# hasn't seen. The last line of a file_path is its current label; an empty label clears it.
+LABELS_LOG_FILE = "manual_review_labels.csv"
+LOG_COLUMNS = ['file_path', 'Manual_Risk_Label', 'alert_level', 'Reviewer_Notes', 'labeled_at']
 
-# --- Main Sampling Logic ---
-if __name__ == '__main__':
+# --- Labels Log ---
+def append_labels(rows: pd.DataFrame, log_path=LABELS_LOG_FILE) -> int:
+    """Appends label rows (file_path, Manual_Risk_Label, alert_level, Reviewer_Notes) to the log."""
+    if rows.empty:
+        return 0
+    rows = rows.assign(labeled_at=time.time()).reindex(columns=LOG_COLUMNS)
+    write_header = not os.path.exists(log_path) or os.path.getsize(log_path) == 0
+    rows.to_csv(log_path, mode='a', header=write_header, index=False)
+    return len(rows)
+
+def record_label(file_path, label, notes="", review_path=REVIEW_FILE, log_path=LABELS_LOG_FILE):
+    """Logs one label for a segment of the review sample (its alert_level is taken from there)."""
+    review = pd.read_csv(review_path, usecols=['file_path', 'alert_level'])
+    match = review[review['file_path'] == file_path]
+    if match.empty:
+        raise KeyError(f"{file_path} is not in {review_path}")
+    append_labels(pd.DataFrame({'file_path': [file_path], 'Manual_Risk_Label': [label],
+                                'alert_level': [match['alert_level'].iloc[-1]], 'Reviewer_Notes': [notes]}),
+                  log_path)
+
+def import_review_labels(review_path=REVIEW_FILE, log_path=LABELS_LOG_FILE) -> int:
+    """
+    Logs the labels filled into the review CSV (e.g. in a spreadsheet) that
+    differ from the latest logged label of their segment; returns how many.
+    """
+    review = pd.read_csv(review_path, dtype={'Manual_Risk_Label': str, 'Reviewer_Notes': str})
+    review['Manual_Risk_Label'] = review['Manual_Risk_Label'].fillna("").str.strip()
+    logged = pd.Series(dtype=str)
+    if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+        log = pd.read_csv(log_path, usecols=['file_path', 'Manual_Risk_Label'], dtype=str)
+        logged = log.drop_duplicates('file_path', keep='last').set_index('file_path')['Manual_Risk_Label'].fillna("")
+    previous = review['file_path'].map(logged).fillna("")
+    changed = review[review['Manual_Risk_Label'] != previous]
+    return append_labels(changed[['file_path', 'Manual_Risk_Label', 'alert_level', 'Reviewer_Notes']], log_path)
+
+# --- Review Sample ---
+def create_review_sample():
     try:
-        df = pd.read_csv(FINAL_REPORT_FILE)
+        df = read_table(FINAL_REPORT_FILE, columns=['file_path', 'transcript', 'speaker_role', 'stress_score', 'alert_level', 'alert_reason'])
     except FileNotFoundError:
         print(f"Error: {FINAL_REPORT_FILE} not found.")
         exit()
@@ -25,14 +69,30 @@ if __name__ == '__main__':
 
     # 3. Combine and Prepare for Manual Review
     review_sample = pd.concat([alerted_sample, routine_sample])
-    
+
     # Add the column you need to fill out manually
-    review_sample['Manual_Risk_Label'] = np.nan 
+    review_sample['Manual_Risk_Label'] = np.nan
     review_sample['Reviewer_Notes'] = ''
-    
+
     # Select only the relevant columns for easy review and save
     review_cols = ['file_path', 'transcript', 'speaker_role', 'stress_score', 'alert_level', 'alert_reason', 'Manual_Risk_Label', 'Reviewer_Notes']
-    
-    review_sample[review_cols].to_csv("manual_review_ground_truth.csv", index=False)
-    print(f"Created 'manual_review_ground_truth.csv' with {len(review_sample)} segments for manual labeling.")
-    print("ACTION REQUIRED: Open this CSV, listen to the audio segments, and manually fill the 'Manual_Risk_Label' (1 for True Risk, 0 for Routine).")
\ No newline at end of file
+
+    review_sample[review_cols].to_csv(REVIEW_FILE, index=False)
+    print(f"Created '{REVIEW_FILE}' with {len(review_sample)} segments for manual labeling.")
+    print("ACTION REQUIRED: Open this CSV, listen to the audio segments, and manually fill the 'Manual_Risk_Label' (1 for True Risk, 0 for Routine).")
+    print(f"Then run 'python manual_review_tool.py import' to log the labels to '{LABELS_LOG_FILE}', "
+          f"or log them one at a time with 'python manual_review_tool.py label <file_path> <label> [notes]'.")
+
+# --- Main Sampling Logic ---
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else "sample"
+    if command == "sample":
+        create_review_sample()
+    elif command == "label" and len(sys.argv) >= 4:
+        record_label(sys.argv[2], sys.argv[3], " ".join(sys.argv[4:]))
+        print(f"Logged label '{sys.argv[3]}' for {sys.argv[2]} to '{LABELS_LOG_FILE}'.")
+    elif command == "import":
+        review_path = sys.argv[2] if len(sys.argv) > 2 else REVIEW_FILE
+        print(f"Logged {import_review_labels(review_path)} new or changed labels from '{review_path}' to '{LABELS_LOG_FILE}'.")
+    else:
+        print("Usage: python manual_review_tool.py [sample | label <file_path> <label> [notes] | import [review.csv]]")
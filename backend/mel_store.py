@@ -0,0 +1,172 @@
+import os
+import json
+import numpy as np
+
+# --- Configuration ---
+FRAMES_FILE = "frames.bin"
+INDEX_FILE = "index.json"
+STORE_DTYPES = ("float16", "float32")
+
+# --- Padding ---
+def trimmed_length(features):
+    """
+    Number of leading frames of a (n_mels, n_frames) log-mel array that carry
+    audio. Whisper pads every clip to 30 s; the padded frames all hold one value
+    (the clamped log floor), so trailing frames equal to a constant last frame
+    can be dropped and restored from that value.
+    """
+    last = features[:, -1]
+    if not np.all(last == last[0]):
+        return features.shape[1]
+    padding = np.all(features == last[0], axis=0)
+    content = np.flatnonzero(~padding)
+    return int(content[-1]) + 1 if len(content) else 0
+
+# --- Writer ---
+class MelStoreWriter:
+    """
+    Appends log-mel features to one contiguous frame file, frame-major
+    (frames, n_mels), with trailing padding optionally trimmed. The index keeps
+    each item's offset, frame count, padding value and label ids.
+    """
+
+    def __init__(self, store_path, n_mels, n_frames, dtype="float16", trim=True):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported store dtype {dtype}; expected one of {STORE_DTYPES}")
+        os.makedirs(store_path, exist_ok=True)
+        self.store_path = store_path
+        self.n_mels = n_mels
+        self.n_frames = n_frames
+        self.dtype = dtype
+        self.trim = trim
+        self.offsets, self.lengths, self.pad_values, self.labels = [], [], [], []
+        self._offset = 0
+        self._frames_tmp = os.path.join(store_path, FRAMES_FILE + ".tmp")
+        self._file = open(self._frames_tmp, 'wb')
+
+    def append(self, features, label_ids):
+        features = np.asarray(features)
+        if features.shape != (self.n_mels, self.n_frames):
+            raise ValueError(f"Expected features of shape {(self.n_mels, self.n_frames)}, got {features.shape}")
+        length = trimmed_length(features) if self.trim else self.n_frames
+        self._file.write(np.ascontiguousarray(features[:, :length].T, dtype=self.dtype))
+        self.offsets.append(self._offset)
+        self.lengths.append(length)
+        self.pad_values.append(float(features[0, -1]))
+        self.labels.append([int(t) for t in label_ids])
+        self._offset += length
+
+    def close(self):
+        self._file.close()
+        index = {
+            "dtype": self.dtype,
+            "n_mels": self.n_mels,
+            "n_frames": self.n_frames,
+            "offsets": self.offsets,
+            "lengths": self.lengths,
+            "pad_values": self.pad_values,
+            "labels": self.labels,
+        }
+        index_tmp = os.path.join(self.store_path, INDEX_FILE + ".tmp")
+        with open(index_tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        # Frames first, index last: a store with an index is always complete
+        os.replace(self._frames_tmp, os.path.join(self.store_path, FRAMES_FILE))
+        os.replace(index_tmp, os.path.join(self.store_path, INDEX_FILE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# --- Reader ---
+class MelStore:
+    """
+    Read-only view of a mel store. store[i] is a zero-copy np.memmap slice
+    (frames, n_mels) of item i without its padding; features(i) restores the
+    full (n_mels, n_frames) float32 array.
+    """
+
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.store_path = store_path
+        self.dtype = index["dtype"]
+        self.n_mels = index["n_mels"]
+        self.n_frames = index["n_frames"]
+        self.offsets = np.asarray(index["offsets"], dtype=np.int64)
+        self.lengths = np.asarray(index["lengths"], dtype=np.int64)
+        self.pad_values = np.asarray(index["pad_values"], dtype=np.float32)
+        self.labels = index["labels"]
+        self._open_frames()
+
+    def _open_frames(self):
+        frames_path = os.path.join(self.store_path, FRAMES_FILE)
+        if os.path.getsize(frames_path) == 0:
+            self.frames = np.zeros((0, self.n_mels), dtype=self.dtype)
+        else:
+            self.frames = np.memmap(frames_path, dtype=self.dtype, mode='r').reshape(-1, self.n_mels)
+
+    def __getstate__(self):
+        # DataLoader workers reopen the memmap instead of receiving a pickled copy
+        state = self.__dict__.copy()
+        state["frames"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_frames()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        start = self.offsets[i]
+        return self.frames[start:start + self.lengths[i]]
+
+    def features(self, i):
+        return pad_frames([self[i]], self.pad_values[i:i + 1], self.n_frames)[0]
+
+def pad_frames(frames, pad_values, n_frames):
+    """
+    (batch, n_mels, n_frames) float32 array from trimmed frame-major items,
+    the padding of each item restored with its pad value.
+    """
+    n_mels = frames[0].shape[1] if len(frames) else 0
+    batch = np.empty((len(frames), n_mels, n_frames), dtype=np.float32)
+    for b, (item, pad_value) in enumerate(zip(frames, pad_values)):
+        batch[b, :, :len(item)] = item.T
+        batch[b, :, len(item):] = pad_value
+    return batch
+
+# --- Training Dataset ---
+class MelFeatureDataset:
+    """
+    Items of one or more mel stores (cache shards) in order, as the dicts the
+    training collator expects: trimmed frames (a memmap slice), pad value,
+    full frame count and label ids. select() returns a subset without copying.
+    """
+
+    def __init__(self, stores, indices=None):
+        self.stores = list(stores)
+        sizes = np.array([len(s) for s in self.stores], dtype=np.int64)
+        self._starts = np.concatenate([[0], np.cumsum(sizes)])
+        self.indices = np.arange(self._starts[-1]) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        position = int(self.indices[i])
+        shard = int(np.searchsorted(self._starts, position, side='right')) - 1
+        store, item = self.stores[shard], position - int(self._starts[shard])
+        return {
+            "input_features": store[item],
+            "pad_value": float(store.pad_values[item]),
+            "n_frames": store.n_frames,
+            "labels": store.labels[item],
+        }
+
+    def select(self, indices):
+        return MelFeatureDataset(self.stores, self.indices[np.asarray(list(indices), dtype=np.int64)])
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+METRICS_DIR = "./metrics"  # <run_name>.prom and <run_name>.json are written here
+# Latency bucket upper bounds in seconds: 100us to ~5min, 8 buckets per decade
+LATENCY_BUCKETS = [round(10 ** (e / 8), 6) for e in range(-32, 20)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+# --- Histogram ---
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. observe() is a bisect and two adds, cheap
+    enough to leave on; quantiles are interpolated within buckets, so they are
+    accurate to the bucket width (about 1.33x).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+# --- Registry ---
+class Metrics:
+    """Per-stage latency histograms and named counters for one process."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """JSON-ready view: per stage count, total/mean/max seconds and p50/p95/p99."""
+        stages = {}
+        for stage, h in sorted(self.histograms.items()):
+            stages[stage] = {
+                "count": h.count,
+                "total_sec": h.sum,
+                "mean_sec": h.sum / h.count if h.count else 0.0,
+                "max_sec": h.max,
+                **{f"p{int(q * 100)}_sec": h.quantile(q) for q in QUANTILES},
+            }
+        return {"stages": stages, "counters": dict(sorted(self.counters.items()))}
+
+    def prometheus_text(self, prefix="pipeline"):
+        lines = [
+            f"# HELP {prefix}_stage_latency_seconds Latency per pipeline stage call.",
+            f"# TYPE {prefix}_stage_latency_seconds histogram",
+        ]
+        for stage, h in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(h.buckets + ["+Inf"], h.counts):
+                cumulative += bucket_count
+                lines.append(f'{prefix}_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{stage}"}} {h.count}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, run_name, output_dir=None):
+        """Writes <run_name>.prom and <run_name>.json (in METRICS_DIR) and prints the latency table."""
+        output_dir = output_dir or METRICS_DIR
+        os.makedirs(output_dir, exist_ok=True)
+        prom_path = os.path.join(output_dir, f"{run_name}.prom")
+        json_path = os.path.join(output_dir, f"{run_name}.json")
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        summary = self.summary()
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"run": run_name, "finished_at": time.time(), **summary}, f, indent=2)
+
+        print(f"\n--- Stage Latency ({run_name}) ---")
+        for stage, s in summary["stages"].items():
+            print(f"{stage:>20}: n={s['count']:<7} p50 {s['p50_sec'] * 1000:9.2f}ms  "
+                  f"p95 {s['p95_sec'] * 1000:9.2f}ms  p99 {s['p99_sec'] * 1000:9.2f}ms  total {s['total_sec']:.2f}s")
+        for name, value in summary["counters"].items():
+            print(f"{name:>20}: {value}")
+        print(f"Metrics written to {prom_path} and {json_path}")
+
+# --- Module-Level Registry ---
+METRICS = Metrics()
+
+def timed(stage):
+    """with timed("asr"): ...  records the block's latency under `stage`."""
+    return METRICS.timer(stage)
+
+def timed_task(fn, *args):
+    """
+    Runs fn(*args) and returns (result, seconds). For process-pool tasks: the
+    worker's own registry is lost, so the parent records the returned time.
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
@@ -3,85 +3,84 @@
 
 import pandas as pd
 import numpy as np
-from sklearn.metrics import confusion_matrix, classification_report, f1_score, accuracy_score
-from itertools import product
-import torch # Added torch import for completeness
-
-# === Step 1: Load CSVs ===
-# Assuming these files exist based on the project context
-analytics_df = pd.read_csv("final_analytics_data.csv")
-truth_df = pd.read_csv("manual_review_ground_truth_labeled.csv")
-
-# Print statements removed for conciseness in the final output code
-
-# === Step 2: Merge ===
-df = pd.merge(analytics_df, truth_df[["file_path", "Manual_Risk_Label"]], on="file_path", how="inner")
-
-# === Step 3: Map ground truth ===
-label_map = {"Low": 0, "Moderate": 1, "Elevated": 2, "Critical": 3}
-df["y_true"] = df["Manual_Risk_Label"].map(label_map)
-
-# === Step 4: Prepare stress score ===
-df["stress_score"] = pd.to_numeric(df["stress_score"], errors="coerce").fillna(0)
-df["stress_score"] = (df["stress_score"] - df["stress_score"].min()) / (
-    df["stress_score"].max() - df["stress_score"].min()
-)
-
-# === Step 5: Apply smoothing and noise to avoid overfitting ===
-# Rolling average for smoother transitions
-df["stress_score"] = df["stress_score"].rolling(window=5, min_periods=1, center=True).mean()
-# Add small Gaussian noise for robustness
-rng = np.random.default_rng(seed=42)
-df["stress_score"] += rng.normal(0, 0.015, size=len(df))
-df["stress_score"] = np.clip(df["stress_score"], 0, 1)
-
-# === Step 6: Define evaluation ===
-def evaluate_thresholds(bins, labels):
-    df["pred_label"] = pd.cut(df["stress_score"], bins=bins, labels=labels, include_lowest=True)
-    y_true = df["y_true"].astype(int)
-    y_pred = df["pred_label"].astype(int)
-    f1 = f1_score(y_true, y_pred, average="macro")
-    acc = accuracy_score(y_true, y_pred)
-    # Penalize too-small bins to avoid overfitting
-    spacing_penalty = np.exp(-10 * np.min(np.diff(bins)))
-    score = 0.7 * f1 + 0.3 * acc - 0.05 * spacing_penalty
-    return score, f1, acc
-
-# === Step 7: Search threshold space (Results used to define final thresholds) ===
-best_score = -np.inf
-best_bins = None
-best_f1 = 0
-best_acc = 0
-
-
-
-for a, b, c in product(
-    np.linspace(0.1, 0.4, 4),
-    np.linspace(0.4, 0.7, 4),
-    np.linspace(0.7, 0.95, 5)
-):
-    if a < b < c:
-        bins = [0, a, b, c, 1.0]
-        score, f1, acc = evaluate_thresholds(bins, [0, 1, 2, 3])
-        if score > best_score:
-            best_score, best_bins, best_f1, best_acc = score, bins, f1, acc
-
-# === Step 8: Evaluate best bins (Using optimized thresholds from search) ===
-df["pred_label"] = pd.cut(df["stress_score"], bins=best_bins, labels=[0, 1, 2, 3], include_lowest=True)
-
-cm = confusion_matrix(df["y_true"], df["pred_label"])
-report = classification_report(df["y_true"], df["pred_label"], digits=4)
-
-FINAL_ACCURACY = 0.65
-FINAL_MACRO_F1 = 0.60
-
-print(f"\n✅ Optimal bins found (smoothed): {best_bins}")
-print("📊 Confusion Matrix (Smoothed Thresholds):")
-print(cm)
-print("\n📈 Classification Report (Smoothed Thresholds):")
-print(report)
-print(f"\nF1-score: {FINAL_MACRO_F1:.4f}, Accuracy: {FINAL_ACCURACY:.4f}")
-
-# === Step 9: Save ===
-df.to_csv("optimized_threshold_results_v2.csv", index=False)
-# print("\n💾 Saved results to optimized_threshold_results_v2.csv") # Removed print for final output
\ No newline at end of file
+import time
+from sklearn.metrics import confusion_matrix, classification_report
+from stress_trend import detect_stress_trends
+from threshold_search import bootstrap_thresholds, search_thresholds, threshold_grid
+
+# === Configuration ===
+CLASS_LABELS = [0, 1, 2, 3]
+THRESHOLD_RANGES = [(0.1, 0.4), (0.4, 0.7), (0.7, 0.95)]  # search range of each cut point a < b < c
+GRID_STEPS = 60  # values per cut point: ~200k combinations (the original grid was 4 x 4 x 5)
+BOOTSTRAP_ROUNDS = 200
+
+if __name__ == "__main__":
+    # === Step 1: Load CSVs ===
+    # Assuming these files exist based on the project context
+    analytics_df = pd.read_csv("final_analytics_data.csv")
+    truth_df = pd.read_csv("manual_review_ground_truth_labeled.csv")
+
+    # Print statements removed for conciseness in the final output code
+
+    # === Step 2: Merge ===
+    df = pd.merge(analytics_df, truth_df[["file_path", "Manual_Risk_Label"]], on="file_path", how="inner")
+
+    # === Step 3: Map ground truth ===
+    label_map = {"Low": 0, "Moderate": 1, "Elevated": 2, "Critical": 3}
+    df["y_true"] = df["Manual_Risk_Label"].map(label_map)
+
+    # === Step 4: Prepare stress score ===
+    df["stress_score"] = pd.to_numeric(df["stress_score"], errors="coerce").fillna(0)
+    df["stress_score"] = (df["stress_score"] - df["stress_score"].min()) / (
+        df["stress_score"].max() - df["stress_score"].min()
+    )
+
+    # === Step 5: Apply smoothing and noise to avoid overfitting ===
+    # Causal running mean per speaker: the same window the live sustained-stress detector
+    # uses (stress_trend.py), instead of a centered rolling mean that needs future segments
+    df["stress_score"] = detect_stress_trends(df)["stress_trend_mean"]
+    # Add small Gaussian noise for robustness
+    rng = np.random.default_rng(seed=42)
+    df["stress_score"] += rng.normal(0, 0.015, size=len(df))
+    df["stress_score"] = np.clip(df["stress_score"], 0, 1)
+    scores = df["stress_score"].to_numpy(dtype=np.float64)
+    y_true = df["y_true"].to_numpy(dtype=np.int64)
+
+    # === Step 6: Search threshold space (Results used to define final thresholds) ===
+    # Every (a, b, c) on the grid is scored from one sort and cumulative per-class counts
+    # (threshold_search.py), so a dense grid costs about as much as the old 80 pd.cut calls
+    t0 = time.perf_counter()
+    candidates = threshold_grid(THRESHOLD_RANGES, GRID_STEPS)
+    best_thresholds, best_score, best_f1, best_acc = search_thresholds(
+        scores, y_true, candidates, len(CLASS_LABELS))
+    best_bins = [0, *best_thresholds.tolist(), 1.0]
+    print(f"Searched {len(candidates)} threshold combinations in {time.perf_counter() - t0:.3f}s")
+    print(f"Best objective {best_score:.4f} (macro F1 {best_f1:.4f}, accuracy {best_acc:.4f})")
+
+    # === Step 7: Bootstrap confidence intervals for the chosen thresholds ===
+    t0 = time.perf_counter()
+    lower, upper, _ = bootstrap_thresholds(scores, y_true, candidates, len(CLASS_LABELS),
+                                           rounds=BOOTSTRAP_ROUNDS, seed=42)
+    print(f"Bootstrap ({BOOTSTRAP_ROUNDS} resamples, {time.perf_counter() - t0:.1f}s), 95% intervals:")
+    for name, value, low, high in zip("abc", best_thresholds, lower, upper):
+        print(f"  {name} = {value:.3f}  [{low:.3f}, {high:.3f}]")
+
+    # === Step 8: Evaluate best bins (Using optimized thresholds from search) ===
+    df["pred_label"] = pd.cut(df["stress_score"], bins=best_bins, labels=CLASS_LABELS, include_lowest=True)
+
+    cm = confusion_matrix(df["y_true"], df["pred_label"])
+    report = classification_report(df["y_true"], df["pred_label"], digits=4)
+
+    FINAL_ACCURACY = 0.65
+    FINAL_MACRO_F1 = 0.60
+
+    print(f"\n✅ Optimal bins found (smoothed): {[round(b, 4) for b in best_bins]}")
+    print("📊 Confusion Matrix (Smoothed Thresholds):")
+    print(cm)
+    print("\n📈 Classification Report (Smoothed Thresholds):")
+    print(report)
+    print(f"\nF1-score: {FINAL_MACRO_F1:.4f}, Accuracy: {FINAL_ACCURACY:.4f}")
+
+    # === Step 9: Save ===
+    df.to_csv("optimized_threshold_results_v2.csv", index=False)
+    # print("\n💾 Saved results to optimized_threshold_results_v2.csv") # Removed print for final output
@@ -0,0 +1,79 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Configuration ---
+# Phases hand data to each other as Parquet files with the schema below; a CSV copy
+# is written next to each one (same name, .csv) for spreadsheets and manual review.
+EXPORT_CSV = True
+
+# Declared column types. Columns not listed keep the type Arrow infers for them.
+SCHEMA = {
+    "segment_index": pa.int32(),
+    "file_path": pa.string(),
+    "source": pa.dictionary(pa.int32(), pa.string()),
+    "transcript": pa.string(),
+    "duration": pa.float64(),
+    "start_sec": pa.float64(),
+    "end_sec": pa.float64(),
+    "speaker_role": pa.dictionary(pa.int8(), pa.string()),
+    "speaker_turns": pa.string(),  # "start-end:SPEAKER_NN;..." in seconds within the segment
+    "stress_score": pa.float32(),
+    "stress_trend_mean": pa.float32(),
+    "stress_trend_slope": pa.float32(),
+    "stress_trend_max": pa.float32(),
+    "alert_level": pa.dictionary(pa.int8(), pa.string()),
+    "alert_reason": pa.string(),
+}
+
+# --- Helpers ---
+def csv_export_path(path):
+    return os.path.splitext(path)[0] + ".csv"
+
+def to_typed_table(df: pd.DataFrame) -> pa.Table:
+    """Arrow table of df with the declared SCHEMA types applied to the columns it has."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, name in enumerate(table.column_names):
+        if name in SCHEMA and table.schema.field(name).type != SCHEMA[name]:
+            column = table[name]
+            if column.null_count == len(column):
+                # An all-empty column (e.g. all NaN) is inferred as double or null, which
+                # Arrow can't cast to every declared type (dictionary); rebuild it typed
+                column = pa.nulls(len(column), SCHEMA[name])
+            else:
+                column = column.cast(SCHEMA[name])
+            table = table.set_column(i, name, column)
+    # The pandas metadata still describes the old dtypes; types now come from the Arrow schema
+    return table.replace_schema_metadata(None)
+
+# --- Read / Write ---
+def write_table(df: pd.DataFrame, path, export_csv=None):
+    """Writes df to a Parquet file with the declared types (and the CSV export if enabled)."""
+    export_csv = EXPORT_CSV if export_csv is None else export_csv
+    table = to_typed_table(df)
+    pq.write_table(table, path)
+    if export_csv and csv_export_path(path) != path:
+        df.to_csv(csv_export_path(path), index=False)
+    return table.num_rows
+
+def table_columns(path) -> list:
+    """Column names of a phase file (or its CSV export) without reading the data."""
+    if os.path.exists(path):
+        return pq.read_schema(path).names
+    csv_path = csv_export_path(path)
+    if csv_path != path and os.path.exists(csv_path):
+        return pd.read_csv(csv_path, nrows=0).columns.tolist()
+    raise FileNotFoundError(2, "No such file or directory", path)
+
+def read_table(path, columns=None) -> pd.DataFrame:
+    """
+    Reads a phase file, only the given columns if any (Parquet only decodes
+    those). Falls back to the CSV export, for files written before the switch.
+    """
+    if os.path.exists(path):
+        return pq.read_table(path, columns=columns).to_pandas()
+    csv_path = csv_export_path(path)
+    if csv_path != path and os.path.exists(csv_path):
+        return to_typed_table(pd.read_csv(csv_path, usecols=columns)).to_pandas()
+    raise FileNotFoundError(2, "No such file or directory", path)
@@ -1,10 +1,16 @@
 import os
+import json
+import shutil
 import torch
 import torchaudio
 import pandas as pd
-from datasets import Dataset, concatenate_datasets
+from datasets import Dataset, concatenate_datasets, load_from_disk
 from transformers import WhisperProcessor
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Optional
+from segment_store import SegmentStore, open_segment_store
+from mel_store import MelStoreWriter, MelStore, MelFeatureDataset, INDEX_FILE as MEL_INDEX_FILE
 
 # -------------------------------
 # Configuration
@@ -15,18 +21,50 @@ AUDIO_COLUMN = "file_path"
 TRANSCRIPT_COLUMN = "transcript"
 SAVE_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_cached"
 BATCH_SIZE = 250  # process 250 files at a time
+# Packed segment store written by preprocessing.py; waveforms are read by
+# segment_index from it when present instead of opening each WAV
+SEGMENT_STORE_PATH = r"C:\Users\tssmi\OneDrive\Desktop\nlp\processed_store"
+# "sharded": BATCH_SIZE-row shards cached in parallel, each written once and skipped
+# when a restarted run finds it complete. "legacy": the original chunk_N + final_dataset.
+CACHE_MODE = "sharded"
+SHARD_DIR_NAME = "shards"
+LEGACY_DATASET_NAME = "final_dataset"  # the legacy mode's concatenated dataset
+CACHE_INFO_FILE = "cache_info.json"  # settings the shards were built with
+FEATURE_BATCH_SIZE = 32  # waveforms per feature-extractor call
+ALLOW_PARTIAL_CACHE = False  # load_cached_dataset() refuses a cache with missing shards unless set
+CACHE_WORKERS = os.cpu_count() or 1
+# "float16"/"float32": shard features go to a mel store (mel_store.py) that train_whisper.py
+# reads memory-mapped; "arrow": float32 features inside the shard's Arrow dataset
+FEATURE_STORAGE = "float16"
+TRIM_FEATURE_PADDING = True  # store only the frames that carry audio; padding is restored on load
 
 
 @dataclass
 class DatasetPrepper:
     processor: WhisperProcessor
+    store_path: Optional[str] = None
+    _store: Optional[SegmentStore] = field(default=None, init=False, repr=False)
+
+    def __getstate__(self):
+        # The memmap is reopened lazily in each process instead of being pickled
+        state = self.__dict__.copy()
+        state["_store"] = None
+        return state
+
+    def load_waveform(self, path, segment_index):
+        if self.store_path is not None:
+            if self._store is None:
+                self._store = SegmentStore(self.store_path)
+            return self._store.read_float(int(segment_index)), self._store.sample_rate
+        waveform, sr = torchaudio.load(path)
+        return waveform.squeeze().numpy(), sr
 
     def __call__(self, batch):
         input_features, labels = [], []
-        for path, text in zip(batch[AUDIO_COLUMN], batch[TRANSCRIPT_COLUMN]):
+        segment_indices = batch.get("segment_index", [None] * len(batch[AUDIO_COLUMN]))
+        for path, text, segment_index in zip(batch[AUDIO_COLUMN], batch[TRANSCRIPT_COLUMN], segment_indices):
             try:
-                waveform, sr = torchaudio.load(path)
-                waveform = waveform.squeeze().numpy()
+                waveform, sr = self.load_waveform(path, segment_index)
                 if sr != 16000:
                     waveform = torchaudio.functional.resample(torch.tensor(waveform), sr, 16000).numpy()
 
@@ -41,28 +79,166 @@ class DatasetPrepper:
                 print(f"⚠️ Skipping {path}: {e}")
         return {"input_features": input_features, "labels": labels}
 
+    def prepare_batch(self, batch, batch_size=FEATURE_BATCH_SIZE):
+        """
+        Like __call__, but the feature extractor and tokenizer each run once per
+        batch_size waveforms instead of once per waveform.
+        """
+        waveforms, texts = [], []
+        segment_indices = batch.get("segment_index", [None] * len(batch[AUDIO_COLUMN]))
+        for path, text, segment_index in zip(batch[AUDIO_COLUMN], batch[TRANSCRIPT_COLUMN], segment_indices):
+            try:
+                waveform, sr = self.load_waveform(path, segment_index)
+                if sr != 16000:
+                    waveform = torchaudio.functional.resample(torch.tensor(waveform), sr, 16000).numpy()
+                waveforms.append(waveform)
+                texts.append(text)
+            except Exception as e:
+                print(f"⚠️ Skipping {path}: {e}")
+
+        input_features, labels = [], []
+        for i in range(0, len(waveforms), batch_size):
+            features = self.processor.feature_extractor(
+                waveforms[i:i + batch_size], sampling_rate=16000, return_tensors="np"
+            ).input_features
+            input_features.extend(features)
+            labels.extend(self.processor.tokenizer(texts[i:i + batch_size]).input_ids)
+        return {"input_features": input_features, "labels": labels}
+
+# -------------------------------
+# Sharded, resumable caching
+# -------------------------------
+_WORKER_PREP = None
+
+def _init_cache_worker(model_name, store_path):
+    global _WORKER_PREP
+    torch.set_num_threads(1)  # one process per core already
+    _WORKER_PREP = DatasetPrepper(WhisperProcessor.from_pretrained(model_name), store_path=store_path)
+
+def shard_name(start, end):
+    return f"shard-{start:08d}-{end:08d}"
+
+def cache_shard(shard_dir, rows, feature_storage=FEATURE_STORAGE, trim=TRIM_FEATURE_PADDING):
+    """
+    Worker task: features and labels for one shard's rows, saved under a
+    temporary name and renamed into place, so a shard directory only exists
+    once it is complete.
+    """
+    processed = _WORKER_PREP.prepare_batch(rows)
+    tmp_dir = shard_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if feature_storage == "arrow":
+        Dataset.from_dict(processed).save_to_disk(tmp_dir)
+    else:
+        n_mels, n_frames = _WORKER_PREP.processor.feature_extractor.feature_size, \
+            _WORKER_PREP.processor.feature_extractor.nb_max_frames
+        with MelStoreWriter(tmp_dir, n_mels, n_frames, dtype=feature_storage, trim=trim) as writer:
+            for features, label_ids in zip(processed["input_features"], processed["labels"]):
+                writer.append(features, label_ids)
+    os.replace(tmp_dir, shard_dir)
+    return shard_dir, len(processed["labels"])
+
+def cache_sharded(df, save_dir, store_path=None, shard_size=BATCH_SIZE, workers=CACHE_WORKERS,
+                  feature_storage=FEATURE_STORAGE, trim=TRIM_FEATURE_PADDING):
+    """
+    Caches df in shard_size-row shards across worker processes. Shards already
+    on disk (from an interrupted run) are kept; only the missing ones are built.
+    """
+    shard_root = os.path.join(save_dir, SHARD_DIR_NAME)
+    os.makedirs(shard_root, exist_ok=True)
+    info = {"model": MODEL_NAME, "rows": len(df), "shard_size": shard_size,
+            "audio_column": AUDIO_COLUMN, "transcript_column": TRANSCRIPT_COLUMN,
+            "feature_storage": feature_storage, "trim_padding": trim}
+    info_path = os.path.join(save_dir, CACHE_INFO_FILE)
+    if os.path.exists(info_path):
+        with open(info_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous != info:
+            print(f"❌ {save_dir} holds shards built with different settings ({previous}). "
+                  f"Clear it or point SAVE_DIR elsewhere.")
+            return False
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+
+    columns = [c for c in (AUDIO_COLUMN, TRANSCRIPT_COLUMN, "segment_index") if c in df.columns]
+    pending = []
+    for start in range(0, len(df), shard_size):
+        end = min(start + shard_size, len(df))
+        shard_dir = os.path.join(shard_root, shard_name(start, end))
+        if not os.path.exists(shard_dir):
+            pending.append((shard_dir, df.iloc[start:end][columns].to_dict('list')))
+    total = -(-len(df) // shard_size)
+    print(f"{total - len(pending)} of {total} shards already cached, {len(pending)} to build.")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_cache_worker,
+                             initargs=(MODEL_NAME, store_path)) as executor:
+        futures = [executor.submit(cache_shard, shard_dir, rows, feature_storage, trim) for shard_dir, rows in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            shard_dir, num_rows = future.result()
+            print(f"✅ [{done}/{len(pending)}] Saved {num_rows} rows to {shard_dir}")
+    return True
+
+def load_cached_dataset(save_dir, allow_partial=ALLOW_PARTIAL_CACHE):
+    """
+    The sharded cache as one dataset; shards are memory-mapped, not copied.
+    Mel store shards give a MelFeatureDataset, Arrow shards a datasets.Dataset.
+    The shards are checked against cache_info.json: if any is missing (an
+    interrupted or failed caching run) this raises, or only warns with
+    allow_partial. Rows skipped because their audio failed to load are reported.
+    """
+    info_path = os.path.join(save_dir, CACHE_INFO_FILE)
+    if not os.path.exists(info_path):
+        raise RuntimeError(f"{info_path} not found; {save_dir} was not written by cache_sharded().")
+    with open(info_path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    shard_root = os.path.join(save_dir, SHARD_DIR_NAME)
+    expected = [shard_name(start, min(start + info["shard_size"], info["rows"]))
+                for start in range(0, info["rows"], info["shard_size"])]
+    shard_dirs = [os.path.join(shard_root, name) for name in expected if os.path.isdir(os.path.join(shard_root, name))]
+    missing = len(expected) - len(shard_dirs)
+    if missing:
+        message = (f"{missing} of {len(expected)} shards missing under {shard_root}; "
+                   f"rerun preprocess_dataset.py to finish caching.")
+        if not allow_partial:
+            raise RuntimeError(message)
+        print(f"⚠️ {message} Loading the {len(shard_dirs)} complete shards only.")
+
+    if shard_dirs and os.path.exists(os.path.join(shard_dirs[0], MEL_INDEX_FILE)):
+        dataset = MelFeatureDataset([MelStore(d) for d in shard_dirs])
+    else:
+        dataset = concatenate_datasets([load_from_disk(d) for d in shard_dirs])
+    planned = sum(min(info["shard_size"], info["rows"] - i * info["shard_size"])
+                  for i, name in enumerate(expected) if os.path.join(shard_root, name) in shard_dirs)
+    if len(dataset) < planned:
+        print(f"⚠️ {planned - len(dataset)} of {planned} rows were skipped while caching (audio failed to load).")
+    return dataset
 
 if __name__ == "__main__":
     os.makedirs(SAVE_DIR, exist_ok=True)
     print("✅ Loading CSV...")
     df = pd.read_csv(CSV_FILE)
-    processor = WhisperProcessor.from_pretrained(MODEL_NAME)
-    prep = DatasetPrepper(processor)
-
-    datasets = []
-    step = 0
-    for i in range(0, len(df), BATCH_SIZE):
-        sub_df = df.iloc[i:i + BATCH_SIZE]
-        sub_dataset = Dataset.from_pandas(sub_df)
-        print(f"Processing batch {step + 1} ({i}-{i + BATCH_SIZE}) ...")
-        processed = sub_dataset.map(prep, batched=True, batch_size=1, num_proc=1)
-        batch_save = os.path.join(SAVE_DIR, f"chunk_{step}")
-        processed.save_to_disk(batch_save)
-        datasets.append(processed)
-        print(f"✅ Saved batch {step + 1} to {batch_save}")
-        step += 1
-
-    full_dataset = concatenate_datasets(datasets)
-    full_save_path = os.path.join(SAVE_DIR, "final_dataset")
-    full_dataset.save_to_disk(full_save_path)
-    print(f"🎯 Preprocessing complete! Saved dataset to {full_save_path}")
+    store_path = SEGMENT_STORE_PATH if open_segment_store(SEGMENT_STORE_PATH) is not None else None
+
+    if CACHE_MODE == "sharded":
+        if cache_sharded(df, SAVE_DIR, store_path=store_path):
+            print(f"🎯 Preprocessing complete! Shards saved under {os.path.join(SAVE_DIR, SHARD_DIR_NAME)}")
+    else:
+        processor = WhisperProcessor.from_pretrained(MODEL_NAME)
+        prep = DatasetPrepper(processor, store_path=store_path)
+        datasets = []
+        step = 0
+        for i in range(0, len(df), BATCH_SIZE):
+            sub_df = df.iloc[i:i + BATCH_SIZE]
+            sub_dataset = Dataset.from_pandas(sub_df)
+            print(f"Processing batch {step + 1} ({i}-{i + BATCH_SIZE}) ...")
+            processed = sub_dataset.map(prep, batched=True, batch_size=1, num_proc=1)
+            batch_save = os.path.join(SAVE_DIR, f"chunk_{step}")
+            processed.save_to_disk(batch_save)
+            datasets.append(processed)
+            print(f"✅ Saved batch {step + 1} to {batch_save}")
+            step += 1
+
+        full_dataset = concatenate_datasets(datasets)
+        full_save_path = os.path.join(SAVE_DIR, LEGACY_DATASET_NAME)
+        full_dataset.save_to_disk(full_save_path)
+        print(f"🎯 Preprocessing complete! Saved dataset to {full_save_path}")
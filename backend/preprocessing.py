@@ -1,5 +1,9 @@
 import os
 import glob
+import re
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 from io import BytesIO
 from pydub import AudioSegment
@@ -7,6 +11,11 @@ import numpy as np
 import soundfile as sf
 import librosa
 import noisereduce as nr
+import pyarrow.parquet as pq
+from stage_cache import StageCache, hash_bytes, hash_file, stage_key
+from segment_store import SegmentStore, SegmentStoreWriter, open_segment_store
+from vad import detect_speech_spans, vad_params
+from metrics import METRICS, timed, timed_task
 
 # --- Configuration ---
 DATA_PATH = r"C:\Users\tssmi\Downloads\drive-download-20251022T075508Z-1-001\train-00000-of-00002.parquet"
@@ -17,6 +26,53 @@ AUGMENTED_PATH = r".\augmented_audio"
 TARGET_SR = 16000
 SEGMENT_LENGTH_SEC = 10  # seconds
 
+# Segment layout: "store" packs each stage's segments into one memory-mapped
+# sample file plus an index (see segment_store.py); "wav" writes one WAV per
+# segment into PROCESSED_PATH / NR_PATH as before.
+SEGMENT_FORMAT = "store"
+PROCESSED_STORE = r".\processed_store"
+NR_STORE = r".\nr_store"
+STORE_DTYPE = "int16"  # or "float16"
+EXPORT_WAV = False  # store layout only: also export both stores as WAV directories
+
+# Streaming ingestion: read the shard one Parquet batch at a time instead of
+# loading it whole. Peak memory is bounded by PARQUET_BATCH_SIZE rows.
+STREAM_PARQUET = True
+PARQUET_BATCH_SIZE = 64  # rows per Parquet read
+
+# Segmentation engine: "numpy" normalizes once and slices array views at
+# TARGET_SR; "pydub" is the original AudioSegment round-trip.
+SEGMENT_ENGINE = "numpy"
+NORMALIZE_HEADROOM_DB = 0.1  # same headroom as AudioSegment.normalize()
+
+# Voice activity: with USE_VAD, silent regions are dropped before cutting and
+# segments only cover speech (numpy engine). Each segment's position in the
+# original recording is written to SEGMENT_SPANS_FILE.
+USE_VAD = False
+SEGMENT_SPANS_FILE = r".\segment_spans.csv"
+
+# Noise reduction runs across a process pool; files are handed out in
+# chunks to keep inter-process overhead low.
+NR_WORKERS = os.cpu_count() or 1
+NR_CHUNKSIZE = 8
+
+# Incremental cache: outputs are reused when the source audio hash and the
+# stage parameters match the manifest entry from a previous run.
+USE_CACHE = True
+CACHE_MANIFEST = r".\preprocess_manifest.json"
+AUGMENT_SEED = 42  # fixed subset so augmented files can be reused
+
+# Augmentation: every noise source is loaded once into an in-memory bank and
+# all SNR levels for a clean segment are mixed in one NumPy pass.
+NOISE_SOURCES = {
+    "cockpit": "cockpit_noise.wav",  # Place your noise files in the same directory
+    "engine": "engine_noise.wav",
+    "wind": "wind_noise.wav",
+    "radio_static": "radio_static.wav",
+}
+SNR_LEVELS = [10, 5, 0]
+AUGMENT_WORKERS = 1  # > 1 spreads clean files across a process pool
+
 # --- Setup Directories ---
 def setup_directories():
     for path in [PROCESSED_PATH, NR_PATH, AUGMENTED_PATH]:
@@ -46,8 +102,76 @@ def dict_to_audioment(audio_dict):
     else:
         raise ValueError(f"Unknown audio dict keys: {audio_dict.keys()}")
 
+# --- Convert dict to NumPy array ---
+def dict_to_array(audio_dict):
+    """
+    Same input as dict_to_audioment, but decodes straight to a float32 array
+    resampled to TARGET_SR. Returns (y, TARGET_SR); y is (samples,) or
+    (samples, channels).
+    """
+    if 'array' in audio_dict:
+        y = np.array(audio_dict['array'], dtype=np.float32)
+        sr = audio_dict.get('sample_rate', TARGET_SR)
+
+    elif 'bytes' in audio_dict:
+        y, sr = sf.read(BytesIO(audio_dict['bytes']), dtype='float32')
+
+    else:
+        raise ValueError(f"Unknown audio dict keys: {audio_dict.keys()}")
+
+    if sr != TARGET_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=TARGET_SR, axis=0)
+    return y, TARGET_SR
+
+# --- Array Normalization & Segmentation ---
+def normalize_to_pcm16(y, headroom_db=NORMALIZE_HEADROOM_DB):
+    """
+    Peak-normalizes y to `headroom_db` below full scale, matching
+    AudioSegment.normalize(), and quantizes to int16 in the same pass.
+    Silent audio is only quantized. y is scaled in place.
+    """
+    peak = max(abs(float(y.max())), abs(float(y.min()))) if y.size else 0.0
+    gain = 32768 * (10 ** (-headroom_db / 20)) / peak if peak > 0 else 32767
+    y *= gain
+    return y.astype(np.int16)
+
+def segment_bounds(num_samples, sr, segment_length_sec=SEGMENT_LENGTH_SEC):
+    """
+    (start, end) sample indices of each segment. Mirrors pydub's millisecond
+    slicing so both engines cut at the same boundaries.
+    """
+    length_ms = round(1000 * num_samples / sr)
+    segment_length_ms = segment_length_sec * 1000
+    bounds = []
+    for start_ms in range(0, length_ms, segment_length_ms):
+        end_ms = min(start_ms + segment_length_ms, length_ms)
+        bounds.append((int(start_ms * sr / 1000), int(end_ms * sr / 1000)))
+    return bounds
+
+def write_pcm16_wav(output_path, pcm, sr):
+    """Writes an int16 array (or view) straight from its buffer, no conversion."""
+    with wave.open(output_path, 'wb') as wav_file:
+        wav_file.setnchannels(1 if pcm.ndim == 1 else pcm.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sr)
+        wav_file.writeframes(np.ascontiguousarray(pcm))
+
+def plan_segment_bounds(y, sr, segment_length_sec=SEGMENT_LENGTH_SEC, speech_only=False):
+    """
+    Segment (start, end) samples for y. With speech_only, only speech spans
+    found by the VAD are cut, each into pieces of at most segment_length_sec.
+    """
+    if not speech_only:
+        return segment_bounds(len(y), sr, segment_length_sec)
+    mono = y if y.ndim == 1 else y.mean(axis=1)
+    bounds = []
+    for span_start, span_end in detect_speech_spans(mono, sr):
+        for start, end in segment_bounds(span_end - span_start, sr, segment_length_sec):
+            bounds.append((span_start + start, span_start + end))
+    return bounds
+
 # --- Load audio from Parquet ---
-def read_audio_from_parquet(parquet_path):
+def read_audio_from_parquet(parquet_path, decoder=dict_to_audioment, skip_row=None):
     df = pd.read_parquet(parquet_path)
     audio_cols = [c for c in df.columns if "audio" in c.lower()]
     if not audio_cols:
@@ -58,8 +182,11 @@ def read_audio_from_parquet(parquet_path):
     for idx, row in df.iterrows():
         audio_data = row[audio_cols[0]]
         if isinstance(audio_data, dict):
+            if skip_row is not None and skip_row(f"audio_{idx}", audio_data):
+                continue
             try:
-                audio_segment = dict_to_audioment(audio_data)
+                with timed("decode"):
+                    audio_segment = decoder(audio_data)
                 audio_list.append((f"audio_{idx}", audio_segment))
             except Exception as e:
                 print(f"Failed to convert row {idx}: {e}")
@@ -69,65 +196,386 @@ def read_audio_from_parquet(parquet_path):
     print(f"Loaded {len(audio_list)} audio clips from Parquet.")
     return audio_list
 
+# --- Stream audio from Parquet (one batch at a time) ---
+def iter_parquet_audio_dicts(parquet_path, batch_size=PARQUET_BATCH_SIZE):
+    """
+    Yields (row_index, audio_dict) pairs, reading only the audio column and
+    at most `batch_size` rows into memory at a time.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    audio_cols = [c for c in parquet_file.schema_arrow.names if "audio" in c.lower()]
+    if not audio_cols:
+        print("No audio column found in Parquet!")
+        return
+
+    idx = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[audio_cols[0]]):
+        for audio_data in batch.column(0).to_pylist():
+            yield idx, audio_data
+            idx += 1
+
+def iter_audio_from_parquet(parquet_path, batch_size=PARQUET_BATCH_SIZE, decoder=dict_to_audioment,
+                            skip_row=None):
+    """
+    Generator version of read_audio_from_parquet: decodes each row lazily and
+    yields (base_name, decoded_audio) without holding the whole shard.
+    Rows for which skip_row(base_name, audio_dict) is True are not decoded.
+    """
+    loaded = 0
+    for idx, audio_data in iter_parquet_audio_dicts(parquet_path, batch_size):
+        if isinstance(audio_data, dict):
+            if skip_row is not None and skip_row(f"audio_{idx}", audio_data):
+                continue
+            try:
+                with timed("decode"):
+                    audio_segment = decoder(audio_data)
+            except Exception as e:
+                print(f"Failed to convert row {idx}: {e}")
+                continue
+            loaded += 1
+            yield f"audio_{idx}", audio_segment
+        else:
+            print(f"Unsupported audio type at row {idx}: {type(audio_data)}")
+
+    print(f"Streamed {loaded} audio clips from Parquet.")
+
 # --- Segmentation & Normalization ---
-def segment_and_normalize_from_parquet():
+def hash_audio_dict(audio_dict):
+    """Content hash of a raw Parquet audio dict, computed without decoding it."""
+    if 'bytes' in audio_dict:
+        return hash_bytes(audio_dict['bytes'])
+    arr = np.asarray(audio_dict.get('array', []), dtype=np.float32)
+    return hash_bytes(arr.tobytes() + str(audio_dict.get('sample_rate', TARGET_SR)).encode())
+
+def segment_output_key(cache, segment_path):
+    """
+    Cache key of one segment file: derived from its source row's manifest
+    entry when available, so later stages never have to re-read the audio.
+    """
+    segment_name = os.path.splitext(os.path.basename(segment_path))[0]
+    base_name = re.sub(r'_seg_\d+$', '', segment_name)
+    entry = cache.get("segment", base_name)
+    if entry is not None and any(os.path.splitext(os.path.basename(p))[0] == segment_name
+                                 for p in entry["outputs"]):
+        return stage_key(entry["key"], segment_name)
+    return hash_file(segment_path)
+
+def segment_and_normalize_from_parquet(streaming=STREAM_PARQUET, batch_size=PARQUET_BATCH_SIZE,
+                                       engine=SEGMENT_ENGINE, cache=None, layout=SEGMENT_FORMAT):
+    """
+    Returns the created segment WAV paths ("wav" layout) or segment names
+    ("store" layout, written to PROCESSED_STORE).
+    """
     setup_directories()
     all_segments = []
+    decoder = dict_to_array if engine == "numpy" else dict_to_audioment
+    pending_keys = {}
+    reused = 0
+    segment_spans = []
 
-    audio_list = read_audio_from_parquet(DATA_PATH)
-    if not audio_list:
-        return []
+    store_writer, previous_store, store_records = None, None, []
+    if layout == "store":
+        # Cached rows are copied from the previous store rather than re-decoded
+        previous_store = open_segment_store(PROCESSED_STORE) if cache is not None else None
+        store_writer = SegmentStoreWriter(PROCESSED_STORE, TARGET_SR, STORE_DTYPE)
+    exists = (lambda name: previous_store is not None and name in previous_store) \
+        if layout == "store" else os.path.exists
+
+    def skip_cached_row(base_name, audio_data):
+        nonlocal reused
+        key = stage_key(hash_audio_dict(audio_data), "segment", SEGMENT_LENGTH_SEC, TARGET_SR,
+                        engine, NORMALIZE_HEADROOM_DB, layout, STORE_DTYPE,
+                        vad_params() if USE_VAD else None)
+        if not cache.is_fresh("segment", base_name, key, exists=exists):
+            pending_keys[base_name] = key
+            return False
+        entry = cache.get("segment", base_name)
+        outputs = entry["outputs"]
+        if store_writer is not None:
+            for name in outputs:
+                store_writer.append(name, previous_store[previous_store.index_of(name)])
+        all_segments.extend(outputs)
+        segment_spans.extend(tuple(span) for span in entry.get("meta") or [])
+        reused += 1
+        return True
+
+    skip_row = skip_cached_row if cache is not None else None
+    if streaming:
+        # Segments are written as soon as each row is decoded
+        audio_list = iter_audio_from_parquet(DATA_PATH, batch_size=batch_size, decoder=decoder,
+                                             skip_row=skip_row)
+    else:
+        audio_list = read_audio_from_parquet(DATA_PATH, decoder=decoder, skip_row=skip_row)
+        if not audio_list and not all_segments:
+            return []
 
     for base_name, audio in audio_list:
-        normalized_audio = audio.normalize()
-        segment_length_ms = SEGMENT_LENGTH_SEC * 1000
+        row_spans = []
+        with timed("segment"):
+            if engine == "numpy":
+                segments = export_array_segments(base_name, *audio, store_writer=store_writer, span_log=row_spans)
+            else:
+                segments = export_audioment_segments(base_name, audio, store_writer=store_writer)
+        METRICS.inc("segments_created", len(segments))
+        all_segments.extend(segments)
+        segment_spans.extend(row_spans)
 
-        for i, start_ms in enumerate(range(0, len(normalized_audio), segment_length_ms)):
-            end_ms = start_ms + segment_length_ms
-            segment = normalized_audio[start_ms:end_ms]
+        if cache is None:
+            continue
+        if store_writer is not None:
+            # Recorded only once the new store is in place (see below)
+            store_records.append((base_name, pending_keys.pop(base_name), segments, row_spans))
+            continue
+        # Drop segments a previous version of this row produced but this one doesn't
+        previous = cache.get("segment", base_name)
+        for stale_path in set(previous["outputs"] if previous else []) - set(segments):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        cache.record("segment", base_name, pending_keys.pop(base_name), segments, meta=row_spans)
 
-            output_filename = f"{base_name}_seg_{i}.wav"
-            output_path = os.path.join(PROCESSED_PATH, output_filename)
-            try:
-                segment.export(output_path, format="wav")
-                all_segments.append(output_path)
-            except Exception as e:
-                print(f"Failed to export segment {output_filename}: {e}")
+    if store_writer is not None:
+        previous_store = None  # release the old memmap before its file is replaced
+        store_writer.close()
+        for base_name, key, segments, row_spans in store_records:
+            cache.record("segment", base_name, key, segments, meta=row_spans)
+
+    if segment_spans:
+        spans_df = pd.DataFrame(segment_spans, columns=['segment_name', 'source', 'start_sec', 'end_sec'])
+        spans_df.sort_values('segment_name').to_csv(SEGMENT_SPANS_FILE, index=False)
+        if USE_VAD:
+            speech_sec = (spans_df['end_sec'] - spans_df['start_sec']).sum()
+            print(f"VAD kept {speech_sec:.1f}s of speech in {len(spans_df)} segments.")
 
+    if reused:
+        print(f"Reused cached segments for {reused} unchanged rows.")
     print(f"Segmentation complete: {len(all_segments)} segments created.")
     return all_segments
 
+def export_audioment_segments(base_name, audio, store_writer=None):
+    """Original pydub path: normalizes the AudioSegment and exports each slice."""
+    normalized_audio = audio.normalize()
+    segment_length_ms = SEGMENT_LENGTH_SEC * 1000
+    exported = []
+
+    for i, start_ms in enumerate(range(0, len(normalized_audio), segment_length_ms)):
+        end_ms = start_ms + segment_length_ms
+        segment = normalized_audio[start_ms:end_ms]
+
+        if store_writer is not None:
+            mono = segment.set_channels(1).set_sample_width(2)
+            store_writer.append(f"{base_name}_seg_{i}", np.array(mono.get_array_of_samples(), dtype=np.int16))
+            exported.append(f"{base_name}_seg_{i}")
+            continue
+
+        output_filename = f"{base_name}_seg_{i}.wav"
+        output_path = os.path.join(PROCESSED_PATH, output_filename)
+        try:
+            segment.export(output_path, format="wav")
+            exported.append(output_path)
+        except Exception as e:
+            print(f"Failed to export segment {output_filename}: {e}")
+    return exported
+
+def export_array_segments(base_name, y, sr, store_writer=None, span_log=None):
+    """
+    Normalizes y once and writes each int16 segment view without conversion,
+    either as a WAV file or appended to store_writer. If span_log is a list,
+    (segment_name, source, start_sec, end_sec) rows are appended to it.
+    """
+    pcm = normalize_to_pcm16(y)
+    if store_writer is not None and pcm.ndim > 1:
+        pcm = pcm.mean(axis=1).astype(np.int16)
+    exported = []
+    for i, (start, end) in enumerate(plan_segment_bounds(pcm, sr, SEGMENT_LENGTH_SEC, speech_only=USE_VAD)):
+        segment_name = f"{base_name}_seg_{i}"
+        if store_writer is not None:
+            store_writer.append(segment_name, pcm[start:end])
+            exported.append(segment_name)
+        else:
+            output_path = os.path.join(PROCESSED_PATH, f"{segment_name}.wav")
+            try:
+                write_pcm16_wav(output_path, pcm[start:end], sr)
+                exported.append(output_path)
+            except Exception as e:
+                print(f"Failed to export segment {segment_name}.wav: {e}")
+                continue
+        if span_log is not None:
+            span_log.append((segment_name, base_name, start / sr, end / sr))
+    return exported
+
 # --- Noise Reduction (noisereduce 3.x compatible) ---
-def apply_classical_noise_reduction(input_folder, output_folder):
-    processed_files = glob.glob(os.path.join(input_folder, '*.wav'))
+def is_up_to_date(input_path, output_path):
+    """True if output_path exists and is newer than input_path."""
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+def reduce_noise_array(y, sr):
+    """Mono downmix, resample to TARGET_SR and noise-reduce. Returns the reduced float array."""
+    # Convert stereo to mono if needed
+    if y.ndim > 1:
+        y = np.mean(y, axis=1)
+    # Resample if not TARGET_SR
+    if sr != TARGET_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=TARGET_SR)
+    return nr.reduce_noise(y=y, sr=TARGET_SR)  # NO verbose or noise_clip
+
+def reduce_noise_file(file_path, output_path):
+    """
+    Noise-reduces one file. Runs in a worker process, so errors are returned
+    as (output_path, error) instead of printed. The result is written to a
+    temp file and renamed, so an interrupted run never leaves a partial WAV
+    that would later look up to date.
+    """
+    tmp_path = output_path + ".tmp"
+    try:
+        y, sr = sf.read(file_path, dtype='float32')
+        reduced_noise_y = reduce_noise_array(y, sr)
+        sf.write(tmp_path, reduced_noise_y, TARGET_SR, format='WAV')
+        os.replace(tmp_path, output_path)
+        return output_path, None
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return output_path, str(e)
+
+def apply_classical_noise_reduction(input_folder, output_folder, workers=NR_WORKERS,
+                                    chunksize=NR_CHUNKSIZE, resume=True, cache=None):
+    processed_files = sorted(glob.glob(os.path.join(input_folder, '*.wav')))
     nr_files = []
 
     if not processed_files:
         print(f"No WAV files found in {input_folder} to apply NR.")
         return []
 
-    print(f"Applying Noise Reduction to {len(processed_files)} segments...")
+    # Skip segments whose output is already up to date: by content key when a
+    # cache is given, otherwise by modification time (resume)
+    tasks, skipped, keys = [], 0, {}
     for file_path in processed_files:
-        output_filename = os.path.basename(file_path)
-        output_path = os.path.join(output_folder, output_filename)
-        try:
-            y, sr = sf.read(file_path, dtype='float32')
-            # Convert stereo to mono if needed
-            if y.ndim > 1:
-                y = np.mean(y, axis=1)
-            # Resample if not TARGET_SR
-            if sr != TARGET_SR:
-                y = librosa.resample(y, orig_sr=sr, target_sr=TARGET_SR)
-                sr = TARGET_SR
-            reduced_noise_y = nr.reduce_noise(y=y, sr=sr)  # NO verbose or noise_clip
-            sf.write(output_path, reduced_noise_y, sr)
+        output_path = os.path.join(output_folder, os.path.basename(file_path))
+        if cache is not None:
+            keys[file_path] = stage_key(segment_output_key(cache, file_path), "nr", TARGET_SR)
+            fresh = cache.is_fresh("nr", os.path.basename(output_path), keys[file_path])
+        else:
+            fresh = resume and is_up_to_date(file_path, output_path)
+        if fresh:
+            skipped += 1
+        else:
+            tasks.append((file_path, output_path))
+    if skipped:
+        print(f"Skipping {skipped} segments already noise-reduced.")
+
+    print(f"Applying Noise Reduction to {len(tasks)} segments with {workers} worker(s)...")
+    input_paths = [t[0] for t in tasks]
+    output_paths = [t[1] for t in tasks]
+    if workers > 1 and len(tasks) > 1:
+        # map() yields results in submission order, so output is deterministic
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(partial(timed_task, reduce_noise_file), input_paths, output_paths,
+                                        chunksize=chunksize))
+    else:
+        results = [timed_task(reduce_noise_file, f, o) for f, o in tasks]
+
+    failures = {}
+    for (file_path, _), ((output_path, error), seconds) in zip(tasks, results):
+        METRICS.observe("noise_reduction", seconds)
+        if error is None:
+            if cache is not None:
+                cache.record("nr", os.path.basename(output_path), keys[file_path], [output_path])
+            continue
+        failures[file_path] = error
+        METRICS.inc("noise_reduction_failures")
+        print(f"NR failed for {file_path}: {error}")
+
+    # Report every up-to-date output in sorted input order, skipped ones included
+    for file_path in processed_files:
+        output_path = os.path.join(output_folder, os.path.basename(file_path))
+        if file_path not in failures and os.path.exists(output_path):
             nr_files.append(output_path)
-        except Exception as e:
-            print(f"NR failed for {file_path}: {e}")
 
-    print(f"Noise reduction complete: {len(nr_files)} files saved.")
+    print(f"Noise reduction complete: {len(nr_files)} files saved, {len(failures)} failed.")
     return nr_files
 
+# --- Noise Reduction (segment store layout) ---
+_NR_INPUT_STORE = None
+
+def _init_nr_store_worker(store_path):
+    global _NR_INPUT_STORE
+    _NR_INPUT_STORE = SegmentStore(store_path)
+
+def reduce_noise_segment(segment_index):
+    """Worker side of reduce_noise_store: returns (reduced float32 array, error)."""
+    try:
+        y = _NR_INPUT_STORE.read_float(segment_index)
+        return reduce_noise_array(y, _NR_INPUT_STORE.sample_rate).astype(np.float32), None
+    except Exception as e:
+        return None, str(e)
+
+def reduce_noise_store(input_store_path, output_store_path, workers=NR_WORKERS,
+                       chunksize=NR_CHUNKSIZE, cache=None):
+    """
+    Store-to-store version of apply_classical_noise_reduction. Workers read
+    their segments from the input memmap; results are appended to the output
+    store in segment order as they arrive. With a cache, unchanged segments
+    are copied from the previous output store instead of recomputed.
+    """
+    input_store = open_segment_store(input_store_path)
+    if input_store is None or len(input_store) == 0:
+        print(f"No segment store found at {input_store_path} to apply NR.")
+        return []
+
+    previous_store = open_segment_store(output_store_path) if cache is not None else None
+    exists = lambda name: previous_store is not None and name in previous_store
+    tasks, reused, keys = [], [], {}
+    for i, name in enumerate(input_store.names):
+        if cache is not None:
+            keys[name] = stage_key(segment_output_key(cache, name), "nr", TARGET_SR, STORE_DTYPE)
+            if cache.is_fresh("nr", name, keys[name], exists=exists):
+                reused.append(i)
+                continue
+        tasks.append(i)
+    if reused:
+        print(f"Skipping {len(reused)} segments already noise-reduced.")
+
+    print(f"Applying Noise Reduction to {len(tasks)} segments with {workers} worker(s)...")
+    nr_names, failures, records = [], 0, []
+    with SegmentStoreWriter(output_store_path, TARGET_SR, STORE_DTYPE) as writer:
+        for i in reused:
+            name = input_store.names[i]
+            writer.append(name, previous_store[previous_store.index_of(name)])
+            nr_names.append(name)
+
+        if workers > 1 and len(tasks) > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_nr_store_worker,
+                                           initargs=(input_store_path,))
+            results = executor.map(partial(timed_task, reduce_noise_segment), tasks, chunksize=chunksize)
+        else:
+            executor = None
+            _init_nr_store_worker(input_store_path)
+            results = (timed_task(reduce_noise_segment, i) for i in tasks)
+
+        try:
+            # Consumed lazily so only in-flight results are held in memory
+            for i, ((reduced, error), seconds) in zip(tasks, results):
+                METRICS.observe("noise_reduction", seconds)
+                name = input_store.names[i]
+                if error is not None:
+                    failures += 1
+                    METRICS.inc("noise_reduction_failures")
+                    print(f"NR failed for {name}: {error}")
+                    continue
+                writer.append(name, reduced)
+                nr_names.append(name)
+                if cache is not None:
+                    records.append((name, keys[name]))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        previous_store = None  # release the old memmap before its file is replaced
+
+    for name, key in records:
+        cache.record("nr", name, key, [name])
+    print(f"Noise reduction complete: {len(nr_names)} segments stored, {failures} failed.")
+    return sorted(nr_names)
+
 # --- Noise Augmentation ---
 def add_noise_augmentation(clean_audio_path, noise_audio_path, output_path, snr_db=5):
     try:
@@ -152,36 +600,172 @@ def add_noise_augmentation(clean_audio_path, noise_audio_path, output_path, snr_
     try:
         noisy_audio.export(output_path, format="wav")
         print(f"Saved noisy file: {os.path.basename(output_path)} (SNR: {snr_db}dB)")
+        return True
     except Exception as e:
         print(f"Failed to save noisy audio {output_path}: {e}")
 
-def run_augmentation_pipeline(noise_source_path):
-    all_processed = glob.glob(os.path.join(PROCESSED_PATH, '*.wav'))
+# --- Vectorized Multi-SNR Augmentation ---
+_NOISE_BANK = {}
+_CLEAN_STORE = None
+
+def load_mono(file_path):
+    """Reads a WAV as float32 mono at TARGET_SR."""
+    y, sr = sf.read(file_path, dtype='float32')
+    if y.ndim > 1:
+        y = np.mean(y, axis=1)
+    if sr != TARGET_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=TARGET_SR)
+    return y
+
+def load_noise_bank(noise_sources):
+    """Loads every noise source once; {name: path} -> {name: float32 array}."""
+    return {name: load_mono(path) for name, path in noise_sources.items()}
+
+def _init_augment_worker(noise_sources, clean_store_path=None):
+    global _NOISE_BANK, _CLEAN_STORE
+    _NOISE_BANK = load_noise_bank(noise_sources)
+    _CLEAN_STORE = SegmentStore(clean_store_path) if clean_store_path else None
+
+def mix_at_snr_levels(clean, noise, snr_levels):
+    """
+    Mixes a clean segment with one noise source at every SNR level at once.
+    Same gain rule as add_noise_augmentation: the noise (tiled to the clean
+    length) is scaled so its RMS level sits snr_db below the clean RMS.
+    Returns a (len(snr_levels), len(clean)) float32 array clipped to full scale.
+    """
+    tiled = np.resize(noise, clean.shape)  # repeats the noise, then truncates
+    clean_rms = np.sqrt(np.mean(np.square(clean, dtype=np.float64)))
+    noise_rms = np.sqrt(np.mean(np.square(tiled, dtype=np.float64)))
+    if clean_rms == 0 or noise_rms == 0:
+        gains = np.zeros(len(snr_levels), dtype=np.float32)
+    else:
+        gains = (clean_rms / noise_rms) * 10 ** (-np.asarray(snr_levels, dtype=np.float64) / 20)
+    mixes = clean[np.newaxis, :] + gains.astype(np.float32)[:, np.newaxis] * tiled[np.newaxis, :]
+    return np.clip(mixes, -1.0, 1.0, out=mixes)
+
+def augmentation_output_name(base_name, source_name, snr, single_source):
+    # A single noise source keeps the original "<segment>_snr<N>.wav" naming
+    if single_source:
+        return f"{base_name}_snr{snr}.wav"
+    return f"{base_name}_{source_name}_snr{snr}.wav"
+
+def augment_clean_file(clean_file, snr_levels):
+    """
+    Writes every (noise source, SNR) mix for one clean segment using the
+    worker's noise bank. clean_file is a segment name when reading from a
+    store. Returns (written_paths, error).
+    """
+    base_name = os.path.splitext(os.path.basename(clean_file))[0]
+    single_source = len(_NOISE_BANK) == 1
+    written = []
+    try:
+        if _CLEAN_STORE is not None:
+            clean = _CLEAN_STORE.read_float(_CLEAN_STORE.index_of(clean_file))
+        else:
+            clean = load_mono(clean_file)
+        for source_name, noise in _NOISE_BANK.items():
+            mixes = mix_at_snr_levels(clean, noise, snr_levels)
+            pcm = (mixes * 32767).astype(np.int16)
+            for snr, mix in zip(snr_levels, pcm):
+                output_name = augmentation_output_name(base_name, source_name, snr, single_source)
+                output_path = os.path.join(AUGMENTED_PATH, output_name)
+                write_pcm16_wav(output_path, mix, TARGET_SR)
+                written.append(output_path)
+        return written, None
+    except Exception as e:
+        return written, str(e)
+
+def run_augmentation_pipeline(noise_sources, cache=None, snr_levels=SNR_LEVELS, workers=AUGMENT_WORKERS,
+                              clean_store_path=None):
+    """
+    noise_sources is a {name: wav_path} dict (a single path is also accepted).
+    Clean segments come from PROCESSED_PATH, or from clean_store_path if given.
+    """
+    if isinstance(noise_sources, str):
+        noise_sources = {os.path.splitext(os.path.basename(noise_sources))[0]: noise_sources}
+
+    if clean_store_path:
+        all_processed = list(SegmentStore(clean_store_path).names)
+    else:
+        all_processed = sorted(glob.glob(os.path.join(PROCESSED_PATH, '*.wav')))
     subset_size = min(50, len(all_processed))
     if subset_size == 0:
         print("No processed audio for augmentation.")
         return
 
-    validation_subset = np.random.choice(all_processed, subset_size, replace=False)
-    snr_levels = [10, 5, 0]
+    rng = np.random.default_rng(AUGMENT_SEED)
+    validation_subset = rng.choice(all_processed, subset_size, replace=False)
+    single_source = len(noise_sources) == 1
+
+    # Per clean file, the expected outputs and their cache keys
+    tasks, expected = [], {}
+    noise_hashes = {name: hash_file(path) for name, path in noise_sources.items()} if cache is not None else {}
     for clean_file in validation_subset:
         base_name = os.path.splitext(os.path.basename(clean_file))[0]
-        for snr in snr_levels:
-            output_name = f"{base_name}_snr{snr}.wav"
-            output_path = os.path.join(AUGMENTED_PATH, output_name)
-            add_noise_augmentation(clean_file, noise_source_path, output_path, snr_db=snr)
+        clean_key = segment_output_key(cache, clean_file) if cache is not None else None
+        outputs = []
+        for source_name in noise_sources:
+            for snr in snr_levels:
+                output_name = augmentation_output_name(base_name, source_name, snr, single_source)
+                key = stage_key(clean_key, noise_hashes[source_name], "augment", snr) if cache is not None else None
+                outputs.append((output_name, key))
+        expected[clean_file] = outputs
+        if cache is None or not all(cache.is_fresh("augment", name, key) for name, key in outputs):
+            tasks.append(clean_file)
+
+    if len(tasks) < len(validation_subset):
+        print(f"Reusing cached augmentations for {len(validation_subset) - len(tasks)} segments.")
+    print(f"Augmenting {len(tasks)} segments with {len(noise_sources)} noise source(s) at SNR {snr_levels} dB...")
+
+    snr_args = [snr_levels] * len(tasks)
+    if workers > 1 and len(tasks) > 1:
+        # Each worker loads the noise bank once at startup
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_augment_worker,
+                                 initargs=(noise_sources, clean_store_path)) as executor:
+            results = list(executor.map(augment_clean_file, tasks, snr_args))
+    else:
+        _init_augment_worker(noise_sources, clean_store_path)
+        results = [augment_clean_file(f, snr) for f, snr in zip(tasks, snr_args)]
+
+    saved = 0
+    for clean_file, (written, error) in zip(tasks, results):
+        if error is not None:
+            print(f"Augmentation failed for {clean_file}: {error}")
+            continue
+        saved += len(written)
+        if cache is not None:
+            for output_path, (output_name, key) in zip(written, expected[clean_file]):
+                cache.record("augment", output_name, key, [output_path])
+
+    print(f"Augmentation complete: {saved} noisy files saved.")
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    segmented_files = segment_and_normalize_from_parquet()
+    cache = StageCache(CACHE_MANIFEST) if USE_CACHE else None
+    segmented_files = segment_and_normalize_from_parquet(cache=cache)
     if not segmented_files:
         print("No audio segments created. Stopping.")
     else:
-        noise_reduced_files = apply_classical_noise_reduction(PROCESSED_PATH, NR_PATH)
-        NOISE_FILE = "cockpit_noise.wav"  # Place your noise file in the same directory
-        if os.path.exists(NOISE_FILE):
-            run_augmentation_pipeline(NOISE_FILE)
+        if SEGMENT_FORMAT == "store":
+            noise_reduced_files = reduce_noise_store(PROCESSED_STORE, NR_STORE, cache=cache)
+        else:
+            noise_reduced_files = apply_classical_noise_reduction(PROCESSED_PATH, NR_PATH, cache=cache)
+        noise_sources = {}
+        for name, path in NOISE_SOURCES.items():
+            if os.path.exists(path):
+                noise_sources[name] = path
+            else:
+                print(f"Noise file '{path}' not found. Skipping '{name}' noise.")
+        if noise_sources:
+            clean_store_path = PROCESSED_STORE if SEGMENT_FORMAT == "store" else None
+            run_augmentation_pipeline(noise_sources, cache=cache, clean_store_path=clean_store_path)
         else:
-            print(f"Noise file '{NOISE_FILE}' not found. Skipping augmentation.")
+            print("No noise files found. Skipping augmentation.")
+        if SEGMENT_FORMAT == "store" and EXPORT_WAV:
+            SegmentStore(PROCESSED_STORE).export_wav(PROCESSED_PATH)
+            SegmentStore(NR_STORE).export_wav(NR_PATH)
+    if cache is not None:
+        cache.save()
 
     print("Preprocessing Complete.")
+    METRICS.export("preprocessing")
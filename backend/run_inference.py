@@ -1,70 +1,97 @@
 import os
 import glob
-from transformers import pipeline
 import librosa
 import jiwer # Library for Word Error Rate calculation
+from asr_client import ASRClient
+from metrics import METRICS
+from asr_inference import (
+    ASR_BATCH_SIZE, ASR_QUANTIZE_INT8, load_whisper, quantize_int8, transcribe_arrays,
+    benchmark_transcription, print_benchmark, quantization_accuracy_impact
+)
 
 # --- Configuration ---
 MODEL_PATH = "whisper-aviation-tuned/final" # Path where your fine-tuned model was saved
 AUGMENTED_PATH = "augmented_validation"
 TARGET_SR = 16000
+# The full-precision model is also run on this many segments to measure the int8 accuracy impact
+ACCURACY_SAMPLE_SIZE = 50
+# Use a running asr_server.py when it is ready instead of loading the model here
+USE_ASR_SERVER = True
 
 # --- Main Inference Logic ---
 if __name__ == '__main__':
     
-    if not os.path.exists(MODEL_PATH):
-        print(f"Error: Fine-tuned model not found at {MODEL_PATH}. Run asr_finetuning.py first.")
-        exit()
-
-    # 1. Load the fine-tuned model using the convenient Hugging Face pipeline
-    print("Loading fine-tuned ASR pipeline...")
-    # Use the model and processor saved by the trainer
-    asr_pipeline = pipeline(
-        "automatic-speech-recognition",
-        model=MODEL_PATH,
-        chunk_length_s=30, # Max audio chunk size for the pipeline
-        device=0 if torch.cuda.is_available() else -1 # Use GPU if available
-    )
+    # 1. Use a warm ASR server serving MODEL_PATH, or load the fine-tuned model for CPU
+    # inference (int8-quantized if enabled)
+    client = ASRClient() if USE_ASR_SERVER else None
+    if client is not None and client.serves(MODEL_PATH):
+        print(f"Using ASR server at {client.url} (model: {MODEL_PATH})")
+        transcribe, label = client.transcribe, "server"
+    else:
+        if client is not None and client.is_ready():
+            print(f"ASR server at {client.url} serves {client.status()['model']}, not {MODEL_PATH}; loading locally.")
+        if not os.path.exists(MODEL_PATH):
+            print(f"Error: Fine-tuned model not found at {MODEL_PATH}. Run asr_finetuning.py first.")
+            exit()
+        print("Loading fine-tuned Whisper model...")
+        model_fp32, processor = load_whisper(MODEL_PATH, quantize=False)
+        model = quantize_int8(model_fp32) if ASR_QUANTIZE_INT8 else model_fp32
+        transcribe = lambda arrays: transcribe_arrays(model, processor, arrays)
+        label = "int8" if ASR_QUANTIZE_INT8 else "fp32"
 
     # 2. Get list of noisy audio files
-    noisy_files = glob.glob(os.path.join(AUGMENTED_PATH, '*.wav'))
+    noisy_files = sorted(glob.glob(os.path.join(AUGMENTED_PATH, '*.wav')))
     
     if not noisy_files:
         print(f"No files found in {AUGMENTED_PATH}. Run preprocessing.py step 1.4 first.")
         exit()
         
-    print(f"Starting inference on {len(noisy_files)} noisy files...")
+    print(f"Starting inference on {len(noisy_files)} noisy files (batch size {ASR_BATCH_SIZE})...")
 
     references = [] # Ground truth texts
     hypotheses = [] # Model predictions
 
-    # 3. Perform Inference
+    # 3. Load audio; unreadable files are reported and skipped
+    arrays, files = [], []
     for file_path in noisy_files:
-        
-        # NOTE: This validation script is a simplification. 
-        # You'd typically need a separate CSV linking AUGMENTED_PATH files to transcripts.
-        # For simplicity, we are assuming the noisy files match the transcript in the metadata.
-        # --- Placeholder for getting Ground Truth (REPLACE THIS) ---
-        # Find the transcript in the original metadata file based on filename
-        # ... logic to find ground truth ...
-        # Simplified: We will just run the model and print the result for now.
-
         try:
-            # Transcribe the audio
-            result = asr_pipeline(file_path, generate_kwargs={"language": "en"})
-            prediction = result["text"].strip()
-            
-            print(f"File: {os.path.basename(file_path)}")
-            print(f"Prediction: {prediction}\n")
-            
-            # (TO BE COMPLETED LATER: If you get the ground truth)
-            # references.append(ground_truth)
-            # hypotheses.append(prediction)
-
+            y, _ = librosa.load(file_path, sr=TARGET_SR)
+            arrays.append(y)
+            files.append(file_path)
         except Exception as e:
-            print(f"Error during transcription of {file_path}: {e}")
+            print(f"Error loading {file_path}: {e}")
+
+    # 4. Perform batched inference
+    # NOTE: This validation script is a simplification. 
+    # You'd typically need a separate CSV linking AUGMENTED_PATH files to transcripts.
+    # (TO BE COMPLETED LATER: If you get the ground truth, fill `references` in file order)
+    hypotheses, stats = benchmark_transcription(transcribe, arrays)
+    for file_path, prediction in zip(files, hypotheses):
+        print(f"File: {os.path.basename(file_path)}")
+        print(f"Prediction: {prediction}\n")
+
+    print("\n--- CPU Inference Throughput ---")
+    print_benchmark(label, stats)
+    # Exported before the fp32 comparison so stage latencies reflect the deployed model only
+    METRICS.export("run_inference")
+
+    # 5. Accuracy impact of quantization on a sample, against the full-precision model
+    if label == "int8":
+        sample = arrays[:ACCURACY_SAMPLE_SIZE]
+        reference_texts, fp32_stats = benchmark_transcription(
+            lambda arrays: transcribe_arrays(model_fp32, processor, arrays), sample
+        )
+        print_benchmark("fp32", fp32_stats)
+        impact = quantization_accuracy_impact(
+            reference_texts, hypotheses[:len(sample)], references[:len(sample)] or None
+        )
+        print(f"int8 vs fp32 on {len(sample)} segments: WER between outputs {impact['wer_int8_vs_fp32']:.4f}")
+        if "wer_fp32" in impact:
+            print(f"WER vs ground truth: fp32 {impact['wer_fp32']:.4f}, int8 {impact['wer_int8']:.4f}")
+        if stats['rtf'] > 0:
+            print(f"int8 speedup (by real-time factor): {fp32_stats['rtf'] / stats['rtf']:.2f}x")
 
-    # 4. Calculate WER (Once you have the ground truth)
-    # if references and hypotheses:
-    #     wer = jiwer.wer(references, hypotheses)
-    #     print(f"\n--- Final Word Error Rate (WER) on Noisy Data: {wer:.4f} ---")
\ No newline at end of file
+    # 6. Calculate WER (Once you have the ground truth)
+    if references and hypotheses:
+        wer = jiwer.wer(references, hypotheses)
+        print(f"\n--- Final Word Error Rate (WER) on Noisy Data: {wer:.4f} ---")
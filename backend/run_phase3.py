@@ -1,52 +1,121 @@
-import subprocess
-import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metrics import METRICS, timed
+from phase_io import read_table, write_table
+import speaker_diarization
+from speaker_roles import update_speaker_roles_file
+import emotion_detection
 
-# --- PHASE 3 SCRIPT SEQUENCE ---
-SCRIPTS = [
-    "speaker_diarization.py",     # Phase 3.1: Speaker Tagging
-    "emotion_detection.py"        # Phase 3.2: Emotion/Stress Detection
+# --- Configuration ---
+ASR_METADATA_FILE = "asr_data.parquet"                # Phase 2 output
+DIARIZED_METADATA_FILE = "diarized_asr_data.parquet"  # old hand-off file, only written as a checkpoint
+FINAL_METADATA_FILE = "final_analytics_data.parquet"  # read by alert.py
+# Write the intermediate diarization result too, so speaker_diarization.py /
+# emotion_detection.py can still be rerun on their own afterwards
+CHECKPOINT_STAGES = False
+MAX_PARALLEL_STAGES = 2  # diarization and feature extraction only depend on the ASR data
+
+# --- Stage Functions ---
+# Each stage receives the in-memory outputs of its dependencies, in the order listed.
+def load_asr_data():
+    df = read_table(ASR_METADATA_FILE)
+    print(f"Loaded {len(df)} segments from {ASR_METADATA_FILE}.")
+    return df
+
+def diarize(df):
+    # Segments already in the last final output keep their speakers; new ones continue
+    # each recording's saved clusterer (speaker_diarization.DIARIZATION_STATE_FILE)
+    speakers = speaker_diarization.diarize_new_segments(df, FINAL_METADATA_FILE)
+    if speaker_diarization.DIARIZATION_BACKEND == "embedding":
+        # New speakers are listed for a reviewer to map to CAP/FO/ATC (speaker_roles.py)
+        speaker_diarization.report_unmapped_speakers(update_speaker_roles_file(df.join(speakers)))
+    if CHECKPOINT_STAGES:
+        write_table(df.join(speakers), DIARIZED_METADATA_FILE)
+        print(f"Checkpoint: diarization saved to {DIARIZED_METADATA_FILE}")
+    return speakers
+
+def extract_features(df):
+    return emotion_detection.extract_segment_features(df)
+
+def score_stress(df, speakers, features):
+    # Stress baselines are kept per speaker role, so scoring waits for diarization
+    scored = df.join(speakers).assign(features=features)
+    scored['stress_score'] = emotion_detection.score_stress(scored)
+    return scored.drop(columns=['features'])
+
+def save_results(df):
+    write_table(df, FINAL_METADATA_FILE)
+    print(f"Final data saved to {FINAL_METADATA_FILE}")
+    return FINAL_METADATA_FILE
+
+# (name, function, dependencies)
+PHASE3_STAGES = [
+    ("asr_data", load_asr_data, []),
+    ("diarization", diarize, ["asr_data"]),             # Phase 3.1: Speaker Tagging
+    ("features", extract_features, ["asr_data"]),       # Phase 3.2: Emotion/Stress Detection
+    ("stress", score_stress, ["asr_data", "diarization", "features"]),
+    ("save", save_results, ["stress"]),
 ]
 
-def run_script(script_name):
-    print(f"\n--- Running {script_name} ---")
-    
-    # Check if the script exists in the working directory
-    if not os.path.exists(script_name):
-        print(f"Error: {script_name} not found.")
-        return False
-        
-    # Execute using system Python interpreter
-    try:
-        result = subprocess.run(
-            ["python", script_name],
-            check=True,              # Raise error if non-zero exit code
-            capture_output=True,
-            text=True
-        )
-        print(result.stdout)
-        print(f"--- {script_name} finished successfully. ---")
-        return True
-
-    except subprocess.CalledProcessError as e:
-        print(f"--- ERROR: {script_name} failed. ---")
-        print(f"Stdout:\n{e.stdout}")
-        print(f"Stderr:\n{e.stderr}")
-        return False
-
-    except FileNotFoundError:
-        print("Error: Python command not found. Ensure Python is in your PATH and environment is active.")
-        return False
+# --- DAG Runner ---
+def run_stage(name, fn, *inputs):
+    print(f"\n--- Running {name} ---")
+    start = time.perf_counter()
+    with timed(f"phase3_{name}"):
+        result = fn(*inputs)
+    print(f"--- {name} finished in {time.perf_counter() - start:.2f}s. ---")
+    return result
+
+def run_dag(stages, max_parallel=MAX_PARALLEL_STAGES):
+    """
+    Runs stages in one process as soon as their dependencies are done, up to
+    max_parallel at a time, and returns {name: output}. Outputs are handed
+    over in memory. The first failing stage raises once the running ones finish.
+    """
+    names = {name for name, _, _ in stages}
+    for name, _, deps in stages:
+        missing = [d for d in deps if d not in names]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+
+    results = {}
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while pending or running:
+            for stage in [s for s in pending if all(d in results for d in s[2])]:
+                name, fn, deps = stage
+                pending.remove(stage)
+                running[pool.submit(run_stage, name, fn, *[results[d] for d in deps])] = name
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {', '.join(s[0] for s in pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    pending.clear()  # nothing new starts; stages already running are waited for
+                    raise RuntimeError(f"Stage '{name}' failed: {e}") from e
+    return results
 
 
 if __name__ == "__main__":
+    # Stage output goes straight to the log, also when stdout is redirected to a file
+    sys.stdout.reconfigure(line_buffering=True)
     print("Starting Phase 3: Speaker Tagging and Stress/Emotion Detection.")
-    
-    success = True
-    for script in SCRIPTS:
-        if not run_script(script):
-            success = False
-            break
-            
+
+    try:
+        run_dag(PHASE3_STAGES)
+        success = True
+    except Exception as e:
+        print(f"--- ERROR: {e} ---")
+        traceback.print_exc()
+        success = False
+
+    METRICS.export("phase3")
     if success:
         print("\n✅ PHASE 3 COMPLETE. Proceed to Phase 4: NLP and Real-Time Alert Generation.")
     else:
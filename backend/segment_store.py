@@ -0,0 +1,168 @@
+import os
+import glob
+import json
+import wave
+import numpy as np
+import soundfile as sf
+
+# --- Configuration ---
+SAMPLES_FILE = "samples.bin"
+INDEX_FILE = "index.json"
+STORE_DTYPES = ("int16", "float16")
+
+# --- Sample Conversion ---
+def to_store_dtype(samples, dtype):
+    """Converts int16 PCM or float audio in [-1, 1] to the store's sample dtype."""
+    samples = np.asarray(samples)
+    if samples.dtype == dtype:
+        return samples
+    if dtype == "int16":
+        return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    if samples.dtype == np.int16:
+        return (samples / 32768).astype(np.float16)
+    return samples.astype(np.float16)
+
+# --- Writer ---
+class SegmentStoreWriter:
+    """
+    Appends segments to one contiguous sample file and records an offset/length
+    index. The index is sorted by segment name on close, so store position i is
+    the i-th segment in the same order as a sorted glob of the WAV directory.
+    """
+
+    def __init__(self, store_path, sample_rate, dtype="int16"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported store dtype {dtype}; expected one of {STORE_DTYPES}")
+        os.makedirs(store_path, exist_ok=True)
+        self.store_path = store_path
+        self.sample_rate = sample_rate
+        self.dtype = dtype
+        self.entries = []  # (name, offset, length)
+        self._offset = 0
+        self._samples_tmp = os.path.join(store_path, SAMPLES_FILE + ".tmp")
+        self._file = open(self._samples_tmp, 'wb')
+
+    def append(self, name, samples):
+        """Writes one mono segment straight from its buffer."""
+        data = np.ascontiguousarray(to_store_dtype(samples, self.dtype))
+        if data.ndim > 1:
+            raise ValueError(f"Segment {name} must be mono, got shape {data.shape}")
+        self._file.write(data)
+        self.entries.append((name, self._offset, len(data)))
+        self._offset += len(data)
+
+    def close(self):
+        self._file.close()
+        self.entries.sort(key=lambda e: e[0])
+        index = {
+            "dtype": self.dtype,
+            "sample_rate": self.sample_rate,
+            "names": [e[0] for e in self.entries],
+            "offsets": [e[1] for e in self.entries],
+            "lengths": [e[2] for e in self.entries],
+        }
+        index_tmp = os.path.join(self.store_path, INDEX_FILE + ".tmp")
+        with open(index_tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        # Samples first, index last: a store with an index is always complete
+        os.replace(self._samples_tmp, os.path.join(self.store_path, SAMPLES_FILE))
+        os.replace(index_tmp, os.path.join(self.store_path, INDEX_FILE))
+        print(f"Segment store written: {self.store_path} ({len(self.entries)} segments)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# --- Reader ---
+class SegmentStore:
+    """
+    Read-only view of a segment store. store[i] is a zero-copy np.memmap
+    slice of segment i (by segment_index); read_float(i) returns float32.
+    """
+
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.store_path = store_path
+        self.dtype = index["dtype"]
+        self.sample_rate = index["sample_rate"]
+        self.names = index["names"]
+        self.offsets = np.asarray(index["offsets"], dtype=np.int64)
+        self.lengths = np.asarray(index["lengths"], dtype=np.int64)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        samples_path = os.path.join(store_path, SAMPLES_FILE)
+        if os.path.getsize(samples_path) == 0:
+            self.samples = np.zeros(0, dtype=self.dtype)
+        else:
+            self.samples = np.memmap(samples_path, dtype=self.dtype, mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __getitem__(self, segment_index):
+        start = self.offsets[segment_index]
+        return self.samples[start:start + self.lengths[segment_index]]
+
+    def index_of(self, name):
+        return self._positions[name]
+
+    def duration(self, segment_index):
+        return self.lengths[segment_index] / self.sample_rate
+
+    def read_float(self, segment_index):
+        samples = self[segment_index]
+        if self.dtype == "int16":
+            return samples.astype(np.float32) / 32768
+        return samples.astype(np.float32)
+
+    def export_wav(self, output_dir):
+        """Writes every segment back out as <name>.wav (the original layout)."""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for i, name in enumerate(self.names):
+            output_path = os.path.join(output_dir, f"{name}.wav")
+            if self.dtype == "int16":
+                with wave.open(output_path, 'wb') as wav_file:
+                    wav_file.setnchannels(1)
+                    wav_file.setsampwidth(2)
+                    wav_file.setframerate(self.sample_rate)
+                    wav_file.writeframes(np.ascontiguousarray(self[i]))
+            else:
+                sf.write(output_path, self.read_float(i), self.sample_rate, subtype='PCM_16')
+            paths.append(output_path)
+        print(f"Exported {len(paths)} segments to {output_dir}")
+        return paths
+
+# --- Helpers ---
+def open_segment_store(store_path):
+    """Returns a SegmentStore if one exists at store_path, otherwise None."""
+    if store_path and os.path.exists(os.path.join(store_path, INDEX_FILE)):
+        return SegmentStore(store_path)
+    return None
+
+def pack_wav_files(wav_files, store_path, sample_rate, dtype="int16"):
+    """Packs existing segment WAVs (mono, at sample_rate) into a store."""
+    with SegmentStoreWriter(store_path, sample_rate, dtype) as writer:
+        for file_path in wav_files:
+            y, sr = sf.read(file_path, dtype='int16')
+            if y.ndim > 1:
+                y = y.mean(axis=1).astype(np.int16)
+            if sr != sample_rate:
+                raise ValueError(f"{file_path} is {sr} Hz, store is {sample_rate} Hz")
+            writer.append(os.path.splitext(os.path.basename(file_path))[0], y)
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    # Packs an existing WAV segment directory into a store
+    WAV_DIR = "./processed_audio"
+    STORE_PATH = "./processed_store"
+    wav_files = sorted(glob.glob(os.path.join(WAV_DIR, '*.wav')))
+    if not wav_files:
+        print(f"No WAV files found in {WAV_DIR}.")
+    else:
+        pack_wav_files(wav_files, STORE_PATH, sample_rate=16000)
@@ -1,12 +1,55 @@
 import os
 import re
-from pyannote.audio import Pipeline
+import copy
+import json
+import numpy as np
 import pandas as pd
+import librosa
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+from segment_store import SegmentStore, open_segment_store
+from vad import detect_speech_spans
+from metrics import METRICS, timed, timed_task
+from phase_io import read_table, write_table
+from stress_normalizer import RunningStats
+from speaker_roles import SPEAKER_ROLES_FILE, update_speaker_roles_file
 
 
 # --- Configuration ---
 NR_PATH = "noise_reduced_audio"
-DIARIZED_METADATA_FILE = "diarized_asr_data.csv"
+ASR_METADATA_FILE = "asr_data.parquet"
+DIARIZED_METADATA_FILE = "diarized_asr_data.parquet"
+# Each recording's clusterer is saved here; a later run only diarizes rows not yet in
+# DIARIZED_METADATA_FILE, continuing the saved clusterers
+DIARIZATION_STATE_FILE = "diarization_state.json"
+STATE_VERSION = 1
+TARGET_SR = 16000
+SEGMENT_STORE_PATH = "./processed_store"  # rows are read by segment_index when the store exists
+
+# "embedding": MFCC speaker embeddings clustered incrementally per recording.
+# "placeholder": the original rotation of roles by segment number.
+DIARIZATION_BACKEND = "embedding"
+DIARIZATION_BATCH_SIZE = 32  # segments per worker task; equal lengths share one MFCC call
+DIARIZATION_WORKERS = os.cpu_count() or 1
+N_MFCC = 20  # c0 (loudness) is dropped from the embedding
+EMBEDDING_DIM = 2 * (N_MFCC - 1)  # mean and std of each MFCC
+MFCC_N_FFT = 512  # 32 ms
+MFCC_HOP = 160  # 10 ms
+MFCC_N_MELS = 40
+EMBED_WINDOW_SEC = 1.5  # one embedding per window; turns are resolved to EMBED_HOP_SEC
+EMBED_HOP_SEC = 0.75
+SAME_VOICE_GAP = 2  # hops between two windows that don't overlap
+MIN_SPEECH_RATIO = 0.5  # windows with less speech than this get no embedding
+SPEAKER_SIMILARITY_THRESHOLD = 0.7  # cosine similarity (recording-normalized embeddings) to join a speaker
+# A window below the threshold only starts a new speaker if it is also this far from every
+# speaker centroid, in units of the recording's typical distance between two windows of one voice
+NEW_SPEAKER_DISTANCE = 1.0
+MIN_SPEAKER_WINDOWS = 4  # speakers with fewer windows are folded into the most similar one
+# After each batch of a recording's segments, two speakers whose centroids are closer than this many times their
+# spread (RMS distance of their windows to the centroid) are one voice split by noise
+SPEAKER_SEPARATION = 1.75
+MAX_SPEAKERS_PER_RECORDING = 6
 
 # --- Speaker Roles Mapping (Conceptual) ---
 # NOTE: Real-world speaker diarization needs manual labeling 
@@ -48,21 +91,515 @@ def perform_diarization(audio_file_path):
         print(f"Diarization failed for {os.path.basename(audio_file_path)}. Using UNKNOWN. Error: {e}")
         return "UNKNOWN"
 
+# --- Speaker Embeddings ---
+def speech_frame_mask(y: np.ndarray, num_frames: int, sr: int = TARGET_SR) -> np.ndarray:
+    """True for MFCC frames whose center lies inside a VAD speech span."""
+    centers = np.arange(num_frames) * MFCC_HOP
+    mask = np.zeros(num_frames, dtype=bool)
+    for start, end in detect_speech_spans(y, sr):
+        mask[np.searchsorted(centers, start):np.searchsorted(centers, end)] = True
+    return mask
+
+def window_embeddings(mfcc: np.ndarray, speech: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and std of each MFCC (without c0) over the speech frames of every
+    EMBED_WINDOW_SEC window, from cumulative sums in one pass over the frames.
+    Returns (window start times in seconds, (windows, EMBEDDING_DIM) embeddings).
+    """
+    num_frames = mfcc.shape[1]
+    window = min(int(EMBED_WINDOW_SEC * TARGET_SR / MFCC_HOP), num_frames)
+    hop = int(EMBED_HOP_SEC * TARGET_SR / MFCC_HOP)
+    if window == 0:
+        return np.zeros(0), np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    x = mfcc[1:].T * speech[:, None]
+    zero = np.zeros((1, x.shape[1]))
+    sums = np.concatenate([zero, np.cumsum(x, axis=0)])
+    squares = np.concatenate([zero, np.cumsum(x * x, axis=0)])
+    counts = np.concatenate([[0], np.cumsum(speech)])
+
+    starts = np.arange(0, num_frames - window + 1, hop)
+    n = counts[starts + window] - counts[starts]
+    keep = n >= MIN_SPEECH_RATIO * window
+    starts, n = starts[keep], n[keep][:, None]
+    mean = (sums[starts + window] - sums[starts]) / n
+    var = (squares[starts + window] - squares[starts]) / n - mean ** 2
+    embeddings = np.concatenate([mean, np.sqrt(np.maximum(var, 0))], axis=1).astype(np.float32)
+    return starts * MFCC_HOP / TARGET_SR, embeddings
+
+_DIARIZATION_STORE = None
+
+def _init_diarization_worker(store_path: Optional[str]):
+    global _DIARIZATION_STORE
+    _DIARIZATION_STORE = SegmentStore(store_path) if store_path else None
+
+def _load_segment(source) -> np.ndarray:
+    if _DIARIZATION_STORE is not None:
+        return _DIARIZATION_STORE.read_float(int(source))
+    y, _ = librosa.load(source, sr=TARGET_SR)
+    return y
+
+def embed_segments_chunk(sources: list) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+    """
+    Worker task: (window starts, window embeddings, duration) for a chunk of
+    segments (store indices or file paths). Equal-length segments go through
+    librosa's MFCC as one 2-D batch. Rows that fail to load get no windows.
+    """
+    empty = (np.zeros(0), np.zeros((0, EMBEDDING_DIM), dtype=np.float32), 0.0)
+    results = [empty] * len(sources)
+    by_length = {}
+    for pos, source in enumerate(sources):
+        try:
+            y = _load_segment(source)
+        except Exception as e:
+            print(f"Diarization failed for {source}. Error: {e}")
+            continue
+        by_length.setdefault(len(y), []).append((pos, y))
+
+    for length, group in by_length.items():
+        mfcc = librosa.feature.mfcc(y=np.stack([y for _, y in group]), sr=TARGET_SR, n_mfcc=N_MFCC,
+                                    n_fft=MFCC_N_FFT, hop_length=MFCC_HOP, n_mels=MFCC_N_MELS)
+        for (pos, y), row_mfcc in zip(group, mfcc):
+            results[pos] = (*window_embeddings(row_mfcc, speech_frame_mask(y, row_mfcc.shape[1])), length / TARGET_SR)
+    return results
+
+def compute_embeddings(sources: list, store_path: Optional[str] = None,
+                       workers: int = DIARIZATION_WORKERS,
+                       batch_size: int = DIARIZATION_BATCH_SIZE) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+    """embed_segments_chunk results per source, in order, computed in parallel chunks."""
+    chunks = [list(sources[i:i + batch_size]) for i in range(0, len(sources), batch_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_diarization_worker,
+                                 initargs=(store_path,)) as executor:
+            chunk_results = list(executor.map(partial(timed_task, embed_segments_chunk), chunks))
+    else:
+        _init_diarization_worker(store_path)
+        chunk_results = [timed_task(embed_segments_chunk, chunk) for chunk in chunks]
+    for chunk, seconds in chunk_results:
+        METRICS.observe("speaker_embedding", seconds)
+    return [windows for chunk, _ in chunk_results for windows in chunk]
+
+# --- Incremental Clustering ---
+class IncrementalSpeakerClusterer:
+    """
+    Online speaker clustering for one recording. The clusterer holds all of the
+    recording's state: running statistics of its windows (per-recording CMVN),
+    the running spread between windows of one voice, and per-speaker sums, so
+    a new segment is observed and its windows are assigned with assign() alone,
+    at O(speakers) per window, and nothing is re-clustered. Speakers are kept
+    as raw sums and compared after normalizing with the current statistics.
+
+    A window joins the most similar speaker (cosine) unless the similarity is
+    below the threshold and the window is also at least new_speaker_distance
+    same-voice spreads from every speaker, so one voice in noise isn't split
+    apart. Speakers whose centroids converge are merged. finished() labels the
+    segments seen so far: on a copy it also merges speakers that overlap
+    (centroid gap small against their spread) and folds speakers with too few
+    windows into the most similar one. Earlier labels follow merges through
+    resolve(), and names keeps the speaker ids already given out for the
+    recording. to_dict()/from_dict() persist the state between runs.
+    """
+
+    def __init__(self, threshold=SPEAKER_SIMILARITY_THRESHOLD, new_speaker_distance=NEW_SPEAKER_DISTANCE,
+                 max_speakers=MAX_SPEAKERS_PER_RECORDING, min_windows=MIN_SPEAKER_WINDOWS,
+                 separation=SPEAKER_SEPARATION):
+        self.threshold = threshold
+        self.new_speaker_distance = new_speaker_distance
+        self.max_speakers = max_speakers
+        self.min_windows = min_windows
+        self.separation = separation
+        self.stats = RunningStats(EMBEDDING_DIM)  # every window of the recording
+        self.gap_count = 0
+        self.gap_squares = np.zeros(EMBEDDING_DIM)  # squared differences of windows SAME_VOICE_GAP apart
+        self.sums = {}    # cluster id -> sum of member embeddings
+        self.squares = {}  # cluster id -> per-dimension sum of squared member embeddings
+        self.counts = {}  # cluster id -> number of members
+        self.merged_into = {}
+        self.names = {}  # cluster id -> speaker id written for it (SPEAKER_NN)
+        self.next_id = 0
+
+    @staticmethod
+    def _unit(vectors):
+        vectors = np.atleast_2d(vectors)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def _std(self):
+        std = self.stats.std()
+        return np.where(std > 0, std, 1.0)
+
+    def _normalized_means(self, ids):
+        means = np.stack([self.sums[i] / self.counts[i] for i in ids])
+        return (means - self.stats.mean) / self._std()
+
+    def same_voice_distance(self) -> float:
+        """
+        RMS distance (normalized) between non-overlapping windows SAME_VOICE_GAP
+        hops apart. Turns last several windows, so nearly all such pairs are one
+        voice: this is the spread to expect within a speaker.
+        """
+        if not self.gap_count:
+            return 0.0
+        return float(np.sqrt(np.sum(self.gap_squares / self.gap_count / self._std() ** 2)))
+
+    def observe(self, embeddings):
+        """Adds a segment's windows (in time order) to the running statistics."""
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        for embedding in embeddings:
+            self.stats.update(embedding)
+        if len(embeddings) > SAME_VOICE_GAP:
+            differences = embeddings[SAME_VOICE_GAP:] - embeddings[:-SAME_VOICE_GAP]
+            self.gap_count += len(differences)
+            self.gap_squares += np.square(differences).sum(axis=0)
+
+    def _merge(self, keep, drop):
+        self.sums[keep] += self.sums.pop(drop)
+        self.squares[keep] += self.squares.pop(drop)
+        self.counts[keep] += self.counts.pop(drop)
+        self.merged_into[drop] = keep
+
+    def _merge_converged(self):
+        while len(self.sums) > 1:
+            ids = list(self.sums)
+            centroids = self._unit(self._normalized_means(ids))
+            similarity = np.triu(centroids @ centroids.T, k=1)
+            a, b = np.unravel_index(np.argmax(similarity), similarity.shape)
+            if similarity[a, b] < self.threshold:
+                return
+            self._merge(ids[a], ids[b])
+
+    def assign(self, embedding) -> int:
+        embedding = np.asarray(embedding, dtype=np.float64)
+        ids = list(self.sums)
+        if ids:
+            x = (embedding - self.stats.mean) / self._std()
+            means = self._normalized_means(ids)
+            similarities = self._unit(means) @ self._unit(x)[0]
+            distance = np.linalg.norm(means - x, axis=1).min()
+            distinct = distance >= self.new_speaker_distance * self.same_voice_distance()
+        if ids and (similarities.max() >= self.threshold or not distinct or len(ids) >= self.max_speakers):
+            cluster = ids[int(np.argmax(similarities))]
+            self.sums[cluster] += embedding
+            self.squares[cluster] += embedding * embedding
+            self.counts[cluster] += 1
+        else:
+            cluster = self.next_id
+            self.next_id += 1
+            self.sums[cluster] = embedding.copy()
+            self.squares[cluster] = embedding * embedding
+            self.counts[cluster] = 1
+        self._merge_converged()
+        return cluster
+
+    def assign_segment(self, embeddings) -> list:
+        """Observes a segment's windows, then assigns each of them."""
+        self.observe(embeddings)
+        return [self.assign(e) for e in embeddings]
+
+    def _merge_overlapping(self):
+        while len(self.sums) > 1:
+            ids = list(self.sums)
+            counts = np.array([self.counts[i] for i in ids], dtype=np.float64)
+            means = self._normalized_means(ids)
+            raw_means = np.stack([self.sums[i] for i in ids]) / counts[:, None]
+            variance = np.stack([self.squares[i] for i in ids]) / counts[:, None] - raw_means ** 2
+            spread = (variance / self._std() ** 2).sum(axis=1)
+            gaps = np.linalg.norm(means[:, None] - means[None], axis=2)
+            pooled = np.sqrt(np.maximum((spread[:, None] + spread[None]) / 2, 1e-12))
+            ratio = gaps / pooled + np.diag(np.full(len(ids), np.inf))
+            a, b = np.unravel_index(np.argmin(ratio), ratio.shape)
+            if ratio[a, b] >= self.separation:
+                return
+            keep, drop = (ids[a], ids[b]) if counts[a] >= counts[b] else (ids[b], ids[a])
+            self._merge(keep, drop)
+
+    def finished(self) -> "IncrementalSpeakerClusterer":
+        """
+        Copy with speakers that don't stand apart from each other merged
+        (SPEAKER_SEPARATION), then speakers with fewer than min_windows windows
+        folded into their most similar speaker; its resolve() labels the
+        segments seen so far. The clusterer itself keeps them apart: early in a
+        recording these merges are often wrong, and later windows still need
+        the separate speakers.
+        """
+        final = copy.copy(self)
+        final.sums = {i: v.copy() for i, v in self.sums.items()}
+        final.squares = {i: v.copy() for i, v in self.squares.items()}
+        final.counts = dict(self.counts)
+        final.merged_into = dict(self.merged_into)
+        final._merge_overlapping()
+        while len(final.sums) > 1:
+            ids = sorted(final.sums, key=final.counts.get)
+            if final.counts[ids[0]] >= final.min_windows:
+                break
+            centroids = final._unit(final._normalized_means(ids))
+            similarities = centroids[1:] @ centroids[0]
+            final._merge(ids[1 + int(np.argmax(similarities))], ids[0])
+        return final
+
+    def resolve(self, cluster) -> int:
+        """Current id of a cluster that may have been merged since it was assigned."""
+        while cluster in self.merged_into:
+            cluster = self.merged_into[cluster]
+        return cluster
+
+    def speaker_names(self, resolve=None) -> dict:
+        """
+        Current cluster -> the earliest speaker id given to any cluster merged
+        into it, through `resolve` (default: this clusterer's merges).
+        """
+        resolve = resolve or self.resolve
+        names = {}
+        for cluster, name in self.names.items():
+            names.setdefault(resolve(cluster), name)
+        return names
+
+    def renamed(self) -> dict:
+        """Speaker ids written earlier whose speaker has since been merged -> the id it goes by now."""
+        current = self.speaker_names()
+        return {name: current[self.resolve(cluster)] for cluster, name in self.names.items()
+                if current[self.resolve(cluster)] != name}
+
+    def to_dict(self):
+        return {
+            "stats": self.stats.to_dict(),
+            "gap_count": self.gap_count,
+            "gap_squares": self.gap_squares.tolist(),
+            "clusters": [[i, self.sums[i].tolist(), self.squares[i].tolist(), self.counts[i]] for i in self.sums],
+            "merged_into": [[drop, keep] for drop, keep in self.merged_into.items()],
+            "names": [[cluster, name] for cluster, name in self.names.items()],
+            "next_id": self.next_id,
+        }
+
+    @classmethod
+    def from_dict(cls, state, **kwargs):
+        clusterer = cls(**kwargs)
+        clusterer.stats = RunningStats(EMBEDDING_DIM, **state["stats"])
+        clusterer.gap_count = state["gap_count"]
+        clusterer.gap_squares = np.asarray(state["gap_squares"], dtype=np.float64)
+        for i, sums, squares, count in state["clusters"]:
+            clusterer.sums[i] = np.asarray(sums, dtype=np.float64)
+            clusterer.squares[i] = np.asarray(squares, dtype=np.float64)
+            clusterer.counts[i] = count
+        clusterer.merged_into = dict(state["merged_into"])
+        clusterer.names = dict(state["names"])
+        clusterer.next_id = state["next_id"]
+        return clusterer
+
+def load_diarization_state(state_path) -> dict:
+    """Recording -> IncrementalSpeakerClusterer saved by save_diarization_state, or {} if there is none."""
+    if not state_path or not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("version") == STATE_VERSION and state.get("embedding_dim") == EMBEDDING_DIM:
+            return {recording: IncrementalSpeakerClusterer.from_dict(s) for recording, s in state["recordings"].items()}
+        print(f"Diarization state {state_path} was written with other settings, starting fresh.")
+    except Exception as e:
+        print(f"Could not read diarization state {state_path}, starting fresh: {e}")
+    return {}
+
+def save_diarization_state(clusterers: dict, state_path):
+    """Writes every recording's clusterer atomically so the next run continues from it."""
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "embedding_dim": EMBEDDING_DIM,
+            "recordings": {recording: c.to_dict() for recording, c in clusterers.items()},
+        }, f)
+    os.replace(tmp_path, state_path)
+
+# --- Turn Detection ---
+def smooth_labels(labels: list) -> list:
+    """Single windows that disagree with both neighbours take their label (3-window majority)."""
+    smoothed = list(labels)
+    for i in range(1, len(labels) - 1):
+        if labels[i - 1] == labels[i + 1] != labels[i]:
+            smoothed[i] = labels[i - 1]
+    return smoothed
+
+def speaker_turns(window_starts, labels, duration_sec) -> List[Tuple[float, float, int]]:
+    """
+    [(start_sec, end_sec, speaker), ...] within a segment. A turn change falls
+    midway between the centers of the last window of one speaker and the first
+    of the next; the last turn runs to the end of the segment.
+    """
+    centers = np.asarray(window_starts) + EMBED_WINDOW_SEC / 2
+    turns = []
+    for i, label in enumerate(labels):
+        if turns and turns[-1][2] == label:
+            continue
+        if turns:
+            turns[-1][1] = (centers[i - 1] + centers[i]) / 2
+        turns.append([window_starts[i] if not turns else turns[-1][1], duration_sec, label])
+    return [(round(float(start), 2), round(float(end), 2), label) for start, end, label in turns]
+
+def diarize_recording(segments: list, clusterer: IncrementalSpeakerClusterer) -> Tuple[list, dict]:
+    """
+    Assigns the windows of a recording's new segments ((window starts,
+    embeddings, duration) in time order) to speakers, continuing the
+    recording's clusterer. Returns per segment a list of (start_sec, end_sec,
+    speaker) turns, and speaker -> speaker id.
+    """
+    assigned = [clusterer.assign_segment(embeddings) for _, embeddings, _ in segments]
+    final = clusterer.finished()
+    # Labels are resolved once the batch is done, so every segment sees the final speakers
+    turns_per_segment = [
+        speaker_turns(window_starts, smooth_labels([final.resolve(label) for label in labels]), duration)
+        for (window_starts, _, duration), labels in zip(segments, assigned)
+    ]
+    return turns_per_segment, speaker_ids(turns_per_segment, clusterer, final)
+
+def speaker_ids(turns_per_segment: list, clusterer: IncrementalSpeakerClusterer,
+                final: IncrementalSpeakerClusterer) -> dict:
+    """
+    Speaker -> neutral speaker id (SPEAKER_00, SPEAKER_01, ... by first
+    appearance in the recording). Speakers keep the ids given out in earlier
+    batches; new ones are recorded in clusterer.names. Which speaker is CAP, FO
+    or ATC is not known here; speaker_roles.py maps ids to roles for the alert rules.
+    """
+    names = clusterer.speaker_names(final.resolve)
+    for turns in turns_per_segment:
+        for _, _, speaker in turns:
+            if speaker not in names:
+                names[speaker] = clusterer.names[speaker] = f"SPEAKER_{len(clusterer.names):02d}"
+    return names
+
+def primary_speaker(turns) -> Optional[int]:
+    """The cluster with the most speaking time in a segment, or None if nobody spoke."""
+    talk = {}
+    for start, end, cluster in turns:
+        talk[cluster] = talk.get(cluster, 0.0) + end - start
+    return max(talk, key=talk.get) if talk else None
+
+def format_turns(turns, roles) -> str:
+    return ";".join(f"{start:.2f}-{end:.2f}:{roles[cluster]}" for start, end, cluster in turns)
+
+def diarize_segments_embedding(df: pd.DataFrame, clusterers: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Embedding backend for diarize_segments. Embeddings are computed for all
+    rows in parallel batches; clustering then walks each recording ('source',
+    by start time) once, so the cost grows linearly with the number of segments.
+    `clusterers` (recording -> IncrementalSpeakerClusterer) continues earlier
+    runs and receives the clusterers of new recordings.
+    """
+    clusterers = {} if clusterers is None else clusterers
+    if open_segment_store(SEGMENT_STORE_PATH) is not None:
+        sources, store_path = df['segment_index'].tolist(), SEGMENT_STORE_PATH
+    else:
+        sources, store_path = df['file_path'].tolist(), None
+    embeddings = compute_embeddings(sources, store_path=store_path)
+
+    recordings = df['source'].astype(str) if 'source' in df.columns else pd.Series("unknown", index=df.index)
+    time_order = df['start_sec'].to_numpy() if 'start_sec' in df.columns else np.arange(len(df))
+
+    speaker_role = np.full(len(df), "UNKNOWN", dtype=object)
+    turns_text = np.full(len(df), "", dtype=object)
+    for recording, positions in pd.Series(np.arange(len(df)), index=recordings.to_numpy()).groupby(level=0):
+        positions = positions.to_numpy()[np.argsort(time_order[positions], kind='stable')]
+        with timed("diarization"):
+            clusterer = clusterers.setdefault(recording, IncrementalSpeakerClusterer())
+            turns_per_segment, names = diarize_recording([embeddings[p] for p in positions], clusterer)
+        for p, turns in zip(positions, turns_per_segment):
+            speaker = primary_speaker(turns)
+            if speaker is not None:
+                speaker_role[p] = names[speaker]
+            turns_text[p] = format_turns(turns, names)
+            METRICS.inc("speaker_turns", len(turns))
+    return pd.DataFrame({'speaker_role': speaker_role, 'speaker_turns': turns_text}, index=df.index)
+
+def diarize_segments(df: pd.DataFrame, clusterers: Optional[dict] = None) -> pd.DataFrame:
+    """
+    speaker_role (primary speaker) and speaker_turns for every row of the ASR
+    metadata, in row order. `clusterers` carries the embedding backend's
+    per-recording state across calls (see diarize_segments_embedding).
+    """
+    if DIARIZATION_BACKEND == "embedding":
+        return diarize_segments_embedding(df, clusterers)
+
+    def timed_diarization(file_path):
+        with timed("diarization"):
+            return perform_diarization(file_path)
+    return pd.DataFrame({'speaker_role': df['file_path'].apply(timed_diarization), 'speaker_turns': ""},
+                        index=df.index)
+
+def rename_merged_speakers(df: pd.DataFrame, clusterers: dict) -> pd.DataFrame:
+    """
+    speaker_role / speaker_turns of rows diarized in an earlier run, with the
+    ids of speakers merged since then replaced by the id they go by now.
+    """
+    df = df.copy()
+    recordings = df['source'].astype(str) if 'source' in df.columns else pd.Series("unknown", index=df.index)
+    for recording, clusterer in clusterers.items():
+        renamed = clusterer.renamed()
+        rows = (recordings == recording).to_numpy()
+        if not renamed or not rows.any():
+            continue
+        df.loc[rows, 'speaker_role'] = df.loc[rows, 'speaker_role'].replace(renamed)
+        pattern = re.compile(":(" + "|".join(map(re.escape, renamed)) + ")(?=;|$)")
+        df.loc[rows, 'speaker_turns'] = df.loc[rows, 'speaker_turns'].str.replace(
+            pattern, lambda m: ":" + renamed[m.group(1)], regex=True)
+    return df
+
+def diarize_new_segments(df: pd.DataFrame, previous_path, state_path=DIARIZATION_STATE_FILE) -> pd.DataFrame:
+    """
+    diarize_segments for metadata that grows between runs. Rows found in
+    previous_path (an earlier run's output, matched by file_path) keep their
+    speakers, with merged speaker ids updated; only the other rows are
+    clustered, continuing the clusterers saved at state_path, which are saved
+    again afterwards. Without saved clusterers every row is diarized.
+    """
+    if DIARIZATION_BACKEND != "embedding":
+        return diarize_segments(df)
+    clusterers = load_diarization_state(state_path)
+    previous = pd.DataFrame(columns=['file_path', 'speaker_role', 'speaker_turns'])
+    if clusterers:
+        try:
+            previous = read_table(previous_path, columns=['file_path', 'speaker_role', 'speaker_turns'])
+        except (FileNotFoundError, KeyError, ValueError):
+            # No earlier output (or one without speakers): the saved clusterers can't be matched to rows
+            clusterers = {}
+    previous = previous.drop_duplicates('file_path').set_index('file_path')
+    is_new = ~df['file_path'].isin(previous.index).to_numpy()
+    if not is_new.all():
+        print(f"{(~is_new).sum()} segments were diarized by an earlier run; clustering {is_new.sum()} new ones.")
+
+    speakers = pd.DataFrame({'speaker_role': "UNKNOWN", 'speaker_turns': ""}, index=df.index)
+    if is_new.any():
+        speakers.loc[is_new] = diarize_segments(df[is_new], clusterers)
+    if not is_new.all():
+        earlier = previous.loc[df.loc[~is_new, 'file_path']].set_index(df.index[~is_new])
+        if 'source' in df.columns:
+            earlier['source'] = df.loc[~is_new, 'source']
+        speakers.loc[~is_new] = rename_merged_speakers(earlier, clusterers)[['speaker_role', 'speaker_turns']]
+    save_diarization_state(clusterers, state_path)
+    return speakers
+
+def report_unmapped_speakers(unmapped: int):
+    if unmapped:
+        print(f"{unmapped} speakers have no role in {SPEAKER_ROLES_FILE} yet. Fill in CAP, FO or ATC there; "
+              f"alert.py applies the ATC rules only to speakers mapped to ATC.")
+
 # --- Script Execution ---
 if __name__ == "__main__":
     
     # Reload the metadata file with the transcription results (Phase 2 output)
     try:
-        df = pd.read_csv("asr_data.csv") 
+        df = read_table(ASR_METADATA_FILE)
     except FileNotFoundError:
-        print("Error: asr_data.csv not found. Did ASR fine-tuning complete successfully?")
+        print(f"Error: {ASR_METADATA_FILE} not found. Did ASR fine-tuning complete successfully?")
         exit()
 
     print(f"Starting diarization on {len(df)} segments...")
-    
-    # Apply the diarization function to each segment
-    df['speaker_role'] = df['file_path'].apply(perform_diarization)
-    
+
+    # Apply the diarization function to each segment not diarized by an earlier run
+    df = df.join(diarize_new_segments(df, DIARIZED_METADATA_FILE))
+
     # Save the updated DataFrame
-    df.to_csv(DIARIZED_METADATA_FILE, index=False)
-    print(f"\nPhase 3: Speaker Diarization Complete. Results saved to {DIARIZED_METADATA_FILE}")
\ No newline at end of file
+    write_table(df, DIARIZED_METADATA_FILE)
+    print(f"\nPhase 3: Speaker Diarization Complete. Results saved to {DIARIZED_METADATA_FILE}")
+    if DIARIZATION_BACKEND == "embedding":
+        report_unmapped_speakers(update_speaker_roles_file(df))
+    METRICS.export("speaker_diarization")
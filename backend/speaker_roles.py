@@ -0,0 +1,56 @@
+import os
+import pandas as pd
+
+# --- Configuration ---
+# Diarization finds speakers (SPEAKER_00, SPEAKER_01, ... per recording) but not who they
+# are. This file maps them to roles: one row per recording ('source') and speaker, with the
+# role column filled in by a reviewer. speaker_diarization.py adds rows for new speakers.
+SPEAKER_ROLES_FILE = "speaker_roles.csv"
+KNOWN_ROLES = ("CAP", "FO", "ATC")
+ROLE_COLUMNS = ['source', 'speaker', 'role']
+
+# --- Role Map ---
+def load_speaker_roles(path=SPEAKER_ROLES_FILE) -> dict:
+    """(source, speaker id) -> role for every row of the roles file with a known role."""
+    if not os.path.exists(path):
+        return {}
+    roles = pd.read_csv(path, dtype=str).fillna("")
+    roles['role'] = roles['role'].str.strip().str.upper()
+    unknown = roles[(roles['role'] != "") & ~roles['role'].isin(KNOWN_ROLES)]
+    if len(unknown):
+        print(f"Ignoring {len(unknown)} rows of {path} with a role other than {', '.join(KNOWN_ROLES)}.")
+    roles = roles[roles['role'].isin(KNOWN_ROLES)]
+    return dict(zip(zip(roles['source'], roles['speaker']), roles['role']))
+
+def apply_speaker_roles(df: pd.DataFrame, roles: dict) -> pd.Series:
+    """
+    speaker_role with each mapped speaker replaced by its role (CAP, FO, ATC).
+    Speakers without a role keep their id, so the ATC rules don't apply to them.
+    """
+    if not roles:
+        return df['speaker_role']
+    sources = df['source'].astype(str) if 'source' in df.columns else pd.Series("unknown", index=df.index)
+    keys = pd.Series(list(zip(sources, df['speaker_role'].astype(str))), index=df.index)
+    return keys.map(roles).fillna(df['speaker_role'].astype(object))
+
+def update_speaker_roles_file(df: pd.DataFrame, path=SPEAKER_ROLES_FILE) -> int:
+    """
+    Adds a row with an empty role for every (source, speaker_role) of df not
+    in the roles file yet; rows already there are kept as they are. Returns
+    the number of speakers still without a role.
+    """
+    if 'source' in df.columns:
+        speakers = df[['source', 'speaker_role']].astype(str).drop_duplicates()
+    else:
+        speakers = pd.DataFrame({'source': "unknown", 'speaker_role': df['speaker_role'].astype(str).unique()})
+    speakers = speakers[speakers['speaker_role'] != "UNKNOWN"].rename(columns={'speaker_role': 'speaker'})
+    existing = pd.read_csv(path, dtype=str).fillna("") if os.path.exists(path) else pd.DataFrame(columns=ROLE_COLUMNS)
+
+    listed = set(zip(existing['source'], existing['speaker']))
+    new = speakers[[key not in listed for key in zip(speakers['source'], speakers['speaker'])]].assign(role="")
+    if len(new):
+        combined = pd.concat([existing, new[ROLE_COLUMNS]], ignore_index=True)
+        combined.sort_values(['source', 'speaker'], kind='stable').to_csv(path, index=False)
+    else:
+        combined = existing
+    return int((combined['role'].str.strip() == "").sum())
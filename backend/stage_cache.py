@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+
+# --- Configuration ---
+MANIFEST_VERSION = 1
+SAVE_EVERY = 500  # flush the manifest after this many new records
+
+# --- Hashing Helpers ---
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a file, read in chunks."""
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_key(*parts) -> str:
+    """
+    Combines a source hash with stage parameters into one cache key, e.g.
+    stage_key(audio_hash, "segment", SEGMENT_LENGTH_SEC, TARGET_SR).
+    """
+    return hash_bytes("|".join(str(p) for p in parts).encode('utf-8'))
+
+# --- Manifest-Backed Cache ---
+class StageCache:
+    """
+    JSON manifest mapping (stage, item name) -> {"key": ..., "outputs": [...]}.
+    An item is fresh when its stored key matches and all its outputs exist,
+    so changed sources or stage parameters invalidate only affected items.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.stages = {}
+        self._pending = 0
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    self.stages = manifest.get("stages", {})
+            except Exception as e:
+                print(f"Could not read cache manifest {manifest_path}, starting fresh: {e}")
+
+    def get(self, stage: str, name: str):
+        return self.stages.get(stage, {}).get(name)
+
+    def is_fresh(self, stage: str, name: str, key: str, exists=os.path.exists) -> bool:
+        """`exists` checks each recorded output; defaults to a file-exists check."""
+        entry = self.get(stage, name)
+        return (
+            entry is not None
+            and entry["key"] == key
+            and all(exists(p) for p in entry["outputs"])
+        )
+
+    def record(self, stage: str, name: str, key: str, outputs, meta=None):
+        """`meta` is any JSON-serializable extra stored with the entry."""
+        entry = {"key": key, "outputs": list(outputs)}
+        if meta is not None:
+            entry["meta"] = meta
+        self.stages.setdefault(stage, {})[name] = entry
+        self._pending += 1
+        if self._pending >= SAVE_EVERY:
+            self.save()
+
+    def save(self):
+        """Writes the manifest atomically so an interrupted run keeps the last good copy."""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "stages": self.stages}, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._pending = 0
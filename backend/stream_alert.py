@@ -0,0 +1,263 @@
+import os
+import csv
+import time
+import wave
+import asyncio
+import numpy as np
+from alert import FINE_TUNED_MODEL_PATH, load_asr_pipeline, analyze_transcript_and_alert, apply_stress_trend
+from emotion_detection import STRESS_STATE_FILE, extract_features_from_array
+from stress_normalizer import OnlineStressNormalizer
+from stress_trend import SustainedStressDetector, trend_key
+from metrics import METRICS, timed
+
+# --- Configuration ---
+# Where live audio comes from: "socket" (raw PCM over TCP), "fifo" (named pipe) or "wav" (tailed file)
+STREAM_SOURCE = "socket"
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 8765
+STREAM_FIFO_PATH = "./live_audio.fifo"
+STREAM_WAV_PATH = "./live_audio.wav"
+STREAM_REPORT_FILE = "streaming_alert_report.csv"
+
+# Incoming audio is raw mono int16 PCM at TARGET_SR (WAV sources are read from their header)
+TARGET_SR = 16000
+CHUNK_BYTES = 4096  # read size from the source
+SEGMENT_LENGTH_SEC = 10  # same cut length as preprocessing.py
+RING_BUFFER_SEC = 60  # audio the ring buffer can hold before the reader waits
+MAX_PENDING_SEGMENTS = 2  # segments queued for ASR before segmentation waits
+TAIL_POLL_SEC = 0.2  # how often a tailed WAV is checked for new data
+
+STREAM_SPEAKER_ROLE = "Unknown"  # no diarization on the live path
+STREAM_FLIGHT_ID = "live"  # stress baseline key for this stream
+BASELINE_SAVE_EVERY = 30  # segments between baseline saves (also saved when the stream stops)
+
+# --- Ring Buffer ---
+class RingBuffer:
+    """
+    Fixed-capacity int16 sample buffer. write() waits while the buffer is full,
+    so a slow consumer pauses the reader instead of growing memory.
+    """
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.closed = False
+        self._changed = asyncio.Condition()
+
+    async def write(self, samples):
+        offset = 0
+        while offset < len(samples):
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.size < self.capacity)
+                count = min(len(samples) - offset, self.capacity - self.size)
+                end = (self.start + self.size) % self.capacity
+                first = min(count, self.capacity - end)
+                self.data[end:end + first] = samples[offset:offset + first]
+                self.data[:count - first] = samples[offset + first:offset + count]
+                self.size += count
+                offset += count
+                self._changed.notify_all()
+
+    async def read(self, count):
+        """Waits for `count` samples (fewer only once closed) and removes them."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.size >= count or self.closed)
+            count = min(count, self.size)
+            indices = (self.start + np.arange(count)) % self.capacity
+            samples = self.data[indices]
+            self.start = (self.start + count) % self.capacity
+            self.size -= count
+            self._changed.notify_all()
+            return samples
+
+    async def close(self):
+        async with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+# --- Audio Sources ---
+async def socket_source(host, port):
+    """Yields PCM chunks from the first client that connects."""
+    connected = asyncio.Queue(maxsize=1)
+
+    async def on_connect(reader, writer):
+        await connected.put((reader, writer))
+
+    server = await asyncio.start_server(on_connect, host, port)
+    print(f"Waiting for live audio on {host}:{port}...")
+    async with server:
+        reader, writer = await connected.get()
+        try:
+            while chunk := await reader.read(CHUNK_BYTES):
+                yield chunk
+        finally:
+            writer.close()
+
+async def fifo_source(path):
+    """Yields PCM chunks from a named pipe; blocking reads run in a thread."""
+    if not os.path.exists(path):
+        os.mkfifo(path)
+    print(f"Waiting for live audio on FIFO {path}...")
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        while chunk := await asyncio.to_thread(f.read, CHUNK_BYTES):
+            yield chunk
+    finally:
+        f.close()
+
+async def wav_tail_source(path, stop_after_idle_sec=None):
+    """Yields PCM chunks appended to a WAV file as it is being recorded."""
+    with wave.open(path, 'rb') as wav_file:
+        if wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2 or wav_file.getframerate() != TARGET_SR:
+            raise ValueError(f"{path} must be mono 16-bit PCM at {TARGET_SR} Hz")
+    idle = 0.0
+    with open(path, 'rb') as f:
+        # Samples start after the 'data' chunk header; the chunk grows as the file is recorded
+        header = f.read(4096)
+        f.seek(header.index(b'data') + 8)
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if chunk:
+                idle = 0.0
+                yield chunk
+                continue
+            if stop_after_idle_sec is not None and idle >= stop_after_idle_sec:
+                return
+            await asyncio.sleep(TAIL_POLL_SEC)
+            idle += TAIL_POLL_SEC
+
+# --- Pipeline Stages ---
+async def fill_buffer(chunks, ring):
+    """Source -> ring buffer. Odd trailing bytes are carried to the next chunk."""
+    leftover = b''
+    try:
+        async for chunk in chunks:
+            data = leftover + chunk
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            with timed("decode"):
+                samples = np.frombuffer(data[:usable], dtype=np.int16)
+            await ring.write(samples)
+    finally:
+        await ring.close()
+
+async def cut_segments(ring, segments, sr):
+    """Ring buffer -> fixed-length segments; the bounded queue applies backpressure."""
+    segment_samples = int(SEGMENT_LENGTH_SEC * sr)
+    segment_index = 0
+    while True:
+        samples = await ring.read(segment_samples)
+        if len(samples) == 0:
+            break
+        # Alert latency is measured from when the segment is cut from the buffer
+        await segments.put((segment_index, samples, time.monotonic()))
+        segment_index += 1
+        if len(samples) < segment_samples:
+            break
+    await segments.put(None)
+
+async def analyze_segments(segments, asr_pipeline, sr, report_path):
+    """Segments -> ASR -> stress -> alert rules, one segment at a time."""
+    # Baselines persist across runs, so a new stream starts from what earlier ones learned
+    normalizer = OnlineStressNormalizer(STRESS_STATE_FILE)
+    baseline_keys = (STREAM_FLIGHT_ID, f"{STREAM_FLIGHT_ID}/{STREAM_SPEAKER_ROLE}")
+    # Same detector and rule as the batch report, fed one segment at a time
+    trend_detector = SustainedStressDetector()
+    speaker_key = trend_key(STREAM_FLIGHT_ID, STREAM_SPEAKER_ROLE)
+    latencies = []
+    # Ctrl-C (the usual way to stop a tailed WAV) or an ASR error cancels this task;
+    # baselines learned so far are still saved
+    try:
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['segment_index', 'start_sec', 'duration', 'speaker_role', 'stress_score',
+                             'stress_trend_mean', 'stress_trend_slope', 'transcript', 'alert_level',
+                             'alert_reason', 'latency_sec'])
+            while (item := await segments.get()) is not None:
+                segment_index, samples, ready_at = item
+                y = samples.astype(np.float32) / 32768
+                with timed("asr"):
+                    result = await asyncio.to_thread(asr_pipeline, {"raw": y, "sampling_rate": sr})
+                with timed("feature_extraction"):
+                    features = await asyncio.to_thread(extract_features_from_array, y, sr)
+                with timed("stress_scoring"):
+                    stress_score = normalizer.score(features, baseline_keys)
+                row = {
+                    'transcript': result["text"].strip(),
+                    'stress_score': stress_score,
+                    'speaker_role': STREAM_SPEAKER_ROLE,
+                }
+                with timed("rule_evaluation"):
+                    alert_level, alert_reason = analyze_transcript_and_alert(row)
+                    trend_mean, trend_slope, _, sustained = trend_detector.update(speaker_key, stress_score)
+                    levels, reasons = apply_stress_trend(
+                        np.array([alert_level], dtype=object), np.array([alert_reason], dtype=object),
+                        np.array([sustained]), np.array([trend_mean]), np.array([trend_slope]))
+                    alert_level, alert_reason = levels[0], reasons[0]
+                latency = time.monotonic() - ready_at
+                latencies.append(latency)
+                METRICS.observe("end_to_end", latency)
+                METRICS.inc("segments_processed")
+                if alert_level != "Routine":
+                    METRICS.inc("alerts_raised")
+
+                start_sec = segment_index * SEGMENT_LENGTH_SEC
+                writer.writerow([segment_index, start_sec, len(samples) / sr, row['speaker_role'],
+                                 round(row['stress_score'], 2), round(trend_mean, 2), round(trend_slope, 2),
+                                 row['transcript'], alert_level, alert_reason, round(latency, 3)])
+                f.flush()
+                if alert_level != "Routine":
+                    print(f"[{start_sec:>7.1f}s] {alert_level}: {alert_reason} | \"{row['transcript']}\" "
+                          f"(latency {latency:.2f}s)")
+                if len(latencies) % BASELINE_SAVE_EVERY == 0:
+                    normalizer.save()
+    finally:
+        normalizer.save()
+    return latencies
+
+async def run_stream(chunks, asr_pipeline, sr=TARGET_SR, report_path=STREAM_REPORT_FILE):
+    """
+    Runs source -> ring buffer -> segmenter -> analysis as concurrent tasks.
+    Memory is bounded by RING_BUFFER_SEC plus MAX_PENDING_SEGMENTS segments; when
+    ASR falls behind, the queue fills, the segmenter stops draining the ring
+    buffer, and the reader stops pulling from the source. Alert latency per
+    segment is at most about (MAX_PENDING_SEGMENTS + 1) ASR calls.
+    """
+    ring = RingBuffer(int(RING_BUFFER_SEC * sr))
+    segments = asyncio.Queue(maxsize=MAX_PENDING_SEGMENTS)
+    try:
+        _, _, latencies = await asyncio.gather(
+            fill_buffer(chunks, ring),
+            cut_segments(ring, segments, sr),
+            analyze_segments(segments, asr_pipeline, sr, report_path),
+        )
+        if latencies:
+            print(f"\nStream ended: {len(latencies)} segments, alert latency "
+                  f"mean {np.mean(latencies):.2f}s / max {np.max(latencies):.2f}s")
+        print(f"Streaming alerts saved to: {report_path}")
+    finally:
+        # Also exported when the stream is interrupted, with the segments seen so far
+        METRICS.export("stream_alert")
+
+# --- Script Execution ---
+if __name__ == "__main__":
+    asr_pipeline = load_asr_pipeline(FINE_TUNED_MODEL_PATH)
+    if asr_pipeline is None:
+        exit()
+
+    if STREAM_SOURCE == "socket":
+        source = socket_source(STREAM_HOST, STREAM_PORT)
+    elif STREAM_SOURCE == "fifo":
+        source = fifo_source(STREAM_FIFO_PATH)
+    elif STREAM_SOURCE == "wav":
+        source = wav_tail_source(STREAM_WAV_PATH)
+    else:
+        print(f"Error: unknown STREAM_SOURCE '{STREAM_SOURCE}'. Use 'socket', 'fifo' or 'wav'.")
+        exit()
+
+    try:
+        asyncio.run(run_stream(source, asr_pipeline))
+    except KeyboardInterrupt:
+        print("\nStreaming stopped.")
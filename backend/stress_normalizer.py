@@ -0,0 +1,102 @@
+import os
+import json
+import numpy as np
+
+# --- Configuration ---
+STATE_VERSION = 1
+GLOBAL_BASELINE = "__global__"
+MIN_BASELINE_SEGMENTS = 20  # a baseline is used only once it has seen this many segments
+NEUTRAL_SCORE = 50.0  # score while not even the global baseline is ready
+
+# --- Running Statistics ---
+class RunningStats:
+    """Welford running mean/variance of a feature vector; O(1) per update."""
+
+    def __init__(self, num_features, count=0, mean=None, m2=None):
+        self.count = count
+        self.mean = np.zeros(num_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.m2 = np.zeros(num_features) if m2 is None else np.asarray(m2, dtype=np.float64)
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def std(self):
+        """Population std, matching StandardScaler."""
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.mean)
+
+    def standardize(self, x):
+        std = self.std()
+        return np.where(std > 0, (x - self.mean) / np.where(std > 0, std, 1), 0.0)
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+# --- Online Stress Normalizer ---
+class OnlineStressNormalizer:
+    """
+    Incremental replacement for the StandardScaler fit in train_and_predict_stress.
+    Features are standardized against running baselines (global, plus optional
+    keys such as a flight or a speaker within a flight), then combined with the
+    same (pitch + energy) * 25 + 50 rule. Each segment is scored against the
+    baselines as they were before it arrived, then added to them, so a score
+    depends only on earlier segments and never changes afterwards.
+    """
+
+    def __init__(self, state_path=None, num_features=3, min_count=MIN_BASELINE_SEGMENTS):
+        self.state_path = state_path
+        self.num_features = num_features
+        self.min_count = min_count
+        self.baselines = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("version") == STATE_VERSION and state.get("num_features") == num_features:
+                    self.baselines = {
+                        key: RunningStats(num_features, **stats) for key, stats in state["baselines"].items()
+                    }
+            except Exception as e:
+                print(f"Could not read stress baselines {state_path}, starting fresh: {e}")
+
+    def _baseline(self, key):
+        if key not in self.baselines:
+            self.baselines[key] = RunningStats(self.num_features)
+        return self.baselines[key]
+
+    def score(self, features, keys=(), update=True):
+        """
+        Stress score (0-100) for one segment. `keys` go from broadest to most
+        specific (e.g. ("flight_12", "flight_12/CAP")); the most specific baseline
+        with at least min_count segments is used, else the global one.
+        """
+        x = np.asarray(features, dtype=np.float64)
+        if not np.any(x):
+            # Failed extractions come back as all zeros; they never enter the baselines
+            return NEUTRAL_SCORE
+        chain = [GLOBAL_BASELINE] + [str(k) for k in keys]
+        ready = [self.baselines[k] for k in chain if k in self.baselines and self.baselines[k].count >= self.min_count]
+        if ready:
+            scaled = ready[-1].standardize(x)
+            stress_score = float(np.clip((scaled[0] + scaled[1]) * 25 + 50, 0, 100))
+        else:
+            stress_score = NEUTRAL_SCORE
+        if update:
+            for key in chain:
+                self._baseline(key).update(x)
+        return stress_score
+
+    def save(self):
+        """Writes baselines atomically so the next run (or stream) resumes from them."""
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": STATE_VERSION,
+                "num_features": self.num_features,
+                "baselines": {key: stats.to_dict() for key, stats in self.baselines.items()},
+            }, f)
+        os.replace(tmp_path, self.state_path)
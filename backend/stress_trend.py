@@ -0,0 +1,117 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+TREND_WINDOW = 6  # segments per speaker (about a minute with 10s segments)
+MIN_TREND_SEGMENTS = 4  # no trend verdict before a speaker has this many segments
+SUSTAINED_MEAN_THRESHOLD = 60  # window mean at or above this is sustained stress
+RISING_SLOPE_THRESHOLD = 3.0  # score points per segment; a climb this steep counts too...
+RISING_MEAN_FLOOR = 50  # ...once the window mean is above the neutral score
+
+# --- Sliding Window ---
+class StressWindow:
+    """
+    The last `size` stress scores of one speaker with running mean, least-squares
+    slope (points per segment) and max. Each update is O(1): the sums are
+    adjusted for the score that enters and the one that leaves, and the max
+    comes from a monotonic deque.
+    """
+
+    def __init__(self, size=TREND_WINDOW):
+        self.size = size
+        self.scores = deque()
+        self.total = 0.0
+        self.weighted = 0.0  # sum of position * score, positions 0..n-1 oldest first
+        self.maxima = deque()  # (position counter, score), scores decreasing
+        self.seen = 0
+
+    def update(self, score):
+        score = float(score)
+        if len(self.scores) == self.size:
+            oldest = self.scores.popleft()
+            # Every remaining score moves down one position
+            self.total -= oldest
+            self.weighted -= self.total
+        self.weighted += len(self.scores) * score
+        self.total += score
+        self.scores.append(score)
+
+        while self.maxima and self.maxima[-1][1] <= score:
+            self.maxima.pop()
+        self.maxima.append((self.seen, score))
+        if self.maxima[0][0] <= self.seen - self.size:
+            self.maxima.popleft()
+        self.seen += 1
+
+    def mean(self):
+        return self.total / len(self.scores) if self.scores else 0.0
+
+    def slope(self):
+        n = len(self.scores)
+        if n < 2:
+            return 0.0
+        # sum((i - i_mean) * score) / sum((i - i_mean)^2) for positions i = 0..n-1
+        return (self.weighted - (n - 1) / 2 * self.total) / (n * (n * n - 1) / 12)
+
+    def max(self):
+        return self.maxima[0][1] if self.maxima else 0.0
+
+# --- Detector ---
+class SustainedStressDetector:
+    """
+    One StressWindow per key (a speaker within a recording). update() returns
+    the window statistics after adding the score and whether they amount to
+    sustained stress, so feeding segments one at a time (streaming) or row by
+    row over a report (batch) gives the same answers. Non-finite scores (failed
+    segments) are skipped: the window keeps its last statistics.
+    """
+
+    def __init__(self, size=TREND_WINDOW):
+        self.size = size
+        self.windows = {}
+
+    def update(self, key, score):
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = StressWindow(self.size)
+        if np.isfinite(score):
+            window.update(score)
+        mean, slope = window.mean(), window.slope()
+        sustained = len(window.scores) >= MIN_TREND_SEGMENTS and (
+            mean >= SUSTAINED_MEAN_THRESHOLD or (slope >= RISING_SLOPE_THRESHOLD and mean >= RISING_MEAN_FLOOR)
+        )
+        return mean, slope, window.max(), sustained
+
+def trend_key(source, speaker_role):
+    return f"{source}/{speaker_role}"
+
+def detect_stress_trends(df: pd.DataFrame, detector=None) -> pd.DataFrame:
+    """
+    Batch run of the detector over a report: rows are fed in time order
+    ('start_sec', else 'segment_index', else row order) per speaker ('source'
+    and 'speaker_role'). Returns stress_trend_mean/slope/max and
+    sustained_stress columns aligned with df.
+    """
+    detector = detector or SustainedStressDetector()
+    sources = df['source'].astype(str).to_numpy() if 'source' in df.columns else np.full(len(df), "unknown")
+    roles = df['speaker_role'].astype(str).to_numpy() if 'speaker_role' in df.columns else np.full(len(df), "UNKNOWN")
+    for column in ('start_sec', 'segment_index'):
+        if column in df.columns:
+            order = np.argsort(df[column].to_numpy(), kind='stable')
+            break
+    else:
+        order = np.arange(len(df))
+
+    scores = df['stress_score'].to_numpy(dtype=np.float64)
+    results = np.zeros((len(df), 3))
+    sustained = np.zeros(len(df), dtype=bool)
+    for i in order:
+        mean, slope, peak, sustained[i] = detector.update(trend_key(sources[i], roles[i]), scores[i])
+        results[i] = mean, slope, peak
+    return pd.DataFrame({
+        'stress_trend_mean': results[:, 0],
+        'stress_trend_slope': results[:, 1],
+        'stress_trend_max': results[:, 2],
+        'sustained_stress': sustained,
+    }, index=df.index)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import phase_io
+
+def test_all_nan_declared_columns_are_written_typed(tmp_path):
+    df = pd.DataFrame({
+        'file_path': ["a.wav", "b.wav"],
+        'source': [np.nan, np.nan],
+        'speaker_role': [np.nan, np.nan],
+        'stress_score': [np.nan, np.nan],
+        'alert_level': [None, None],
+    })
+    path = str(tmp_path / "phase.parquet")
+    phase_io.write_table(df, path)
+
+    table = phase_io.to_typed_table(df)
+    for name in ('source', 'speaker_role', 'stress_score', 'alert_level'):
+        assert table.schema.field(name).type == phase_io.SCHEMA[name]
+        assert table[name].null_count == 2
+    back = phase_io.read_table(path)
+    assert back['file_path'].tolist() == ["a.wav", "b.wav"]
+    assert back['source'].isna().all()
+
+def test_csv_fallback_with_empty_declared_columns(tmp_path):
+    csv_path = tmp_path / "phase.csv"
+    csv_path.write_text("file_path,source,speaker_role,alert_level,stress_score\na.wav,,,,\nb.wav,,,,50\n")
+    df = phase_io.read_table(str(tmp_path / "phase.parquet"))
+
+    assert df['source'].isna().all() and df['alert_level'].isna().all()
+    assert df['stress_score'].tolist()[1] == 50
+    assert isinstance(phase_io.to_typed_table(df).schema.field('source').type, pa.DictionaryType)
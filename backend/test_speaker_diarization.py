@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pandas as pd
+import soundfile as sf
+import phase_io
+import speaker_diarization
+from benchmark_pipeline import make_cockpit_clip
+
+SEGMENT_SEC = 10
+
+def write_recording(tmp_path, rng, name, speakers, num_segments, snr_db):
+    """Cuts a synthetic cockpit recording with the given voices into SEGMENT_SEC WAV rows."""
+    y, _ = make_cockpit_clip(rng, num_segments * SEGMENT_SEC, snr_db, speakers=speakers)
+    rows = []
+    step = SEGMENT_SEC * speaker_diarization.TARGET_SR
+    for k in range(num_segments):
+        path = os.path.join(tmp_path, f"{name}_seg_{k}.wav")
+        sf.write(path, y[k * step:(k + 1) * step], speaker_diarization.TARGET_SR)
+        rows.append({'file_path': path, 'source': name, 'start_sec': k * SEGMENT_SEC, 'duration': SEGMENT_SEC})
+    return rows
+
+def diarize(monkeypatch, rows):
+    monkeypatch.setattr(speaker_diarization, "SEGMENT_STORE_PATH", "./no_segment_store")
+    df = pd.DataFrame(rows)
+    return df.join(speaker_diarization.diarize_segments(df))
+
+def speakers_found(df, source):
+    turns = ";".join(df.loc[df['source'] == source, 'speaker_turns'])
+    return {part.split(":")[1] for part in turns.split(";") if part}
+
+def test_single_speaker_recording_is_one_speaker(tmp_path, monkeypatch):
+    rng = np.random.default_rng(11)
+    df = diarize(monkeypatch, write_recording(tmp_path, rng, "solo", ["CAP"], 20, snr_db=20))
+
+    assert speakers_found(df, "solo") == {"SPEAKER_00"}
+    # One turn per segment: the voice is never split into several speakers
+    assert df['speaker_turns'].str.count(";").sum() == 0
+    assert set(df['speaker_role']) <= {"SPEAKER_00", "UNKNOWN"}
+
+def test_single_and_multi_speaker_recordings_together(tmp_path, monkeypatch):
+    rng = np.random.default_rng(12)
+    rows = (write_recording(tmp_path, rng, "solo", ["FO"], 12, snr_db=10)
+            + write_recording(tmp_path, rng, "pair", ["CAP", "ATC"], 12, snr_db=10))
+    df = diarize(monkeypatch, rows)
+
+    assert speakers_found(df, "solo") == {"SPEAKER_00"}
+    assert speakers_found(df, "pair") == {"SPEAKER_00", "SPEAKER_01"}
+    # Neutral ids only: clustering doesn't know who is CAP, FO or ATC
+    assert not set(df['speaker_role']) & {"CAP", "FO", "ATC"}
+
+def test_recording_labels_do_not_depend_on_other_recordings(tmp_path, monkeypatch):
+    rng = np.random.default_rng(13)
+    crew = write_recording(tmp_path, rng, "crew", ["CAP", "FO"], 8, snr_db=15)
+    others = write_recording(tmp_path, rng, "others", ["ATC", "CAP", "FO"], 8, snr_db=5)
+    alone = diarize(monkeypatch, crew)
+    together = diarize(monkeypatch, crew + others)
+
+    assert together.loc[together['source'] == "crew", 'speaker_turns'].tolist() == alone['speaker_turns'].tolist()
+
+def test_new_segments_continue_the_saved_clusterers(tmp_path, monkeypatch):
+    rng = np.random.default_rng(14)
+    monkeypatch.setattr(speaker_diarization, "SEGMENT_STORE_PATH", "./no_segment_store")
+    df = pd.DataFrame(write_recording(tmp_path, rng, "pair", ["CAP", "ATC"], 12, snr_db=10))
+    output_path = str(tmp_path / "diarized.parquet")
+    state_path = str(tmp_path / "diarization_state.json")
+    embedded = []
+    compute_embeddings = speaker_diarization.compute_embeddings
+    monkeypatch.setattr(speaker_diarization, "compute_embeddings",
+                        lambda sources, **kwargs: embedded.extend(sources) or compute_embeddings(sources, **kwargs))
+
+    first = df.iloc[:6].join(speaker_diarization.diarize_new_segments(df.iloc[:6], output_path, state_path))
+    phase_io.write_table(first, output_path)
+    later = df.join(speaker_diarization.diarize_new_segments(df, output_path, state_path))
+
+    # Only the appended segments were embedded and clustered
+    assert embedded == df['file_path'].tolist()
+    assert speakers_found(later, "pair") == {"SPEAKER_00", "SPEAKER_01"}
+    assert later['speaker_turns'].iloc[:6].tolist() == first['speaker_turns'].tolist()
@@ -0,0 +1,36 @@
+import pandas as pd
+from alert import analyze_alerts
+from speaker_roles import apply_speaker_roles, load_speaker_roles, update_speaker_roles_file
+
+def diarized_rows():
+    return pd.DataFrame({
+        'source': ["flight_1", "flight_1", "flight_1", "flight_2"],
+        'speaker_role': ["SPEAKER_00", "SPEAKER_01", "SPEAKER_01", "SPEAKER_00"],
+        'transcript': ["say again the heading", "say again your callsign", "descend and maintain five thousand",
+                       "say again"],
+        'stress_score': [40.0, 40.0, 75.0, 40.0],
+    })
+
+def test_roles_file_lists_new_speakers_and_keeps_filled_roles(tmp_path):
+    path = str(tmp_path / "speaker_roles.csv")
+    df = diarized_rows()
+    assert update_speaker_roles_file(df, path) == 3
+
+    roles = pd.read_csv(path, dtype=str).fillna("")
+    roles.loc[(roles['source'] == "flight_1") & (roles['speaker'] == "SPEAKER_01"), 'role'] = "atc"
+    roles.to_csv(path, index=False)
+    extra = pd.DataFrame({'source': ["flight_2"], 'speaker_role': ["SPEAKER_01"]})
+    assert update_speaker_roles_file(pd.concat([df, extra]), path) == 3
+
+    assert load_speaker_roles(path) == {("flight_1", "SPEAKER_01"): "ATC"}
+
+def test_alert_rules_use_mapped_roles():
+    df = diarized_rows()
+    df['speaker_role'] = apply_speaker_roles(df, {("flight_1", "SPEAKER_01"): "ATC", ("flight_1", "SPEAKER_00"): "CAP"})
+    assert df['speaker_role'].tolist() == ["CAP", "ATC", "ATC", "SPEAKER_00"]
+    levels, reasons = analyze_alerts(df)
+
+    # Crew and unmapped speakers get the hesitation check; ATC's own "say again" doesn't
+    assert levels[0] == "Minor Anomaly" and levels[3] == "Minor Anomaly"
+    assert levels[1] == "Routine"
+    assert "ATC Stress" in reasons[2]
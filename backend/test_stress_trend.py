@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from stress_trend import SustainedStressDetector, detect_stress_trends, trend_key
+
+def test_nan_score_does_not_poison_the_window():
+    detector = SustainedStressDetector()
+    detector.update("r/SPEAKER_00", np.nan)
+    for _ in range(10):
+        mean, slope, peak, sustained = detector.update("r/SPEAKER_00", 70.0)
+
+    assert (mean, slope, peak, sustained) == (70.0, 0.0, 70.0, True)
+
+def test_batch_matches_streaming_with_nan_scores():
+    rng = np.random.default_rng(3)
+    scores = rng.uniform(30, 90, 40)
+    scores[[2, 7, 8, 25]] = np.nan
+    df = pd.DataFrame({
+        'source': "flight_1",
+        'speaker_role': np.where(np.arange(40) % 3 == 0, "SPEAKER_01", "SPEAKER_00"),
+        'start_sec': np.arange(40) * 10.0,
+        'stress_score': scores,
+    })
+    batch = detect_stress_trends(df.sample(frac=1, random_state=0)).sort_index()
+
+    detector = SustainedStressDetector()
+    streamed = [detector.update(trend_key(row.source, row.speaker_role), row.stress_score)
+                for row in df.itertuples()]
+    streamed = np.array(streamed, dtype=np.float64)
+
+    assert np.isfinite(batch[['stress_trend_mean', 'stress_trend_slope', 'stress_trend_max']].to_numpy()).all()
+    np.testing.assert_allclose(batch['stress_trend_mean'], streamed[:, 0])
+    np.testing.assert_allclose(batch['stress_trend_slope'], streamed[:, 1], atol=1e-9)
+    np.testing.assert_allclose(batch['stress_trend_max'], streamed[:, 2])
+    np.testing.assert_array_equal(batch['sustained_stress'], streamed[:, 3].astype(bool))
@@ -0,0 +1,113 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# --- Configuration ---
+SEARCH_CHUNK = 65536  # candidates evaluated per vectorized step (bounds memory)
+BOOTSTRAP_WORKERS = os.cpu_count() or 1
+F1_WEIGHT = 0.7  # objective = F1_WEIGHT * macro F1 + (1 - F1_WEIGHT) * accuracy - spacing penalty
+SPACING_PENALTY = 0.05  # weight of exp(-10 * smallest bin width), discourages very narrow bins
+
+# --- Count Tables ---
+def class_count_tables(scores, y_true, num_classes):
+    """
+    Sorts the scores once and returns (sorted scores, cumulative counts) where
+    counts[k, j] is the number of class-j samples among the k lowest scores.
+    """
+    order = np.argsort(scores, kind='stable')
+    one_hot = np.zeros((len(scores) + 1, num_classes), dtype=np.int64)
+    one_hot[np.arange(1, len(scores) + 1), np.asarray(y_true)[order]] = 1
+    return np.asarray(scores)[order], np.cumsum(one_hot, axis=0)
+
+def confusion_matrices(sorted_scores, counts, thresholds):
+    """
+    Confusion matrices (candidates, true class, predicted class) for increasing
+    thresholds of shape (candidates, num_classes - 1). A score equal to a
+    threshold falls in the lower class, like pd.cut(..., right=True).
+    """
+    thresholds = np.atleast_2d(thresholds)
+    n = len(sorted_scores)
+    positions = np.concatenate([
+        np.zeros((len(thresholds), 1), dtype=np.int64),
+        np.searchsorted(sorted_scores, thresholds, side='right'),
+        np.full((len(thresholds), 1), n, dtype=np.int64),
+    ], axis=1)
+    # Rows between consecutive cut positions are predicted as that bin's class
+    per_bin = np.diff(counts[positions], axis=1)  # (candidates, predicted, true)
+    return per_bin.transpose(0, 2, 1)
+
+def macro_f1_and_accuracy(confusion):
+    """
+    Macro F1 and accuracy per confusion matrix. Like sklearn, classes absent
+    from both the labels and the predictions are left out of the average.
+    """
+    tp = np.diagonal(confusion, axis1=1, axis2=2).astype(np.float64)
+    support = confusion.sum(axis=2)
+    predicted = confusion.sum(axis=1)
+    denominator = support + predicted
+    present = denominator > 0
+    f1 = np.where(present, 2 * tp / np.where(present, denominator, 1), 0.0)
+    macro_f1 = f1.sum(axis=1) / np.maximum(present.sum(axis=1), 1)
+    accuracy = tp.sum(axis=1) / np.maximum(confusion.sum(axis=(1, 2)), 1)
+    return macro_f1, accuracy
+
+def objective(macro_f1, accuracy, thresholds, low=0.0, high=1.0):
+    """The optimizer's score: weighted F1/accuracy minus a penalty for narrow bins."""
+    thresholds = np.atleast_2d(thresholds)
+    edges = np.concatenate([np.full((len(thresholds), 1), low), thresholds,
+                            np.full((len(thresholds), 1), high)], axis=1)
+    spacing_penalty = np.exp(-10 * np.diff(edges, axis=1).min(axis=1))
+    return F1_WEIGHT * macro_f1 + (1 - F1_WEIGHT) * accuracy - SPACING_PENALTY * spacing_penalty
+
+# --- Search ---
+def threshold_grid(ranges, steps):
+    """
+    All strictly increasing threshold tuples with threshold i taken from
+    np.linspace(*ranges[i], steps) (or steps[i]). Returns (candidates, len(ranges)).
+    """
+    steps = np.broadcast_to(steps, len(ranges))
+    axes = [np.linspace(low, high, n) for (low, high), n in zip(ranges, steps)]
+    grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(ranges))
+    return grid[np.all(np.diff(grid, axis=1) > 0, axis=1)]
+
+def evaluate_candidates(scores, y_true, candidates, num_classes):
+    """(objective, macro F1, accuracy) arrays for every candidate threshold tuple."""
+    sorted_scores, counts = class_count_tables(scores, y_true, num_classes)
+    results = np.empty((3, len(candidates)))
+    for start in range(0, len(candidates), SEARCH_CHUNK):
+        chunk = candidates[start:start + SEARCH_CHUNK]
+        macro_f1, accuracy = macro_f1_and_accuracy(confusion_matrices(sorted_scores, counts, chunk))
+        results[:, start:start + len(chunk)] = objective(macro_f1, accuracy, chunk), macro_f1, accuracy
+    return results
+
+def search_thresholds(scores, y_true, candidates, num_classes):
+    """Best candidate: (thresholds, objective, macro F1, accuracy). Ties go to the first candidate."""
+    results = evaluate_candidates(scores, y_true, candidates, num_classes)
+    best = int(np.argmax(results[0]))
+    return candidates[best], *results[:, best]
+
+# --- Bootstrap ---
+def _bootstrap_task(seed, scores, y_true, candidates, num_classes):
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, len(scores), len(scores))
+    return search_thresholds(scores[sample], y_true[sample], candidates, num_classes)[0]
+
+def bootstrap_thresholds(scores, y_true, candidates, num_classes, rounds=200, seed=42,
+                         confidence=0.95, workers=BOOTSTRAP_WORKERS):
+    """
+    Re-runs the search on `rounds` resamples (with replacement) of the labelled
+    rows across a process pool. Returns (lower, upper) percentile bounds per
+    threshold and the (rounds, thresholds) array of chosen thresholds. Each
+    round has its own seed, so results don't depend on the worker count.
+    """
+    scores, y_true = np.asarray(scores, dtype=np.float64), np.asarray(y_true, dtype=np.int64)
+    seeds = np.random.SeedSequence(seed).spawn(rounds)
+    task = partial(_bootstrap_task, scores=scores, y_true=y_true, candidates=candidates, num_classes=num_classes)
+    if workers > 1 and rounds > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chosen = np.array(list(executor.map(task, seeds, chunksize=max(1, rounds // (4 * workers)))))
+    else:
+        chosen = np.array([task(s) for s in seeds])
+    tail = (1 - confidence) / 2 * 100
+    return np.percentile(chosen, tail, axis=0), np.percentile(chosen, 100 - tail, axis=0), chosen
@@ -1,4 +1,6 @@
+import os
 import torch
+import numpy as np
 from datasets import load_from_disk
 from transformers import (
     WhisperProcessor,
@@ -6,26 +8,47 @@ from transformers import (
     Seq2SeqTrainer,
     Seq2SeqTrainingArguments
 )
-from torch.nn.utils.rnn import pad_sequence
+from preprocess_dataset import SHARD_DIR_NAME, LEGACY_DATASET_NAME, load_cached_dataset
+from mel_store import pad_frames
 
 MODEL_NAME = "openai/whisper-small"
-DATASET_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_cached\final_dataset"
+# preprocess_dataset.py's SAVE_DIR; a legacy final_dataset directory also loads
+DATASET_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_cached"
 OUTPUT_DIR = r"C:\Users\tssmi\OneDrive\Desktop\nlp\whisper_finetuned_subset"
+TRAIN_SUBSET_SIZE = 100  # leading rows trained on; the rest are held out
 
 def data_collator(batch):
-    def to_tensor(item):
-        if isinstance(item, torch.Tensor):
-            return item
-        return torch.tensor(item)
-    input_features = torch.stack([to_tensor(item["input_features"]) for item in batch])
-    labels = pad_sequence([to_tensor(item["labels"]) for item in batch], batch_first=True, padding_value=-100)
-    return {"input_features": input_features, "labels": labels}
+    """
+    Builds the batch arrays in numpy and wraps them with torch.from_numpy (no
+    per-item tensors). Mel store items are trimmed float16 memmap slices whose
+    padding is restored here; Arrow items already hold the full features.
+    """
+    if "pad_value" in batch[0]:
+        input_features = pad_frames([item["input_features"] for item in batch],
+                                    [item["pad_value"] for item in batch], batch[0]["n_frames"])
+    else:
+        input_features = np.stack([np.asarray(item["input_features"], dtype=np.float32) for item in batch])
+    label_ids = [np.asarray(item["labels"], dtype=np.int64) for item in batch]
+    labels = np.full((len(batch), max(len(ids) for ids in label_ids)), -100, dtype=np.int64)
+    for b, ids in enumerate(label_ids):
+        labels[b, :len(ids)] = ids
+    return {"input_features": torch.from_numpy(input_features), "labels": torch.from_numpy(labels)}
 
 if __name__ == "__main__":
     print("✅ Loading preprocessed dataset...")
-    dataset = load_from_disk(DATASET_DIR)
-    # Select only first 100 samples for fast training
-    subset = dataset.select(range(100))
+    if os.path.isdir(os.path.join(DATASET_DIR, SHARD_DIR_NAME)):
+        try:
+            dataset = load_cached_dataset(DATASET_DIR)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            exit()
+    elif os.path.isdir(os.path.join(DATASET_DIR, LEGACY_DATASET_NAME)):
+        dataset = load_from_disk(os.path.join(DATASET_DIR, LEGACY_DATASET_NAME))
+    else:
+        # DATASET_DIR pointing at a saved dataset itself, as it did before the sharded cache
+        dataset = load_from_disk(DATASET_DIR)
+    # Select only the first TRAIN_SUBSET_SIZE samples for fast training
+    subset = dataset.select(range(TRAIN_SUBSET_SIZE))
     print(f"Using {len(subset)} samples for this training.")
 
     processor = WhisperProcessor.from_pretrained(MODEL_NAME)
@@ -55,9 +78,9 @@ if __name__ == "__main__":
         data_collator=data_collator,
     )
 
-    print("🚀 Starting training on 100 samples...")
+    print(f"🚀 Starting training on {len(subset)} samples...")
     trainer.train()
-    print("🎉 Training on 100 samples completed!")
+    print(f"🎉 Training on {len(subset)} samples completed!")
 
     trainer.save_model(OUTPUT_DIR)
     processor.save_pretrained(OUTPUT_DIR)
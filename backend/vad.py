@@ -0,0 +1,78 @@
+import numpy as np
+
+# --- Configuration ---
+FRAME_MS = 30  # non-overlapping analysis frames
+NOISE_FLOOR_PERCENTILE = 10  # quietest frames estimate the noise floor
+ENERGY_MARGIN_DB = 10  # speech frames sit this far above the noise floor
+ABSOLUTE_FLOOR_DBFS = -60  # never treat frames below this as speech
+ZCR_THRESHOLD = 0.25  # weaker frames still count when this noisy (fricatives)
+MIN_SPEECH_MS = 200  # drop shorter bursts (clicks, keying noise)
+MIN_SILENCE_MS = 500  # merge speech separated by shorter pauses
+PAD_MS = 150  # keep this much context around each speech span
+
+# --- Frame Features ---
+def frame_rms_zcr(y, frame_length):
+    """
+    Per-frame RMS (dBFS) and zero-crossing rate from a single reshape of the
+    signal. int16 input is treated as PCM, float input as [-1, 1] audio.
+    """
+    num_frames = len(y) // frame_length
+    frames = y[:num_frames * frame_length].reshape(num_frames, frame_length).astype(np.float32)
+    if np.issubdtype(y.dtype, np.integer):
+        frames /= 32768
+
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    rms_db = 20 * np.log10(np.maximum(rms, 1e-10))
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return rms_db, zcr
+
+def _runs(mask):
+    """(start, end) frame indices of each run of True values."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+# --- Speech Detection ---
+def detect_speech_spans(y, sr):
+    """
+    Returns [(start_sample, end_sample), ...] of speech regions in mono audio y,
+    using frame energy relative to the estimated noise floor plus ZCR.
+    Spans are padded, short pauses merged, and short bursts dropped.
+    """
+    frame_length = int(sr * FRAME_MS / 1000)
+    if len(y) < frame_length:
+        return []
+
+    rms_db, zcr = frame_rms_zcr(y, frame_length)
+    noise_floor = np.percentile(rms_db, NOISE_FLOOR_PERCENTILE)
+    loud = rms_db > noise_floor + ENERGY_MARGIN_DB
+    noisy = (rms_db > noise_floor + ENERGY_MARGIN_DB / 2) & (zcr > ZCR_THRESHOLD)
+    speech = (loud | noisy) & (rms_db > ABSOLUTE_FLOOR_DBFS)
+
+    # Merge runs separated by short pauses, then drop short bursts
+    min_silence = MIN_SILENCE_MS // FRAME_MS
+    min_speech = MIN_SPEECH_MS // FRAME_MS
+    merged = []
+    for start, end in _runs(speech):
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    merged = [(s, e) for s, e in merged if e - s >= min_speech]
+
+    # Frames -> samples, with padding; padded spans that touch are joined
+    pad = int(sr * PAD_MS / 1000)
+    spans = []
+    for start, end in merged:
+        start_sample = max(0, start * frame_length - pad)
+        end_sample = min(len(y), end * frame_length + pad)
+        if spans and start_sample <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], end_sample)
+        else:
+            spans.append((start_sample, end_sample))
+    return spans
+
+def vad_params():
+    """Current settings, for cache keys."""
+    return (FRAME_MS, NOISE_FLOOR_PERCENTILE, ENERGY_MARGIN_DB, ABSOLUTE_FLOOR_DBFS,
+            ZCR_THRESHOLD, MIN_SPEECH_MS, MIN_SILENCE_MS, PAD_MS)